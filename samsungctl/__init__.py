@@ -21,8 +21,22 @@ from .remote import Remote # NOQA
 from .config import Config # NOQA
 
 
-def discover(timeout=5):
-    from .upnp.discover import discover as _discover
-
-    for config in _discover(timeout=timeout):
+def discover(timeout=5, network=None):
+    """
+    Finds the TVs on the local network.
+
+    :param timeout: search timeout in seconds
+    :param network: network in CIDR notation (``"192.168.1.0/24"``) that
+        gets port scanned instead of using SSDP, for networks that do not
+        pass multicast traffic.
+    :return: generator of `Remote` instances
+    """
+    if network is None:
+        from .upnp.discover import iter_discover
+        configs = iter_discover(timeout=timeout)
+    else:
+        from .scan import scan
+        configs = scan(network, timeout=timeout)
+
+    for config in configs:
         yield Remote(config)
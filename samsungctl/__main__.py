@@ -122,7 +122,86 @@ def get_key(key):
         logging.warning("Warning: Key {0} not found.".format(key))
 
 
+def _daemon_commands(args):
+    # the batch commands for the command line arguments
+    commands = list(key.key for key in args.key if key is not None)
+
+    if args.optimize_keys and commands:
+        commands = ['keys ' + ' '.join(commands)]
+
+    for name in ('volume', 'brightness', 'contrast', 'sharpness'):
+        value = getattr(args, name)
+        if value is None:
+            continue
+        if value == -1:
+            commands += [name]
+        else:
+            commands += ['{0} {1}'.format(name, value)]
+
+    for name in ('mute', 'artmode'):
+        value = getattr(args, name)
+        if value is not None:
+            commands += ['{0} {1}'.format(name, value)]
+
+    if args.source is not None:
+        commands += ['source "{0}"'.format(args.source)]
+
+    if args.start_app:
+        command = 'app "{0}"'.format(args.start_app)
+        if args.app_metadata:
+            command += ' "{0}"'.format(args.app_metadata)
+        commands += [command]
+
+    if args.batch == '-':
+        commands += list(sys.stdin)
+    elif args.batch:
+        with open(args.batch, 'r') as batch_file:
+            commands += list(batch_file)
+
+    return list(
+        command.strip() for command in commands
+        if command.strip() and not command.strip().startswith('#')
+    )
+
+
+def _run_daemon_client(args):
+    from .daemon import Client
+
+    client = Client(args.daemon or None)
+
+    try:
+        results = client.run(_daemon_commands(args), args.host)
+    except (socket.error, exceptions.SamsungTVError) as err:
+        logging.error("Error: %s", err)
+        return 1
+
+    failed = 0
+    for result in results:
+        if 'error' in result:
+            failed += 1
+            value = '\terror: ' + result['error']
+        elif result['result'] is None:
+            value = ''
+        else:
+            value = '\t' + str(result['result'])
+
+        print(
+            '{0:.1f} ms\t{1}{2}'.format(
+                result['time'],
+                result['command'],
+                value
+            )
+        )
+
+    if failed:
+        return 1
+
+
 def main():
+    if sys.argv[1:2] == ['serve']:
+        from .daemon import serve_main
+        return serve_main(sys.argv[2:])
+
     epilog = "E.g. %(prog)s --host 192.168.0.10 --name myremote KEY_VOLDOWN"
     parser = argparse.ArgumentParser(
         prog=title,
@@ -295,6 +374,38 @@ def main():
             "error."
         )
     )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        default=None,
+        help=(
+            "run the newline delimited commands in FILE (- for stdin) over "
+            "a single connection and print the time every command took. "
+            "See samsungctl.batch for the commands."
+        )
+    )
+    parser.add_argument(
+        "--optimize-keys",
+        action="store_true",
+        help=(
+            "send runs of KEY_VOLUP/KEY_VOLDOWN as one volume change and "
+            "digits followed by KEY_ENTER as one channel change when the TV "
+            "has the UPnP service for it, the keys are sent otherwise."
+        )
+    )
+    parser.add_argument(
+        "--daemon",
+        metavar="ADDRESS",
+        nargs="?",
+        const="",
+        default=None,
+        help=(
+            "send the commands to a running 'samsungctl serve' instead of "
+            "connecting to the TV. ADDRESS is the path of its Unix socket "
+            "or its URL (http://127.0.0.1:8765), the default Unix socket "
+            "is used if it is left off. --host selects the TV."
+        )
+    )
     parser.add_argument(
         "--key-help",
         action="store_true",
@@ -322,6 +433,9 @@ def main():
     if args.key_help:
         keys_help(args.key)
 
+    if args.daemon is not None:
+        return _run_daemon_client(args)
+
     try:
 
         if args.config_file is None:
@@ -348,9 +462,30 @@ def main():
 
     config.log_level = log_level
 
-    if config.upnp_locations is None:
+    # the UPnP discovery is only run when one of the UPnP features is used,
+    # sending keys does not need it
+    uses_upnp = (
+        args.interactive or
+        args.batch or
+        args.optimize_keys or
+        any(
+            value is not None for value in (
+                args.volume,
+                args.mute,
+                args.brightness,
+                args.contrast,
+                args.sharpness,
+                args.source,
+                args.source_label
+            )
+        )
+    )
+
+    if config.upnp_locations is None and uses_upnp:
         config.upnp_locations = []
 
+    failed = 0
+
     try:
         with Remote(config) as remote:
             if args.interactive:
@@ -359,12 +494,33 @@ def main():
                 inter = interactive.Interactive(remote)
                 inter.run()
 
+            elif args.batch:
+                from . import batch
+
+                if args.batch == '-':
+                    failed = batch.Batch(remote).run(sys.stdin)
+                else:
+                    with open(args.batch, 'r') as batch_file:
+                        failed = batch.Batch(remote).run(batch_file)
+
+                if failed:
+                    logging.error(
+                        "Error: {0} batch command(s) failed".format(failed)
+                    )
+
             elif config.method == 'websocket' and args.start_app:
                 app = remote.get_application(args.start_app)
                 if args.app_metadata:
                     app.run(args.app_metadata)
                 else:
                     app.run()
+            elif args.optimize_keys:
+                from . import keyseq
+
+                keyseq.send_keys(
+                    remote,
+                    list(key.key for key in args.key if key is not None)
+                )
             else:
                 for key in args.key:
                     if key is None:
@@ -437,7 +593,8 @@ def main():
     except exceptions.AccessDenied:
         logging.error("Error: Access denied!")
     except exceptions.ConfigUnknownMethod:
-        logging.error("Error: Unknown method '{}'".format(config.method))
+        # the property would run the detection again
+        logging.error("Error: Unknown method '{}'".format(config._method))
     except socket.timeout:
         logging.error("Error: Timed out!")
     except OSError as e:
@@ -446,6 +603,9 @@ def main():
     if args.config_file:
         config.save()
 
+    if failed:
+        return 1
+
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
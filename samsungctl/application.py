@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import threading
+import weakref
 import base64
 import requests
 import json
@@ -9,7 +10,22 @@ from .utils import LogIt, LogItWithReturn
 
 PY3 = sys.version_info[0] > 2
 
-_instances = {}
+# parent (remote or application) -> {(cls, key): instance}
+# neither the parents nor the instances are kept alive by this registry.
+_instances = weakref.WeakKeyDictionary()
+
+
+def release(parent):
+    """
+    Removes all of the instances that belong to parent and the ones that
+    belong to those.
+    """
+    instances = _instances.pop(parent, None)
+    if instances is None:
+        return
+
+    for instance in list(instances.values()):
+        release(instance)
 
 
 # noinspection PyPep8Naming
@@ -24,60 +40,47 @@ class Singleton(type):
         id=None,
         **kwargs
     ):
-        if cls not in _instances:
-            _instances[cls] = {}
+        if parent not in _instances:
+            _instances[parent] = weakref.WeakValueDictionary()
 
-        instances = _instances[cls]
-        if parent not in instances:
-            instances[parent] = {}
-
-        instances = instances[parent]
+        instances = _instances[parent]
 
         if cls == Application:
-            if (name, appId) not in instances:
-                instance = (
-                    super(Singleton, cls).__call__(
-                        parent,
-                        name,
-                        appId,
-                        id,
-                        **kwargs
-                    )
-                )
-                instances[(name, appId)] = instance
-            else:
-                instance = instances[(name, appId)]
-                instance.update(**kwargs)
-
+            key = (cls, name, appId)
         elif cls == AppData:
-            if (title, id) not in instances:
-                instance = (
-                    super(Singleton, cls).__call__(
-                        parent,
-                        title,
-                        id,
-                        appId,
-                        **kwargs
-                    )
+            key = (cls, title, id)
+        else:
+            key = (cls, title)
+
+        instance = instances.get(key, None)
+
+        if instance is None:
+            if cls == Application:
+                instance = super(Singleton, cls).__call__(
+                    parent,
+                    name,
+                    appId,
+                    id,
+                    **kwargs
+                )
+            elif cls == AppData:
+                instance = super(Singleton, cls).__call__(
+                    parent,
+                    title,
+                    id,
+                    appId,
+                    **kwargs
                 )
-                instances[(title, id)] = instance
             else:
-                instance = instances[(title, id)]
-                instance.update(**kwargs)
+                instance = super(Singleton, cls).__call__(
+                    parent,
+                    title,
+                    **kwargs
+                )
 
+            instances[key] = instance
         else:
-            if (parent, title) not in instances:
-                instance = (
-                    super(Singleton, cls).__call__(
-                        parent,
-                        title,
-                        **kwargs
-                    )
-                )
-                instances[(parent, title)] = instance
-            else:
-                instance = instances[(parent, title)]
-                instance.update(**kwargs)
+            instance.update(**kwargs)
 
         return instance
 
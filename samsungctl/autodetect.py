@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+"""
+Connection method detection for TVs that have not been seen before.
+"""
+
+import json
+import logging
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .liveness import probe
+
+logger = logging.getLogger('samsungctl')
+
+# ports the remote control services listen on
+PORTS = (55000, 8001, 8002, 8080)
+
+# time a single connect attempt gets
+CONNECT_TIMEOUT = 0.5
+
+# timeout for the /api/v2/ request
+API_TIMEOUT = 3.0
+
+# how long a verdict is trusted for
+VERDICT_TTL = 24 * 60 * 60
+
+_verdicts = {}
+_lock = threading.Lock()
+
+
+class Verdict(object):
+    """
+    Result of a detection.
+
+    :ivar method: ``"legacy"``, ``"websocket"`` or ``"encrypted"``
+    :ivar port: port of the remote control service
+    :ivar device_info: ``device`` part of the /api/v2/ response or `None`
+    """
+
+    def __init__(self, method, port, device_info=None):
+        self.method = method
+        self.port = port
+        self.device_info = device_info
+        self.time = time.time()
+
+    def is_expired(self, now):
+        return now - self.time > VERDICT_TTL
+
+    def __repr__(self):
+        return '<Verdict {0}:{1}>'.format(self.method, self.port)
+
+
+def _get_keys(host, mac):
+    keys = [host]
+    if mac:
+        keys += [mac.upper()]
+    return keys
+
+
+def get_verdict(host, mac=None):
+    """
+    Returns the cached verdict for a TV.
+
+    The MAC address is checked first so a verdict is still found after
+    the TV got a new IP address.
+
+    :rtype: `None` or `Verdict`
+    """
+    now = time.time()
+
+    with _lock:
+        for key in reversed(_get_keys(host, mac)):
+            verdict = _verdicts.get(key, None)
+            if verdict is None:
+                continue
+
+            if verdict.is_expired(now):
+                del _verdicts[key]
+                continue
+
+            return verdict
+
+
+def store_verdict(verdict, host, mac=None):
+    with _lock:
+        for key in _get_keys(host, mac):
+            _verdicts[key] = verdict
+
+
+def forget(host, mac=None):
+    """Removes the cached verdict for a TV."""
+    with _lock:
+        for key in _get_keys(host, mac):
+            _verdicts.pop(key, None)
+
+
+def _from_device_info(device_info):
+    try:
+        model = device_info['modelName']
+    except (KeyError, TypeError):
+        return None
+
+    if model[5:6] in ('H', 'J'):
+        return Verdict('encrypted', 8080, device_info)
+
+    try:
+        is_support = json.loads(device_info['isSupport'])
+        token_support = is_support['TokenAuthSupport'] == 'true'
+    except (ValueError, KeyError, TypeError):
+        token_support = False
+
+    if token_support:
+        return Verdict('websocket', 8002, device_info)
+
+    return Verdict('websocket', 8001, device_info)
+
+
+def _from_ports(open_ports):
+    if 55000 in open_ports:
+        return Verdict('legacy', 55000)
+    if 8080 in open_ports and 8001 not in open_ports:
+        return Verdict('encrypted', 8080)
+    if 8001 in open_ports:
+        return Verdict('websocket', 8001)
+    if 8002 in open_ports:
+        return Verdict('websocket', 8002)
+
+
+def detect(host, mac=None, timeout=1.0, use_cache=True):
+    """
+    Detects the connection method of a TV.
+
+    TCP connects to all of the remote control ports and the /api/v2/
+    request are raced against each other. The first conclusive answer
+    wins: the /api/v2/ response (which tells the websocket and the
+    encrypted TVs apart) or an open legacy port. If neither of them
+    arrives the open ports decide.
+
+    :param host: ip address of the TV
+    :type host: `str`
+    :param mac: MAC address of the TV, used as an additional cache key
+    :type mac: `None` or `str`
+    :param timeout: time the connects get in seconds, the /api/v2/
+        request gets up to `API_TIMEOUT` if port 8001 is open
+    :type timeout: `float`
+    :param use_cache: return a cached verdict if there is one
+    :type use_cache: `bool`
+    :return: `None` if the TV could not be reached
+    :rtype: `None` or `Verdict`
+    """
+    if use_cache:
+        verdict = get_verdict(host, mac)
+        if verdict is not None:
+            return verdict
+
+    results = queue.Queue()
+
+    def connect(port):
+        results.put(('port', port, probe(host, port, CONNECT_TIMEOUT)))
+
+    def get_device_info():
+        import requests
+
+        try:
+            response = requests.get(
+                'http://{0}:8001/api/v2/'.format(host),
+                timeout=API_TIMEOUT
+            )
+            device_info = response.json()['device']
+        except (ValueError, KeyError, TypeError, requests.RequestException):
+            device_info = None
+
+        results.put(('api', None, device_info))
+
+    threads = list(
+        threading.Thread(target=connect, args=(port,)) for port in PORTS
+    )
+    threads += [threading.Thread(target=get_device_info)]
+
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    start = time.time()
+    deadline = start + timeout
+    connects = len(PORTS)
+    api_pending = True
+    open_ports = set()
+    verdict = None
+
+    while connects or api_pending:
+        if not connects and 8001 not in open_ports:
+            # the api can not answer
+            break
+
+        wait = deadline - time.time()
+        if wait <= 0:
+            break
+
+        try:
+            kind, port, value = results.get(timeout=wait)
+        except queue.Empty:
+            break
+
+        if kind == 'api':
+            api_pending = False
+            verdict = _from_device_info(value)
+            if verdict is not None:
+                break
+
+        else:
+            connects -= 1
+
+            if not value:
+                continue
+
+            open_ports.add(port)
+
+            if port == 55000:
+                verdict = _from_ports(open_ports)
+                break
+
+            if port == 8001:
+                # the api is going to answer
+                deadline = max(deadline, start + API_TIMEOUT)
+
+    if verdict is None:
+        verdict = _from_ports(open_ports)
+
+    logger.debug(
+        '{0}: detected {1} in {2:.3f} seconds'.format(
+            host,
+            verdict,
+            time.time() - start
+        )
+    )
+
+    if verdict is not None:
+        store_verdict(verdict, host, mac)
+
+    return verdict
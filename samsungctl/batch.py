@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+"""
+Runs newline delimited commands over a single connection.
+
+One command per line, blank lines and lines starting with ``#`` are
+skipped::
+
+    KEY_MENU                a key, KEY_ can be left off unless the
+                            name is one of the commands below
+    KEY_VOLUP 5             a key sent 5 times
+    keys KEY_1 KEY_0 ENTER  keys sent through `samsungctl.keyseq`, runs
+                            of volume keys and channel numbers become
+                            single UPnP calls when the TV has them
+    volume 20               volume, "volume" alone prints it
+    mute on|off|state
+    artmode on|off|state
+    source HDMI1|state
+    brightness|contrast|sharpness 50
+    app Netflix [metadata]  starts an application
+    wait 1.5                waits for the number of seconds
+    power on|off|state
+"""
+
+from __future__ import print_function
+import logging
+import shlex
+import sys
+import time
+
+from . import exceptions
+from .key_mappings import KEYS
+
+logger = logging.getLogger('samsungctl')
+
+
+class Batch(object):
+
+    def __init__(self, remote, output=None):
+        """
+        :param remote: connected remote the commands are run on
+        :type remote: `samsungctl.Remote` instance
+        :param output: file the per line timing is written to, defaults to
+            stdout
+        """
+        self.remote = remote
+        self.output = output
+
+    def _print(self, *args):
+        print(*args, file=self.output or sys.stdout)
+        (self.output or sys.stdout).flush()
+
+    def run(self, lines):
+        """
+        Runs the commands.
+
+        A failing command gets reported and the remaining commands still
+        run.
+
+        :param lines: the commands, a file object works as well
+        :type lines: iterable of `str`
+        :return: number of commands that failed
+        :rtype: `int`
+        """
+        failed = 0
+        start = time.time()
+
+        for line_number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            line_start = time.time()
+            try:
+                result = self.execute(line)
+            except Exception as err:
+                failed += 1
+                result = 'error: {0}'.format(
+                    str(err) or err.__class__.__name__
+                )
+
+            self._print(
+                '{0}\t{1:.1f} ms\t{2}{3}'.format(
+                    line_number,
+                    (time.time() - line_start) * 1000,
+                    line,
+                    '' if result is None else '\t' + str(result)
+                )
+            )
+
+        logger.info(
+            'batch finished in {0:.3f} seconds'.format(time.time() - start)
+        )
+
+        return failed
+
+    def execute(self, line):
+        """
+        Runs a single command.
+
+        :return: the value for the commands that read something
+        :raises: `exceptions.BatchCommandError` if the command is not valid
+        """
+        args = shlex.split(line)
+        command = args.pop(0)
+
+        # the commands win over the keys without the KEY_ prefix
+        handler = getattr(
+            self,
+            '_command_' + command.lower().replace('-', '_'),
+            None
+        )
+        if handler is not None:
+            return handler(line, args)
+
+        key = command.upper()
+        if not key.startswith('KEY_'):
+            key = 'KEY_' + key
+
+        if key not in KEYS:
+            raise exceptions.BatchCommandError(line)
+
+        for _ in range(self._get_int(line, args, 1)):
+            KEYS[key](self.remote)
+
+    @staticmethod
+    def _get_int(line, args, default=None):
+        if not args:
+            if default is None:
+                raise exceptions.BatchCommandError(line)
+            return default
+
+        try:
+            return int(args[0])
+        except ValueError:
+            raise exceptions.BatchCommandError(line)
+
+    @staticmethod
+    def _get_switch(line, args):
+        if len(args) != 1 or args[0] not in ('on', 'off', 'state'):
+            raise exceptions.BatchCommandError(line)
+
+        return args[0]
+
+    def _level(self, name, line, args):
+        if not args:
+            return getattr(self.remote, name)
+
+        setattr(self.remote, name, self._get_int(line, args))
+
+    def _command_volume(self, line, args):
+        return self._level('volume', line, args)
+
+    def _command_brightness(self, line, args):
+        return self._level('brightness', line, args)
+
+    def _command_contrast(self, line, args):
+        return self._level('contrast', line, args)
+
+    def _command_sharpness(self, line, args):
+        return self._level('sharpness', line, args)
+
+    def _switch(self, name, line, args):
+        value = self._get_switch(line, args)
+
+        if value == 'state':
+            return 'ON' if getattr(self.remote, name) else 'OFF'
+
+        setattr(self.remote, name, value == 'on')
+
+    def _command_mute(self, line, args):
+        return self._switch('mute', line, args)
+
+    def _command_artmode(self, line, args):
+        return self._switch('artmode', line, args)
+
+    def _command_power(self, line, args):
+        return self._switch('power', line, args)
+
+    def _command_source(self, line, args):
+        if len(args) != 1:
+            raise exceptions.BatchCommandError(line)
+
+        if args[0] == 'state':
+            source = self.remote.source
+            return '{0} ({1})'.format(source.label, source.name)
+
+        self.remote.source = args[0]
+
+    def _command_app(self, line, args):
+        if not args or len(args) > 2:
+            raise exceptions.BatchCommandError(line)
+
+        app = self.remote.get_application(args[0])
+        if app is None:
+            raise exceptions.BatchCommandError(line)
+
+        app.run(*args[1:])
+
+    def _command_keys(self, line, args):
+        if not args:
+            raise exceptions.BatchCommandError(line)
+
+        keys = []
+        for key in args:
+            key = key.upper()
+            if not key.startswith('KEY_'):
+                key = 'KEY_' + key
+
+            if key not in KEYS:
+                raise exceptions.BatchCommandError(line)
+
+            keys += [key]
+
+        from . import keyseq
+
+        replaced = keyseq.send_keys(self.remote, keys)
+        if replaced:
+            return '{0} keys replaced'.format(replaced)
+
+    def _command_wait(self, line, args):
+        if len(args) != 1:
+            raise exceptions.BatchCommandError(line)
+
+        try:
+            delay = float(args[0])
+        except ValueError:
+            raise exceptions.BatchCommandError(line)
+
+        time.sleep(delay)
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+"""
+Sends the same key or app launch to many TVs at the same moment.
+
+Calling ``remote.control()`` for one TV after the other makes the last TV
+lag behind by the time all of the others took. A broadcast builds the
+frame for every TV up front, estimates the one way latency to every TV
+and then writes all of the frames from their own threads, each one
+early by the latency of its TV, so the frames arrive together.
+"""
+
+import logging
+import threading
+import time
+
+from . import liveness
+
+logger = logging.getLogger('samsungctl')
+
+# number of connects used to estimate the latency to a TV
+LATENCY_SAMPLES = 3
+
+# seconds between staging the frames and writing them, the threads need
+# this to get ready
+LEAD_TIME = 0.05
+
+# the threads sleep until this many seconds before their write time and
+# spin for the rest
+SPIN_TIME = 0.002
+
+
+def estimate_latency(host, port, samples=LATENCY_SAMPLES, timeout=0.5):
+    """
+    Estimates the one way latency to a TV.
+
+    Half of the fastest TCP connect (one round trip) out of `samples`.
+
+    :return: latency in seconds, `None` if the TV did not accept a
+        connection
+    :rtype: `None` or `float`
+    """
+    best = None
+
+    for _ in range(samples):
+        start = time.time()
+        if not liveness.probe(host, port, timeout):
+            continue
+
+        round_trip = time.time() - start
+        if best is None or round_trip < best:
+            best = round_trip
+
+    if best is None:
+        return None
+
+    return best / 2.0
+
+
+class BroadcastReport(object):
+    """
+    Result of a broadcast.
+
+    :ivar results: ``{host: dict}`` with the estimated ``latency``, the
+        time the frame was ``sent``, its estimated ``arrival``, if it was
+        ``staged`` or sent with ``control()`` and the ``error`` if one was
+        raised. The times are relative to the release time.
+    """
+
+    def __init__(self, results):
+        self.results = results
+
+    def _spread(self, name):
+        values = list(
+            result[name] for result in self.results.values()
+            if result['error'] is None
+        )
+        if not values:
+            return None
+
+        return max(values) - min(values)
+
+    @property
+    def skew(self):
+        """
+        Seconds between the first and the last estimated arrival.
+
+        :rtype: `None` or `float`
+        """
+        return self._spread('arrival')
+
+    @property
+    def send_skew(self):
+        """
+        Seconds between the first and the last write.
+
+        :rtype: `None` or `float`
+        """
+        return self._spread('sent')
+
+    @property
+    def failed(self):
+        """
+        :return: hosts the broadcast failed on
+        :rtype: `list` of `str`
+        """
+        return sorted(
+            host for host, result in self.results.items()
+            if result['error'] is not None
+        )
+
+    def __repr__(self):
+        skew = self.skew
+        return '<BroadcastReport {0} TVs, skew {1}, {2} failed>'.format(
+            len(self.results),
+            'n/a' if skew is None else '{0:.2f} ms'.format(skew * 1000),
+            len(self.failed)
+        )
+
+
+def _broadcast(remotes, stage, fallback, samples, lead):
+    remotes = list(remotes)
+    latencies = {}
+
+    def measure(remote):
+        latencies[remote] = estimate_latency(
+            remote.config.host,
+            remote.config.port,
+            samples
+        )
+
+    threads = list(
+        threading.Thread(target=measure, args=(remote,)) for remote in remotes
+    )
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = {}
+    jobs = []
+
+    for remote in remotes:
+        latency = latencies.get(remote, None) or 0.0
+        result = dict(
+            latency=latency,
+            sent=None,
+            arrival=None,
+            staged=False,
+            error=None
+        )
+        results[remote.config.host] = result
+
+        try:
+            staged = stage(remote)
+        except Exception as err:
+            result['error'] = err
+            continue
+
+        if staged is None:
+            # the backend can not stage the frame
+            staged = (lambda remote=remote: fallback(remote)), None
+        else:
+            result['staged'] = True
+
+        jobs += [(result, staged[0], staged[1])]
+
+    ready = threading.Event()
+    release = [0.0]
+
+    def send(result, write, after):
+        ready.wait()
+        target = release[0] - result['latency']
+
+        wait = target - time.time() - SPIN_TIME
+        if wait > 0:
+            time.sleep(wait)
+
+        while time.time() < target:
+            pass
+
+        try:
+            write()
+            result['sent'] = time.time() - release[0]
+            result['arrival'] = result['sent'] + result['latency']
+        except Exception as err:
+            result['error'] = err
+            return
+
+        if after is not None:
+            try:
+                after()
+            except Exception as err:
+                logger.debug('broadcast: {0!r}'.format(err))
+
+    threads = list(
+        threading.Thread(target=send, args=job) for job in jobs
+    )
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    max_latency = max(
+        list(result['latency'] for result in results.values()) + [0.0]
+    )
+    release[0] = time.time() + lead + max_latency
+    ready.set()
+
+    for thread in threads:
+        thread.join()
+
+    report = BroadcastReport(results)
+    logger.debug(repr(report))
+    return report
+
+
+def broadcast_key(remotes, key, samples=LATENCY_SAMPLES, lead=LEAD_TIME):
+    """
+    Sends a key to many TVs at the same moment.
+
+    TVs whose backend can not build the frame up front (encrypted) get the
+    key through ``control()`` at the release time.
+
+    :param remotes: connected remotes
+    :type remotes: iterable of `samsungctl.Remote` instances
+    :param key: the key (``"KEY_MENU"``)
+    :type key: `str`
+    :param samples: number of connects used to estimate the latency
+    :param lead: seconds the threads get to get ready
+    :rtype: `BroadcastReport`
+    """
+    def stage(remote):
+        stage_key = getattr(remote, '_stage_key', None)
+        if stage_key is None:
+            return None
+        return stage_key(key)
+
+    return _broadcast(
+        remotes,
+        stage,
+        lambda remote: remote.control(key),
+        samples,
+        lead
+    )
+
+
+def broadcast_app(
+    remotes,
+    app_id,
+    action_type='DEEP_LINK',
+    meta_tag=None,
+    samples=LATENCY_SAMPLES,
+    lead=LEAD_TIME
+):
+    """
+    Starts an application on many websocket TVs at the same moment.
+
+    :param app_id: id of the application
+    :type app_id: `str`
+    :param action_type: ``"DEEP_LINK"`` or ``"NATIVE_LAUNCH"``
+    :param meta_tag: data passed to the application
+    :rtype: `BroadcastReport`
+    """
+    data = dict(appId=app_id, action_type=action_type)
+    if meta_tag is not None:
+        data['metaTag'] = meta_tag
+
+    def stage(remote):
+        stage_message = getattr(remote, '_stage_message', None)
+        if stage_message is None:
+            raise NotImplementedError('applications need a websocket TV')
+
+        return stage_message(
+            'ms.channel.emit',
+            event='ed.apps.launch',
+            to='host',
+            data=data
+        )
+
+    def fallback(remote):
+        # only reached by a websocket TV that is not connected
+        raise RuntimeError('Is the TV on?!?')
+
+    return _broadcast(remotes, stage, fallback, samples, lead)
@@ -4,8 +4,10 @@ import os
 import socket
 import json
 import logging
-import requests
+import threading
+import time
 from . import wake_on_lan
+from . import autodetect
 from . import exceptions
 
 
@@ -24,7 +26,8 @@ DEFAULT_CONFIG = dict(
     device_id=None,
     upnp_locations=None,
     paired=None,
-    mac=None
+    mac=None,
+    udn=None
 )
 
 
@@ -36,6 +39,10 @@ class Config(object):
     LOG_INFO = logging.INFO
     LOG_DEBUG = logging.DEBUG
 
+    # seconds a failed detection is remembered for, the properties raise
+    # right away until then. `resolve` always runs the detection again.
+    detect_retry_interval = 30.0
+
     def __init__(
         self,
         name='samsungctl',
@@ -50,97 +57,145 @@ class Config(object):
         upnp_locations=None,
         paired=False,
         mac=None,
+        udn=None,
         **_
     ):
+        """
+        No network I/O is done here. If the connection method and port are
+        not given they get detected the first time `method`, `port`,
+        `app_id`, `id` or `device_id` is read, the MAC address gets looked
+        up the first time `mac` is read. `resolve` and `resolve_all` run
+        the detection up front.
+        """
 
         if host is None:
             raise exceptions.ConfigHostError
 
-        if method is None and port is None:
-            try:
-                response = requests.get(
-                    'http://{0}:8001/api/v2/'.format(host),
-                    timeout=3
-                )
-                response = response.json()['device']
-                model = response['modelName']
-                if model[5] in ('H', 'J'):
-                    method = 'encrypted'
-                    port = 8080
-                    app_id = '654321'
-                    id = "654321"
-                    device_id = "7e509404-9d7c-46b4-8f6a-e2a9668ad184"
+        if paired is None:
+            if token is not None:
+                paired = True
+            else:
+                paired = False
 
+        self.name = name
+        self.description = description
+        self.host = host
+        self.timeout = timeout
+        self.token = token
+        self.path = None
+        self.upnp_locations = upnp_locations
+        self.paired = paired
+        self.udn = udn
+
+        self._lock = threading.RLock()
+        self._method = method
+        self._port = port
+        self._id = id
+        self._device_id = device_id
+        self._app_id = ''
+        self._mac = mac
+
+        self._connection_resolved = False
+        self._detect_failed = None
+        self._mac_resolved = mac is not None
+
+        if method is not None or port is not None:
+            # nothing has to be detected, this also validates the values
+            self._resolve_connection()
+
+    def _detect_port(self):
+        verdict = autodetect.detect(self.host, self._mac)
+        if verdict is not None:
+            return verdict.port
+
+        # the TV is not reachable, a known MAC address means it has been
+        # seen on the network and older TVs can not be powered on remotely
+        tmp_mac = wake_on_lan.get_mac_address(self.host)
+        if tmp_mac is not None:
+            return 55000
+
+    def _resolve_connection(self):
+        with self._lock:
+            if self._connection_resolved:
+                return
+
+            method = self._method
+            port = self._port
+
+            if method is None and port is None:
+                if (
+                    self._detect_failed is not None and
+                    time.time() - self._detect_failed <
+                    self.detect_retry_interval
+                ):
+                    raise exceptions.ConfigUnknownMethod()
+
+                port = self._port = self._detect_port()
+                if port is None:
+                    self._detect_failed = time.time()
+                    raise exceptions.ConfigUnknownMethod()
+
+            if method is None:
+                if port == 55000:
+                    self._method = 'legacy'
+                elif port in (8001, 8002):
+                    self._method = 'websocket'
+                elif port == 8080:
+                    self._app_id = '654321'
+                    self._id = "654321"
+                    self._device_id = "7e509404-9d7c-46b4-8f6a-e2a9668ad184"
+                    self._method = 'encrypted'
                 else:
-                    app_id = ''
-                    method = 'websocket'
-
-            except (
-                ValueError,
-                KeyError,
-                requests.HTTPError,
-                requests.exceptions.ConnectTimeout
-            ):
-                tmp_mac = wake_on_lan.get_mac_address(host)
-                if tmp_mac is not None:
-                    method = 'legacy'
-                    app_id = ''
-                    port = 55000
-                else:
-                    method = None
-                    app_id = ''
-                    port = None
-
-        elif method is None:
-            if port == 55000:
-                app_id = ''
-                method = 'legacy'
-            elif port in (8001, 8002):
-                app_id = ''
-                method = 'websocket'
-            elif port == 8080:
-                app_id = '654321'
-                id = "654321"
-                device_id = "7e509404-9d7c-46b4-8f6a-e2a9668ad184"
-                method = 'encrypted'
-            else:
-                raise exceptions.ConfigPortError(port)
-        elif port is None:
-            if method == 'legacy':
-                app_id = ''
-                port = 55000
-            elif method == 'websocket':
-                app_id = ''
-                if token is None:
-                    port = 8001
+                    raise exceptions.ConfigPortError(port)
+            elif port is None:
+                if method == 'legacy':
+                    self._port = 55000
+                elif method == 'websocket':
+                    if self.token is None:
+                        self._port = 8001
+                    else:
+                        self._port = 8002
+                elif method == 'encrypted':
+                    self._port = 8080
+                    self._app_id = '654321'
+                    self._id = "654321"
+                    self._device_id = "7e509404-9d7c-46b4-8f6a-e2a9668ad184"
                 else:
-                    port = 8002
-            elif method == 'encrypted':
-                port = 8080
-                app_id = '654321'
-                id = "654321"
-                device_id = "7e509404-9d7c-46b4-8f6a-e2a9668ad184"
-            else:
-                raise exceptions.ConfigUnknownMethod(method)
-        else:
-            app_id = ''
+                    raise exceptions.ConfigUnknownMethod(method)
+
+            if self._method is None:
+                raise exceptions.ConfigUnknownMethod()
+
+            if self._method not in ('encrypted', 'websocket', 'legacy'):
+                raise exceptions.ConfigUnknownMethod(self._method)
+
+            self._connection_resolved = True
+
+    def _resolve_mac(self):
+        with self._lock:
+            if self._mac_resolved:
+                return
 
-        if method is None:
-            raise exceptions.ConfigUnknownMethod()
+            port = self.port
+            mac = None
 
-        if method not in ('encrypted', 'websocket', 'legacy'):
-            raise exceptions.ConfigUnknownMethod(method)
+            if port in (8001, 8002, 8080):
+                import requests
 
-        if mac is None:
-            if port in (8001, 8002, 8080) and mac is None:
                 try:
-                    response = requests.get(
-                        'http://{0}:8001/api/v2/'.format(host),
-                        timeout=3
-                    )
-                    response = response.json()['device']
+                    verdict = autodetect.get_verdict(self.host)
+                    if verdict is not None and verdict.device_info:
+                        # the detection already asked the TV
+                        response = verdict.device_info
+                    else:
+                        response = requests.get(
+                            'http://{0}:8001/api/v2/'.format(self.host),
+                            timeout=3
+                        )
+                        response = response.json()['device']
+
                     if response['networkType'] == 'wired':
-                        mac = wake_on_lan.get_mac_address(host)
+                        mac = wake_on_lan.get_mac_address(self.host)
                     else:
                         mac = response['wifiMac'].upper()
                 except (
@@ -152,32 +207,119 @@ class Config(object):
                 ):
                     pass
             else:
-                mac = wake_on_lan.get_mac_address(host)
+                mac = wake_on_lan.get_mac_address(self.host)
 
-        if mac is None and port != 55000:
-            logger.error('Unable to acquire TV\'s mac address')
+            if mac is None and port != 55000:
+                logger.error('Unable to acquire TV\'s mac address')
 
-        if paired is None:
-            if token is not None:
-                paired = True
-            else:
-                paired = False
+            self._mac = mac
+            self._mac_resolved = True
 
-        self.name = name
-        self.description = description
-        self.host = host
-        self.port = port
-        self.id = id
-        self.method = method
-        self.timeout = timeout
-        self.token = token
-        self.path = None
-        self.device_id = device_id
-        self.upnp_locations = upnp_locations
-        self.app_id = app_id
+    def resolve(self):
+        """
+        Runs the connection detection and the MAC address lookup now.
 
-        self.paired = paired
-        self.mac = mac
+        :raises: `exceptions.ConfigUnknownMethod` if the connection method
+            could not be detected
+        """
+        self._detect_failed = None
+        self._resolve_connection()
+        self._resolve_mac()
+
+    @staticmethod
+    def resolve_all(configs, max_workers=16):
+        """
+        Resolves a batch of configs in parallel.
+
+        :param configs: configs to resolve
+        :type configs: iterable of `Config` instances
+        :param max_workers: number of configs resolved at the same time
+        :return: the configs that could not be resolved mapped to the
+            exception that was raised
+        :rtype: `dict`
+        """
+        configs = list(configs)
+        failed = {}
+
+        if not configs:
+            return failed
+
+        # a single ARP table read for all of the TVs
+        wake_on_lan.get_mac_addresses(
+            list(config.host for config in configs if not config._mac_resolved)
+        )
+
+        from concurrent import futures
+
+        executor = futures.ThreadPoolExecutor(max_workers)
+        try:
+            jobs = dict(
+                (executor.submit(config.resolve), config)
+                for config in configs
+            )
+            for job in futures.as_completed(jobs):
+                err = job.exception()
+                if err is not None:
+                    failed[jobs[job]] = err
+        finally:
+            executor.shutdown(wait=True)
+
+        return failed
+
+    @property
+    def method(self):
+        self._resolve_connection()
+        return self._method
+
+    @method.setter
+    def method(self, value):
+        self._method = value
+
+    @property
+    def port(self):
+        self._resolve_connection()
+        return self._port
+
+    @port.setter
+    def port(self, value):
+        self._port = value
+
+    @property
+    def id(self):
+        self._resolve_connection()
+        return self._id
+
+    @id.setter
+    def id(self, value):
+        self._id = value
+
+    @property
+    def device_id(self):
+        self._resolve_connection()
+        return self._device_id
+
+    @device_id.setter
+    def device_id(self, value):
+        self._device_id = value
+
+    @property
+    def app_id(self):
+        self._resolve_connection()
+        return self._app_id
+
+    @app_id.setter
+    def app_id(self, value):
+        self._app_id = value
+
+    @property
+    def mac(self):
+        self._resolve_mac()
+        return self._mac
+
+    @mac.setter
+    def mac(self, value):
+        self._mac = value
+        self._mac_resolved = True
 
     @property
     def log_level(self):
@@ -287,6 +429,7 @@ class Config(object):
                 upnp_locations=None,
                 paired=False,
                 mac=None,
+                udn=None,
                 **_
             ):
                 if os.path.isdir(pth):
@@ -313,7 +456,8 @@ class Config(object):
                     device_id=device_id,
                     upnp_locations=upnp_locations,
                     paired=paired,
-                    mac=mac
+                    mac=mac,
+                    udn=udn
                 )
                 self.path = cfg_path
 
@@ -380,6 +524,7 @@ class Config(object):
         yield 'upnp_locations', self.upnp_locations
         yield 'paired', self.paired
         yield 'mac', self.mac
+        yield 'udn', self.udn
 
     def __str__(self):
         upnp_locations = self.upnp_locations
@@ -401,7 +546,8 @@ class Config(object):
             device_id=self.device_id,
             upnp_locations=upnp_locations,
             paired=self.paired,
-            mac=self.mac
+            mac=self.mac,
+            udn=self.udn
         )
 
 
@@ -417,4 +563,5 @@ device_id = {device_id}
 upnp_locations = {upnp_locations}
 paired = {paired}
 mac = {mac}
+udn = {udn}
 '''
@@ -0,0 +1,579 @@
+# -*- coding: utf-8 -*-
+
+"""
+Long running process that keeps the connections to a set of TVs open.
+
+The daemon listens on a Unix socket and on a localhost HTTP port. Both
+take the same JSON request::
+
+    {"tv": "192.168.1.100", "commands": ["KEY_MENU", "volume 20"]}
+
+``tv`` is the host (or the name of the config file without its
+extension) and can be left off if only one TV is served. The commands
+are the ones of `samsungctl.batch`. The response holds a result for every
+command::
+
+    {"results": [
+        {"command": "KEY_MENU", "result": null, "time": 1.2},
+        {"command": "volume", "error": "...", "time": 3.0}
+    ]}
+
+The Unix socket takes one request per line and answers with one line, the
+HTTP server takes the request as the body of a POST to ``/`` and a GET of
+``/`` lists the TVs.
+
+The Unix socket can only be used by the user that runs the daemon. The
+HTTP server only takes ``Content-Type: application/json`` requests, a web
+page can not send one to another origin without the browser asking first,
+and a request has to carry ``Authorization: Bearer <token>`` if the daemon
+has an HTTP token (`TOKEN_ENV` or ``--http-token``).
+"""
+
+from __future__ import print_function
+import hmac
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from . import exceptions
+from . import liveness
+from .batch import Batch
+
+logger = logging.getLogger('samsungctl')
+
+HTTP_PORT = 8765
+
+# seconds a client waits for the daemon to answer
+CLIENT_TIMEOUT = 60.0
+
+# environment variable with the token of the HTTP server, used by the
+# daemon and by the client
+TOKEN_ENV = 'SAMSUNGCTL_HTTP_TOKEN'
+
+
+def get_socket_path():
+    """
+    Default path of the Unix socket.
+
+    :rtype: `str`
+    """
+    directory = os.getenv('XDG_RUNTIME_DIR')
+    if directory:
+        return os.path.join(directory, 'samsungctl.sock')
+
+    return os.path.join(
+        tempfile.gettempdir(),
+        'samsungctl-{0}.sock'.format(getattr(os, 'getuid', lambda: 0)())
+    )
+
+
+class TV(object):
+    """
+    A served TV.
+
+    The `Remote` gets built the first time a command is run and is kept
+    open after that. Commands for the same TV run one after the other,
+    different TVs run in parallel.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.remote = None
+        self._lock = threading.Lock()
+
+    def _get_remote(self):
+        if self.remote is None:
+            from .remote import Remote
+
+            if self.config.upnp_locations is None:
+                # the UPnP models get loaded once and stay cached
+                self.config.upnp_locations = []
+
+            self.remote = Remote(self.config)
+
+        return self.remote
+
+    def run(self, commands):
+        """
+        Runs commands.
+
+        :param commands: commands of `samsungctl.batch`
+        :type commands: `list` of `str`
+        :rtype: `list` of `dict`
+        """
+        results = []
+
+        with self._lock:
+            for command in commands:
+                start = time.time()
+                result = dict(command=command)
+
+                try:
+                    value = Batch(self._get_remote()).execute(command)
+                    if value is not None and not isinstance(
+                        value,
+                        (bool, int, float)
+                    ):
+                        value = str(value)
+
+                    result['result'] = value
+                except Exception as err:
+                    result['error'] = str(err) or err.__class__.__name__
+
+                result['time'] = round((time.time() - start) * 1000, 1)
+                results += [result]
+
+        return results
+
+    def close(self):
+        with self._lock:
+            if self.remote is not None:
+                try:
+                    self.remote.close()
+                except:
+                    import traceback
+                    logger.debug(traceback.format_exc())
+
+                self.remote = None
+
+
+class Daemon(object):
+
+    def __init__(
+        self,
+        configs,
+        socket_path=None,
+        http_port=HTTP_PORT,
+        http_token=None,
+        presence=True
+    ):
+        """
+        :param configs: the TVs to serve
+        :type configs: `list` of `samsungctl.Config` instances
+        :param socket_path: path of the Unix socket, `None` for the default
+            and ``""`` to not use a Unix socket.
+        :type socket_path: `None` or `str`
+        :param http_port: port of the localhost HTTP server, ``0`` to not
+            run it.
+        :type http_port: `int`
+        :param http_token: token the HTTP requests have to carry, `None`
+            to use the one of `TOKEN_ENV` if it is set.
+        :type http_token: `None` or `str`
+        :param presence: listen for the SSDP notifications of the TVs, see
+            `samsungctl.liveness.start_presence`.
+        :type presence: `bool`
+        """
+        self.tvs = {}
+
+        for config in configs:
+            tv = TV(config)
+            self.tvs[config.host] = tv
+
+            if config.path:
+                name = os.path.splitext(os.path.basename(config.path))[0]
+                self.tvs.setdefault(name, tv)
+
+        if socket_path is None and hasattr(socket, 'AF_UNIX'):
+            socket_path = get_socket_path()
+
+        if http_token is None:
+            http_token = os.getenv(TOKEN_ENV) or None
+
+        self.socket_path = socket_path
+        self.http_port = http_port
+        self.http_token = http_token
+        self.presence = presence
+        self._presence_started = False
+        self._servers = []
+        self._threads = []
+
+    def get_tv(self, name):
+        """
+        :raises: `exceptions.DaemonTVError` if the TV is not served
+        """
+        if name is None:
+            tvs = set(self.tvs.values())
+            if len(tvs) == 1:
+                return tvs.pop()
+
+        elif name in self.tvs:
+            return self.tvs[name]
+
+        raise exceptions.DaemonTVError(name)
+
+    def handle(self, request):
+        """
+        Runs a request.
+
+        :param request: decoded JSON request
+        :type request: `dict`
+        :return: the response
+        :rtype: `dict`
+        """
+        try:
+            tv = self.get_tv(request.get('tv', None))
+            commands = request['commands']
+            if not isinstance(commands, list):
+                commands = [commands]
+        except (exceptions.DaemonTVError, KeyError, AttributeError) as err:
+            return dict(error=str(err) or 'invalid request')
+
+        return dict(results=tv.run(commands))
+
+    def list_tvs(self):
+        return dict(
+            tvs=list(
+                dict(
+                    name=name,
+                    host=tv.config.host,
+                    connected=tv.remote is not None
+                )
+                for name, tv in sorted(self.tvs.items())
+            )
+        )
+
+    def start(self):
+        """Starts the servers in daemon threads."""
+        if self.presence and not self._presence_started:
+            liveness.start_presence()
+            self._presence_started = True
+
+        if self.socket_path:
+            if os.path.exists(self.socket_path):
+                # left over from a daemon that did not shut down cleanly
+                os.remove(self.socket_path)
+
+            # the socket gets created without access for other users,
+            # a chmod after the bind would leave a window open
+            umask = os.umask(0o177)
+            try:
+                server = _UnixServer(self.socket_path, _UnixHandler)
+            finally:
+                os.umask(umask)
+
+            server.tv_daemon = self
+            self._servers += [server]
+            logger.info('listening on ' + self.socket_path)
+
+        if self.http_port:
+            server = _HTTPServer(('127.0.0.1', self.http_port), _HTTPHandler)
+            server.tv_daemon = self
+            self._servers += [server]
+            logger.info(
+                'listening on http://127.0.0.1:{0}'.format(
+                    server.server_address[1]
+                )
+            )
+
+        for server in self._servers:
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            self._threads += [thread]
+
+    def stop(self):
+        """Stops the servers and closes the connections."""
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+
+        for thread in self._threads:
+            thread.join(3.0)
+
+        del self._servers[:]
+        del self._threads[:]
+
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        for tv in set(self.tvs.values()):
+            tv.close()
+
+        if self._presence_started:
+            liveness.stop_presence()
+            self._presence_started = False
+
+    def run(self):
+        """Runs until the process gets interrupted."""
+        self.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+class _UnixHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                response = self.server.tv_daemon.handle(
+                    json.loads(line.decode('utf-8'))
+                )
+            except ValueError:
+                response = dict(error='invalid request')
+
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+
+    def _respond(self, status, response):
+        data = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        token = self.server.tv_daemon.http_token
+        if token is None:
+            return True
+
+        authorization = self.headers.get('Authorization', '')
+        if hmac.compare_digest(
+            authorization.encode('utf-8'),
+            ('Bearer ' + token).encode('utf-8')
+        ):
+            return True
+
+        self._respond(401, dict(error='unauthorized'))
+        return False
+
+    def do_GET(self):
+        if self.path != '/':
+            self._respond(404, dict(error='not found'))
+        elif self._authorized():
+            self._respond(200, self.server.tv_daemon.list_tvs())
+
+    def do_POST(self):
+        if self.path != '/':
+            self._respond(404, dict(error='not found'))
+            return
+
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.split(';')[0].strip().lower() != 'application/json':
+            # a cross origin "simple" request (text/plain, a form...) from
+            # a web page, browsers do not send JSON without a preflight
+            self._respond(415, dict(error='expected application/json'))
+            return
+
+        if not self._authorized():
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError:
+            self._respond(400, dict(error='invalid request'))
+            return
+
+        response = self.server.tv_daemon.handle(request)
+        self._respond(400 if 'error' in response else 200, response)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class _UnixServer(
+        socketserver.ThreadingMixIn,
+        socketserver.UnixStreamServer
+    ):
+        daemon_threads = True
+else:
+    _UnixServer = None
+
+
+class Client(object):
+    """
+    Sends commands to a running daemon.
+
+    >>> client = Client()
+    >>> client.run(['KEY_VOLUP 3', 'volume'], tv='192.168.1.100')
+    """
+
+    def __init__(self, address=None, timeout=CLIENT_TIMEOUT, token=None):
+        """
+        :param address: path of the Unix socket or the URL of the HTTP
+            server (``"http://127.0.0.1:8765"``), `None` for the default
+            Unix socket.
+        :type address: `None` or `str`
+        :param token: token of the HTTP server, `None` to use the one of
+            `TOKEN_ENV` if it is set.
+        :type token: `None` or `str`
+        """
+        if address is None:
+            address = get_socket_path()
+
+        if token is None:
+            token = os.getenv(TOKEN_ENV) or None
+
+        self.address = address
+        self.timeout = timeout
+        self.token = token
+
+    def _send_unix(self, data):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.address)
+            sock.sendall(data + b'\n')
+
+            response = b''
+            while not response.endswith(b'\n'):
+                chunk = sock.recv(4096)
+                if not chunk:
+                    raise exceptions.ConnectionClosed()
+                response += chunk
+        finally:
+            sock.close()
+
+        return response
+
+    def _send_http(self, data):
+        try:
+            from urllib.request import Request, urlopen
+            from urllib.error import HTTPError
+        except ImportError:
+            from urllib2 import Request, urlopen, HTTPError
+
+        headers = {'Content-Type': 'application/json'}
+        if self.token is not None:
+            headers['Authorization'] = 'Bearer ' + self.token
+
+        request = Request(self.address, data=data, headers=headers)
+        try:
+            return urlopen(request, timeout=self.timeout).read()
+        except HTTPError as err:
+            return err.read()
+
+    def run(self, commands, tv=None):
+        """
+        Runs commands on a TV.
+
+        :param commands: commands of `samsungctl.batch`
+        :type commands: `list` of `str`
+        :param tv: host or name of the TV, can be left off if the daemon
+            serves a single TV.
+        :type tv: `None` or `str`
+        :return: the results, see the module documentation
+        :rtype: `list` of `dict`
+        :raises: `exceptions.DaemonRequestError` if the daemon does not
+            serve the TV or the request is not valid.
+        """
+        request = dict(commands=list(commands))
+        if tv is not None:
+            request['tv'] = tv
+
+        data = json.dumps(request).encode('utf-8')
+
+        if self.address.startswith('http://'):
+            response = self._send_http(data)
+        else:
+            response = self._send_unix(data)
+
+        response = json.loads(response.decode('utf-8'))
+        if 'error' in response:
+            raise exceptions.DaemonRequestError(response['error'])
+
+        return response['results']
+
+
+def serve_main(argv=None):
+    """Command line entry point of ``samsungctl serve``."""
+    import argparse
+    from .config import Config
+
+    parser = argparse.ArgumentParser(
+        prog='samsungctl serve',
+        description=(
+            'Keeps the connections to the TVs open and runs the commands '
+            'it gets over a Unix socket and a localhost HTTP port.'
+        )
+    )
+    parser.add_argument(
+        '--config-file',
+        action='append',
+        default=[],
+        help='configuration file of a TV, can be given more than once'
+    )
+    parser.add_argument(
+        '--host',
+        action='append',
+        default=[],
+        help='TV hostname or IP address, can be given more than once'
+    )
+    parser.add_argument(
+        '--socket',
+        default=None,
+        help='path of the Unix socket, "" to not use one'
+    )
+    parser.add_argument(
+        '--http-port',
+        type=int,
+        default=HTTP_PORT,
+        help='localhost HTTP port, 0 to not use one'
+    )
+    parser.add_argument(
+        '--http-token',
+        default=None,
+        help=(
+            'token the HTTP requests have to carry as "Authorization: '
+            'Bearer TOKEN", defaults to ${0}'.format(TOKEN_ENV)
+        )
+    )
+    parser.add_argument(
+        '-v',
+        '--verbose',
+        action='count',
+        help='increase output verbosity'
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.verbose:
+        logger.setLevel(logging.DEBUG if args.verbose > 1 else logging.INFO)
+
+    configs = []
+    for path in args.config_file:
+        config = Config.load(path)
+        if not isinstance(config, Config):
+            # Config.load returns a factory for files that do not exist
+            parser.error('configuration file {0} not found'.format(path))
+
+        configs += [config]
+
+    configs += list(Config(host=host) for host in args.host)
+
+    if not configs:
+        parser.error('no TVs to serve, use --config-file or --host')
+
+    Daemon(configs, args.socket, args.http_port, args.http_token).run()
@@ -9,8 +9,8 @@ class SamsungTVError(Exception):
         if self._args:
             return self.__class__.__doc__ % self._args
 
-        elif b'%s' in self.__class__.__doc__:
-            args = tuple([''] * self.__class__.__doc__.count(b'%s'))
+        elif '%s' in self.__class__.__doc__:
+            args = tuple([''] * self.__class__.__doc__.count('%s'))
             return self.__class__.__doc__ % args
 
         return self.__class__.__doc__
@@ -70,3 +70,23 @@ class ConfigSavePathNotSpecified(ConfigError):
 
 class ConfigParameterError(ConfigError):
     """Parameter %s is not a config parameter."""
+
+
+class ScanNetworkError(SamsungTVError):
+    """Network %s is not a valid CIDR network."""
+
+
+class BatchCommandError(SamsungTVError):
+    """Invalid batch command: %s"""
+
+
+class DaemonTVError(SamsungTVError):
+    """TV %s is not served by the daemon."""
+
+
+class DaemonRequestError(SamsungTVError):
+    """Daemon request failed: %s"""
+
+
+class WriteQueueFull(SamsungTVError):
+    """Write queue is full: %s"""
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+"""
+Non-blocking command submission.
+
+Every remote gets a `SerialExecutor` that runs its commands one after the
+other, in the order they were submitted, on a thread pool shared by all
+of the remotes, so the commands of different TVs run in parallel.
+
+>>> future = remote.submit_control('KEY_VOLUP')
+>>> future = remote.submit_set('volume', 20, timeout=5.0)
+>>> future.result(10.0)
+"""
+
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger('samsungctl')
+
+# size of the pool shared by the remotes, the number of TVs that can run
+# a command at the same time
+POOL_SIZE = 16
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    The thread pool shared by the remotes, it gets created the first time
+    it is used.
+
+    :rtype: `concurrent.futures.ThreadPoolExecutor`
+    """
+    global _pool
+
+    from concurrent import futures
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = futures.ThreadPoolExecutor(POOL_SIZE)
+
+    return _pool
+
+
+class SerialExecutor(object):
+    """Runs jobs on a shared pool, one after the other."""
+
+    def __init__(self, executor):
+        """
+        :param executor: the pool the jobs run on
+        :type executor: `concurrent.futures.Executor`
+        """
+        self._executor = executor
+        self._jobs = collections.deque()
+        self._lock = threading.Lock()
+        self._scheduled = False
+
+    @property
+    def pending(self):
+        """
+        Number of jobs waiting to run.
+
+        :rtype: `int`
+        """
+        return len(self._jobs)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queues a job.
+
+        :rtype: `concurrent.futures.Future`
+        """
+        return self.submit_job(func, args, kwargs)
+
+    def submit_job(self, func, args=(), kwargs=None, timeout=None):
+        """
+        Queues a job.
+
+        :param timeout: seconds the job can wait for its turn, the future
+            gets a `concurrent.futures.TimeoutError` if it could not be
+            started in time. `None` waits as long as it takes.
+        :type timeout: `None` or `float`
+        :return: the future of the job, cancelling it before the job
+            started removes it from the queue.
+        :rtype: `concurrent.futures.Future`
+        """
+        from concurrent import futures
+
+        future = futures.Future()
+
+        if timeout is None:
+            deadline = None
+        else:
+            deadline = time.time() + timeout
+
+        job = (future, func, args, kwargs or {}, deadline)
+
+        with self._lock:
+            self._jobs.append(job)
+            if self._scheduled:
+                return future
+
+            self._scheduled = True
+
+        try:
+            self._executor.submit(self._run)
+        except RuntimeError:
+            # the pool got shut down
+            with self._lock:
+                self._jobs.remove(job)
+                self._scheduled = False
+            raise
+
+        return future
+
+    def _run(self):
+        from concurrent import futures
+
+        while True:
+            with self._lock:
+                if not self._jobs:
+                    self._scheduled = False
+                    return
+
+                future, func, args, kwargs, deadline = self._jobs.popleft()
+
+            if not future.set_running_or_notify_cancel():
+                # cancelled by the caller
+                continue
+
+            if deadline is not None and time.time() > deadline:
+                future.set_exception(
+                    futures.TimeoutError('command was not started in time')
+                )
+                continue
+
+            try:
+                result = func(*args, **kwargs)
+            except Exception as err:
+                future.set_exception(err)
+            else:
+                future.set_result(result)
+
+
+class Submit(object):
+    """
+    The ``submit_`` methods of a remote, they return right away.
+    """
+
+    _executor_lock = threading.Lock()
+
+    @property
+    def executor(self):
+        """
+        The `SerialExecutor` of the remote.
+
+        :rtype: `SerialExecutor`
+        """
+        executor = self.__dict__.get('_executor', None)
+
+        if executor is None:
+            with Submit._executor_lock:
+                executor = self.__dict__.get('_executor', None)
+                if executor is None:
+                    executor = SerialExecutor(get_pool())
+                    self.__dict__['_executor'] = executor
+
+        return executor
+
+    def submit_control(self, key, timeout=None):
+        """
+        Sends a key without waiting for it.
+
+        :param key: the key (``"KEY_MENU"``)
+        :type key: `str`
+        :param timeout: seconds the key can wait behind the commands that
+            were submitted before it
+        :type timeout: `None` or `float`
+        :rtype: `concurrent.futures.Future`
+        """
+        return self.executor.submit_job(self.control, (key,), None, timeout)
+
+    def submit_set(self, name, value, timeout=None):
+        """
+        Sets a property (``"volume"``, ``"source"``, ``"channel"``...)
+        without waiting for it.
+
+        :param name: name of the property
+        :type name: `str`
+        :param value: the new value
+        :param timeout: see `submit_control`
+        :rtype: `concurrent.futures.Future`
+        :raises: `AttributeError` if the remote does not have the property
+        """
+        if not hasattr(type(self), name):
+            raise AttributeError(name)
+
+        return self.executor.submit_job(
+            setattr,
+            (self, name, value),
+            None,
+            timeout
+        )
+
+    def submit_call(self, func, args=(), kwargs=None, timeout=None):
+        """
+        Runs a function without waiting for it.
+
+        >>> app = remote.get_application('Netflix')
+        >>> future = remote.submit_call(app.run)
+        >>> future = remote.submit_call('get_application', ('YouTube',))
+
+        :param func: the function or the name of a method of the remote
+        :type func: callable or `str`
+        :param args: positional arguments
+        :type args: `tuple`
+        :param kwargs: keyword arguments
+        :type kwargs: `None` or `dict`
+        :param timeout: see `submit_control`
+        :rtype: `concurrent.futures.Future`
+        """
+        if not callable(func):
+            func = getattr(self, func)
+
+        return self.executor.submit_job(func, args, kwargs, timeout)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+"""
+Control of many TVs at once.
+"""
+
+import logging
+import threading
+from concurrent import futures
+
+from . import liveness
+from . import reactor as _reactor
+from .config import Config
+
+logger = logging.getLogger('samsungctl')
+
+
+class Fleet(object):
+    """
+    A set of TVs that share one `samsungctl.reactor.Reactor` and one thread
+    pool.
+
+    The websocket connections of all of the TVs are serviced by the
+    reactor thread instead of a thread per TV, the group operations run on
+    the pool.
+
+    >>> fleet = Fleet()
+    >>> fleet.add(Config(host='192.168.1.100'), groups=('lobby',))
+    >>> fleet.add(Config(host='192.168.1.101'), groups=('lobby',))
+    >>> fleet.open()
+    >>> fleet.send_key('KEY_VOLUP', group='lobby')
+    >>> fleet.close()
+    """
+
+    def __init__(self, max_workers=16, reactor_workers=8, presence=True):
+        """
+        :param max_workers: number of TVs a group operation runs on at the
+            same time.
+        :type max_workers: `int`
+        :param reactor_workers: size of the pool of the reactor that runs
+            the message handlers and the reconnects.
+        :type reactor_workers: `int`
+        :param presence: listen for the SSDP notifications of the TVs while
+            the fleet is open, a TV that announces itself gets reconnected
+            right away, see `samsungctl.liveness.start_presence`.
+        :type presence: `bool`
+        """
+        self.reactor = _reactor.Reactor(reactor_workers)
+        self.remotes = {}
+        self.groups = {}
+        self._configs = {}
+        self._lock = threading.Lock()
+        self._executor = futures.ThreadPoolExecutor(max_workers)
+        self.presence = presence
+        self._presence_started = False
+
+    def add(self, config, groups=()):
+        """
+        Adds a TV, it gets connected by `open`.
+
+        :param config: the TV
+        :type config: `samsungctl.Config` or `dict`
+        :param groups: names of the groups the TV is a member of
+        :type groups: iterable of `str`
+        """
+        if isinstance(config, dict):
+            config = Config(**config)
+
+        with self._lock:
+            self._configs[config.host] = config
+            for group in groups:
+                self.groups.setdefault(group, set()).add(config.host)
+
+    def _get_hosts(self, group=None):
+        if group is None:
+            return list(self._configs.keys())
+
+        return list(self.groups.get(group, ()))
+
+    def _run(self, func, hosts):
+        jobs = dict(
+            (self._executor.submit(func, host), host) for host in hosts
+        )
+
+        results = {}
+        for job in futures.as_completed(jobs):
+            host = jobs[job]
+            err = job.exception()
+            results[host] = err
+
+            if err is not None:
+                logger.error('{0}: {1!r}'.format(host, err))
+
+        return results
+
+    def _open(self, host):
+        if host in self.remotes:
+            return
+
+        from .remote import Remote
+
+        with self.reactor.installed():
+            remote = Remote(self._configs[host])
+
+        with self._lock:
+            self.remotes[host] = remote
+
+    def open(self, group=None):
+        """
+        Builds and connects the remotes in parallel.
+
+        :return: the host of every TV mapped to the exception its
+            connection raised or `None`
+        :rtype: `dict`
+        """
+        with self._lock:
+            start_presence = self.presence and not self._presence_started
+            self._presence_started = self._presence_started or start_presence
+
+        if start_presence:
+            liveness.start_presence()
+
+        return self._run(self._open, self._get_hosts(group))
+
+    def _call(self, group, func):
+        def run(host):
+            remote = self.remotes.get(host, None)
+            if remote is None:
+                self._open(host)
+                remote = self.remotes[host]
+
+            func(remote)
+
+        return self._run(run, self._get_hosts(group))
+
+    def send_key(self, key, group=None):
+        """
+        Sends a key to every TV of a group.
+
+        :param key: the key (``"KEY_MENU"``)
+        :type key: `str`
+        :param group: name of the group, `None` for all of the TVs
+        :return: the host of every TV mapped to the exception that was
+            raised or `None`
+        :rtype: `dict`
+        """
+        return self._call(group, lambda remote: remote.control(key))
+
+    def power(self, value, group=None):
+        """
+        Powers the TVs of a group on or off.
+
+        :return: the host of every TV mapped to the exception that was
+            raised or `None`
+        :rtype: `dict`
+        """
+        def set_power(remote):
+            remote.power = value
+
+        return self._call(group, set_power)
+
+    def _get_remotes(self, group):
+        return list(
+            self.remotes[host] for host in self._get_hosts(group)
+            if host in self.remotes
+        )
+
+    def broadcast_key(self, key, group=None, **kwargs):
+        """
+        Sends a key to the connected TVs of a group at the same moment.
+
+        See `samsungctl.broadcast.broadcast_key` for the parameters.
+
+        :rtype: `samsungctl.broadcast.BroadcastReport`
+        """
+        from .broadcast import broadcast_key
+
+        return broadcast_key(self._get_remotes(group), key, **kwargs)
+
+    def broadcast_app(self, app_id, group=None, **kwargs):
+        """
+        Starts an application on the connected TVs of a group at the same
+        moment.
+
+        See `samsungctl.broadcast.broadcast_app` for the parameters.
+
+        :rtype: `samsungctl.broadcast.BroadcastReport`
+        """
+        from .broadcast import broadcast_app
+
+        return broadcast_app(self._get_remotes(group), app_id, **kwargs)
+
+    def status(self, group=None):
+        """
+        State of the TVs.
+
+        :return: ``{host: {'connected': bool, 'alive': bool}}``, the TVs
+            that have not been opened are not connected.
+        :rtype: `dict`
+        """
+        result = {}
+
+        for host in self._get_hosts(group):
+            remote = self.remotes.get(host, None)
+            if remote is None:
+                result[host] = dict(connected=False, alive=False)
+                continue
+
+            result[host] = dict(
+                connected=remote.sock is not None,
+                alive=remote.liveness.alive
+            )
+
+        return result
+
+    def _close(self, host):
+        with self._lock:
+            remote = self.remotes.pop(host, None)
+
+        if remote is not None:
+            remote.close()
+
+    def close(self, group=None):
+        """
+        Closes the connections in parallel.
+
+        The reactor and the pool are stopped once all of the TVs are
+        closed.
+        """
+        results = self._run(self._close, self._get_hosts(group))
+
+        if group is None:
+            with self._lock:
+                stop_presence = self._presence_started
+                self._presence_started = False
+
+            if stop_presence:
+                liveness.stop_presence()
+
+            self.reactor.stop()
+            self._executor.shutdown(wait=False)
+
+        return results
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+"""
+Rewrites runs of keys into single UPnP calls.
+
+Every key is a paced keypress, ``KEY_VOLUP`` sent 20 times or
+``KEY_1 KEY_0 KEY_5 KEY_ENTER`` takes seconds on a websocket TV and a lot
+longer on an encrypted one. When the TV has the UPnP service that does
+the same thing in one request the run gets replaced by that request:
+
+* a run of ``KEY_VOLUP``/``KEY_VOLDOWN`` sets the volume
+  (``MainTVAgent2`` or ``RenderingControl``) to the current volume plus
+  the number of ups minus the number of downs.
+* digits followed by ``KEY_ENTER`` tune the channel with that major
+  number (``MainTVAgent2``).
+
+The keys get sent as keys when the TV does not have the service, UPnP is
+not connected or the request fails.
+
+>>> from samsungctl import keyseq
+>>> keyseq.send_keys(remote, ['KEY_VOLUP'] * 20)
+"""
+
+import logging
+
+logger = logging.getLogger('samsungctl')
+
+# shortest run of volume keys that gets rewritten
+VOLUME_MIN_RUN = 2
+
+VOLUME_KEYS = {
+    'KEY_VOLUP': 1,
+    'KEY_VOLDOWN': -1
+}
+
+DIGIT_KEYS = dict(('KEY_{0}'.format(i), str(i)) for i in range(10))
+
+
+class Step(object):
+    """
+    A part of a key sequence.
+
+    :ivar kind: ``"keys"``, ``"volume"`` or ``"channel"``
+    :ivar keys: the keys the step replaces, they are sent if the UPnP
+        call can not be made
+    :ivar value: the volume change or the channel number
+    """
+
+    def __init__(self, kind, keys, value=None):
+        self.kind = kind
+        self.keys = keys
+        self.value = value
+
+    def __repr__(self):
+        if self.kind == 'keys':
+            return '<Step keys {0}>'.format(' '.join(self.keys))
+
+        return '<Step {0} {1!r} ({2} keys)>'.format(
+            self.kind,
+            self.value,
+            len(self.keys)
+        )
+
+
+def optimize(keys):
+    """
+    Splits a key sequence into the runs that can be rewritten and the
+    keys that can not.
+
+    :param keys: the keys (``"KEY_VOLUP"``)
+    :type keys: iterable of `str`
+    :rtype: `list` of `Step`
+    """
+    keys = list(keys)
+    steps = []
+    plain = []
+
+    def add(step):
+        if plain:
+            steps.append(Step('keys', plain[:]))
+            del plain[:]
+        steps.append(step)
+
+    i = 0
+    while i < len(keys):
+        key = keys[i]
+
+        if key in VOLUME_KEYS:
+            end = i
+            while end < len(keys) and keys[end] in VOLUME_KEYS:
+                end += 1
+
+            if end - i >= VOLUME_MIN_RUN:
+                run = keys[i:end]
+                add(Step('volume', run, sum(VOLUME_KEYS[k] for k in run)))
+                i = end
+                continue
+
+        elif key in DIGIT_KEYS:
+            end = i
+            while end < len(keys) and keys[end] in DIGIT_KEYS:
+                end += 1
+
+            if end < len(keys) and keys[end] == 'KEY_ENTER':
+                run = keys[i:end + 1]
+                add(
+                    Step(
+                        'channel',
+                        run,
+                        ''.join(DIGIT_KEYS[k] for k in run[:-1])
+                    )
+                )
+                i = end + 1
+                continue
+
+            # digits without an enter, the TV tunes them on its own time
+            plain.extend(keys[i:end])
+            i = end
+            continue
+
+        plain.append(key)
+        i += 1
+
+    if plain:
+        steps.append(Step('keys', plain))
+
+    return steps
+
+
+def _has_service(remote, *names):
+    try:
+        # the services show up once UPnP is connected
+        if not getattr(remote, 'connected', False):
+            return False
+
+        for name in names:
+            if hasattr(remote, name):
+                return True
+    except Exception:
+        # UPnP is not reachable
+        pass
+
+    return False
+
+
+def _set_volume(remote, change):
+    if not _has_service(remote, 'MainTVAgent2', 'RenderingControl'):
+        return False
+
+    volume = remote.volume
+    if isinstance(volume, (list, tuple)):
+        # RenderingControl returns the output arguments
+        volume = volume[-1]
+
+    if volume is None:
+        return False
+
+    volume = min(max(int(volume) + change, 0), 100)
+    remote.volume = volume
+    logger.debug('key sequence: volume set to {0}'.format(volume))
+    return True
+
+
+def _strip(number):
+    return (number or '').lstrip('0') or '0'
+
+
+def _set_channel(remote, number):
+    if not _has_service(remote, 'MainTVAgent2'):
+        return False
+
+    channels = remote.channels
+    if not channels:
+        return False
+
+    found = list(
+        channel for channel in channels
+        if _strip(channel._channel_num[0]) == _strip(number)
+    )
+
+    if len(found) > 1:
+        # sub channels, the keys tune the one without a minor number
+        found = list(
+            channel for channel in found
+            if _strip(channel._channel_num[1]) == '0'
+        )
+
+    if len(found) != 1:
+        return False
+
+    found[0].activate()
+    logger.debug('key sequence: channel {0} tuned'.format(number))
+    return True
+
+
+_HANDLERS = {
+    'volume': _set_volume,
+    'channel': _set_channel
+}
+
+
+def run_step(remote, step):
+    """
+    Runs a single `Step`, the keys are sent if the UPnP call can not be
+    made.
+
+    :return: `True` if the step was done with a UPnP call
+    :rtype: `bool`
+    """
+    handler = _HANDLERS.get(step.kind, None)
+
+    if handler is not None:
+        try:
+            if handler(remote, step.value):
+                return True
+        except Exception as err:
+            logger.debug(
+                'key sequence: {0} failed, sending the keys: {1!r}'.format(
+                    step.kind,
+                    err
+                )
+            )
+
+    for key in step.keys:
+        remote.control(key)
+
+    return False
+
+
+def send_keys(remote, keys):
+    """
+    Sends a key sequence, the runs the TV has a UPnP call for get
+    rewritten.
+
+    :param remote: connected remote
+    :type remote: `samsungctl.Remote` instance
+    :param keys: the keys (``"KEY_VOLUP"``)
+    :type keys: iterable of `str`
+    :return: number of keys that were replaced by a UPnP call
+    :rtype: `int`
+    """
+    replaced = 0
+
+    for step in optimize(keys):
+        if run_step(remote, step):
+            replaced += len(step.keys)
+
+    return replaced
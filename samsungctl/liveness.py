@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import socket
+import threading
+import time
+import weakref
+from . import reconnect
+
+logger = logging.getLogger('samsungctl')
+
+# host -> `weakref.WeakSet` of the trackers of the remotes of that host
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+_presence = None
+_presence_users = 0
+_presence_lock = threading.Lock()
+
+
+class Liveness(object):
+    """
+    Cached reachability state of a TV.
+
+    The state gets fed by the connection (socket opened/closed), by SSDP
+    alive/byebye notifications and by a cheap TCP connect probe that is
+    only run once the last piece of information has expired. Reading
+    `alive` while the state is current is a plain attribute lookup.
+    """
+
+    # how long (in seconds) the result of a probe or a socket failure is
+    # trusted before the TV gets probed again.
+    probe_interval = 5.0
+    # how long (in seconds) an open connection is trusted before the TV
+    # gets probed again, a connection does not always notice the TV going
+    # away.
+    connected_interval = 30.0
+    # connect timeout used by the TCP probe.
+    probe_timeout = 0.5
+
+    def __init__(self, config):
+        """
+        :param config: TV configuration settings.
+        :type config: `samsungctl.Config` instance
+        """
+        self.config = config
+        self._alive = False
+        self._expires = 0.0
+        self._lock = threading.Lock()
+        self._alive_event = threading.Event()
+
+        with _trackers_lock:
+            _trackers.setdefault(config.host, weakref.WeakSet()).add(self)
+
+    @property
+    def alive(self):
+        """
+        Is the TV reachable.
+
+        Returns the cached state, the TV only gets probed if the cached
+        state has expired.
+
+        :rtype: `bool`
+        """
+        if self._expires is not None and time.time() > self._expires:
+            self.probe()
+
+        return self._alive
+
+    def set_alive(self, alive, expires=None):
+        """
+        Stores the state of the TV.
+
+        :param alive: `True` if the TV is reachable
+        :type alive: `bool`
+        :param expires: seconds the state is valid for, `None` to keep the
+            state until it is changed.
+        :type expires: `None`, `int` or `float`
+        """
+        if alive != self._alive:
+            logger.debug(
+                '{0}: liveness changed to {1}'.format(self.config.host, alive)
+            )
+
+            if alive:
+                # the TV is back, a reconnect that is backing off gets
+                # made right away
+                reconnect.wake(self.config.host)
+
+        self._alive = alive
+
+        if alive:
+            self._alive_event.set()
+        else:
+            self._alive_event.clear()
+
+        if expires is None:
+            self._expires = None
+        else:
+            self._expires = time.time() + expires
+
+    def wait_alive(self, timeout):
+        """
+        Waits for the TV to be reported as reachable.
+
+        Returns right away if the stored state already says so, the TV
+        does not get probed.
+
+        :param timeout: seconds to wait
+        :type timeout: `float`
+        :return: `True` if the TV is reachable
+        :rtype: `bool`
+        """
+        self._alive_event.wait(timeout)
+        return self._alive
+
+    def expire(self):
+        """Marks the stored state as outdated."""
+        self._expires = 0.0
+
+    def host_changed(self, old_host):
+        """
+        Moves the tracker to the new address of the TV, `config.host`
+        has to be updated already.
+        """
+        with _trackers_lock:
+            trackers = _trackers.get(old_host, None)
+            if trackers is not None:
+                trackers.discard(self)
+                if not trackers:
+                    del _trackers[old_host]
+
+            _trackers.setdefault(self.config.host, weakref.WeakSet()).add(
+                self
+            )
+
+        self.expire()
+
+    def connection_opened(self):
+        self.set_alive(True, self.connected_interval)
+
+    def connection_closed(self):
+        self.set_alive(False, self.probe_interval)
+
+    def ssdp_alive(self, max_age=None):
+        if max_age is None:
+            max_age = self.probe_interval
+
+        self.set_alive(True, max_age)
+
+    def ssdp_byebye(self):
+        self.set_alive(False, self.probe_interval)
+
+    def probe(self):
+        """
+        Checks if the TV accepts a TCP connection on the configured port.
+
+        :return: `True` if the TV is reachable
+        :rtype: `bool`
+        """
+        if not self._lock.acquire(False):
+            # another thread is already probing, use the current state
+            return self._alive
+
+        try:
+            port = self.config.port
+            if port is None:
+                alive = False
+            else:
+                alive = probe(self.config.host, port, self.probe_timeout)
+
+            self.set_alive(alive, self.probe_interval)
+            return alive
+        finally:
+            self._lock.release()
+
+
+def probe(host, port, timeout=0.5):
+    """
+    Attempts a TCP connection.
+
+    :param host: ip address
+    :type host: `str`
+    :param port: TCP port
+    :type port: `int`
+    :param timeout: connect timeout in seconds
+    :type timeout: `float`
+    :return: `True` if the connection was accepted
+    :rtype: `bool`
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect((host, port))
+        return True
+    except (socket.error, socket.timeout):
+        return False
+    finally:
+        try:
+            sock.close()
+        except socket.error:
+            pass
+
+
+def set_keepalive(sock, interval, misses):
+    """
+    Turns TCP keepalive on.
+
+    A TV that went away without closing the connection makes the socket
+    fail after about ``interval * (misses + 1)`` seconds of silence instead
+    of the hours the system defaults take.
+
+    :param sock: connected socket
+    :type sock: `socket.socket`
+    :param interval: seconds of silence before the first probe and
+        between the probes
+    :type interval: `int` or `float`
+    :param misses: unanswered probes that drop the connection, Windows
+        always uses 10
+    :type misses: `int`
+    """
+    interval = max(int(interval), 1)
+
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, interval)
+        elif hasattr(socket, 'TCP_KEEPALIVE'):
+            # macOS
+            sock.setsockopt(
+                socket.IPPROTO_TCP,
+                socket.TCP_KEEPALIVE,
+                interval
+            )
+
+        if hasattr(socket, 'TCP_KEEPINTVL'):
+            sock.setsockopt(
+                socket.IPPROTO_TCP,
+                socket.TCP_KEEPINTVL,
+                interval
+            )
+
+        if hasattr(socket, 'TCP_KEEPCNT'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, misses)
+
+        if hasattr(socket, 'SIO_KEEPALIVE_VALS'):
+            # Windows
+            sock.ioctl(
+                socket.SIO_KEEPALIVE_VALS,
+                (1, interval * 1000, interval * 1000)
+            )
+    except (socket.error, AttributeError, ValueError):
+        import traceback
+        logger.debug(traceback.format_exc())
+
+
+def get_trackers(host):
+    """
+    Returns the `Liveness` instances of the remotes of a host.
+
+    :rtype: `list` of `Liveness`
+    """
+    with _trackers_lock:
+        trackers = _trackers.get(host, None)
+        if trackers is None:
+            return []
+
+        trackers = list(trackers)
+        if not trackers:
+            del _trackers[host]
+
+    return trackers
+
+
+def get_tracker(host):
+    """
+    Returns a `Liveness` instance for a host.
+
+    :rtype: `None` or `Liveness`
+    """
+    trackers = get_trackers(host)
+    if trackers:
+        return trackers[0]
+
+
+def ssdp_notify(host, nts, max_age=None):
+    """
+    Feeds an SSDP NOTIFY to the tracker of a host.
+
+    :param host: ip address of the sender
+    :type host: `str`
+    :param nts: NTS header value (``"ssdp:alive"``, ``"ssdp:byebye"``...)
+    :type nts: `str`
+    :param max_age: max-age from the CACHE-CONTROL header
+    :type max_age: `None` or `int`
+    """
+    for tracker in get_trackers(host):
+        if nts == 'ssdp:byebye':
+            tracker.ssdp_byebye()
+        elif nts in ('ssdp:alive', 'ssdp:update'):
+            tracker.ssdp_alive(max_age)
+
+
+def presence_callback(event, device):
+    """
+    Feeds the events of a `upnp.UPNP_Device.listen.Presence` instance to the
+    trackers, see `start_presence`.
+    """
+    if event == 'down':
+        ssdp_notify(device.ip, 'ssdp:byebye')
+    else:
+        ssdp_notify(
+            device.ip,
+            'ssdp:alive',
+            max(device.expires - time.time(), 0)
+        )
+
+
+def start_presence():
+    """
+    Starts feeding the SSDP notifications to the trackers.
+
+    The listener is shared, every call has to be matched by a call to
+    `stop_presence`.
+
+    :rtype: `upnp.UPNP_Device.listen.Presence`
+    """
+    global _presence
+    global _presence_users
+
+    with _presence_lock:
+        _presence_users += 1
+
+        if _presence is None:
+            from .upnp.UPNP_Device.listen import Presence
+
+            _presence = Presence()
+            _presence.register_callback(presence_callback)
+            _presence.start()
+
+        return _presence
+
+
+def stop_presence():
+    """Stops the listener once every `start_presence` has been matched."""
+    global _presence
+    global _presence_users
+
+    with _presence_lock:
+        if not _presence_users:
+            return
+
+        _presence_users -= 1
+        if _presence_users:
+            return
+
+        presence, _presence = _presence, None
+
+    presence.stop(wait=False)
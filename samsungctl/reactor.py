@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shared receive loop for many websocket connections.
+
+Without a reactor every websocket remote runs its own thread that blocks
+in ``recv()``. A `Reactor` watches the sockets of all of its remotes with
+one selector thread, the received messages are handed to a small thread
+pool (in order for every remote) and reconnects are timers instead of
+sleeping threads.
+
+A remote uses the reactor that is installed in the thread that builds
+it::
+
+    with reactor.installed():
+        remote = samsungctl.Remote(config)
+"""
+
+import contextlib
+import heapq
+import itertools
+import logging
+import socket
+import threading
+import time
+from concurrent import futures
+from .executor import SerialExecutor
+
+try:
+    import selectors
+except ImportError:
+    import selectors2 as selectors
+
+logger = logging.getLogger('samsungctl')
+
+_local = threading.local()
+
+
+def current():
+    """
+    The reactor installed in the calling thread.
+
+    :rtype: `None` or `Reactor`
+    """
+    return getattr(_local, 'reactor', None)
+
+
+def _socketpair():
+    if hasattr(socket, 'socketpair'):
+        return socket.socketpair()
+
+    # Windows with Python 2
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client.connect(server.getsockname())
+        conn, _ = server.accept()
+    finally:
+        server.close()
+
+    return conn, client
+
+
+def _run_job(func, args):
+    try:
+        func(*args)
+    except:
+        import traceback
+        logger.error(traceback.format_exc())
+
+
+class Reactor(object):
+
+    # seconds before the first reconnect attempt of a remote that lost its
+    # connection, the attempts after that back off, see
+    # `samsungctl.reconnect`
+    reconnect_interval = 1.0
+
+    # seconds the reactor thread waits for the rest of a frame before it
+    # goes on with the other connections
+    read_timeout = 0.05
+
+    def __init__(self, max_workers=8):
+        """
+        :param max_workers: size of the pool that runs the message handlers
+            and the reconnects.
+        :type max_workers: `int`
+        """
+        self.max_workers = max_workers
+        self._selector = selectors.DefaultSelector()
+        self._executor = futures.ThreadPoolExecutor(max_workers)
+        self._lock = threading.Lock()
+        self._calls = []
+        self._timers = []
+        self._counter = itertools.count()
+        self._remotes = {}
+        self._wake_recv, self._wake_send = _socketpair()
+        self._wake_recv.setblocking(False)
+        self._selector.register(self._wake_recv, selectors.EVENT_READ, None)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @contextlib.contextmanager
+    def installed(self):
+        """
+        Makes the remotes built in the calling thread use this reactor.
+        """
+        previous = current()
+        _local.reactor = self
+        try:
+            yield self
+        finally:
+            _local.reactor = previous
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the reactor thread and the pool."""
+        self._stop_event.set()
+        self._wake()
+
+        if self._thread is not None:
+            self._thread.join(3.0)
+
+        self._executor.shutdown(wait=False)
+
+    def _wake(self):
+        try:
+            self._wake_send.send(b'x')
+        except socket.error:
+            pass
+
+    def call(self, func, *args):
+        """Runs a function in the reactor thread."""
+        with self._lock:
+            self._calls += [(func, args)]
+        self._wake()
+
+    def call_later(self, delay, func, *args):
+        """Runs a function in the reactor thread after `delay` seconds."""
+        with self._lock:
+            heapq.heappush(
+                self._timers,
+                (time.time() + delay, next(self._counter), func, args)
+            )
+        self._wake()
+
+    def submit(self, remote, func, *args):
+        """Runs a function of a remote on the pool, in order."""
+        executor = self._remotes.get(remote, None)
+        if executor is None:
+            # the remote got removed
+            return
+
+        executor.submit(_run_job, func, args)
+
+    def add(self, remote):
+        """Watches the connection of a remote."""
+        if remote not in self._remotes:
+            self._remotes[remote] = SerialExecutor(self._executor)
+
+        self.call(self._register, remote)
+        self.start()
+
+    def remove(self, remote, sock=None):
+        """
+        Stops watching the connection of a remote.
+
+        :param sock: the connection, it gets closed once the selector let
+            go of it so its file descriptor can not be reused before that.
+        """
+        self.call(self._remove, remote, sock)
+
+    def _remove(self, remote, sock):
+        self._unregister(remote)
+        self._remotes.pop(remote, None)
+
+        if sock is not None:
+            try:
+                sock.close()
+            except:
+                pass
+
+    def _register(self, remote):
+        sock = remote.sock
+        if sock is None or not remote._running:
+            return
+
+        self._unregister(remote)
+        try:
+            self._selector.register(sock, selectors.EVENT_READ, remote)
+        except (ValueError, KeyError, socket.error):
+            # the socket got closed in the mean time
+            self._connection_lost(remote, sock)
+            return
+
+        remote._reactor_sock = sock
+        remote._last_received = time.time()
+        remote._pings_unanswered = 0
+
+        if remote.keepalive_interval:
+            self.call_later(
+                remote.keepalive_interval,
+                self._keepalive,
+                remote,
+                sock
+            )
+
+    def _unregister(self, remote):
+        sock = getattr(remote, '_reactor_sock', None)
+        if sock is None:
+            return
+
+        remote._reactor_sock = None
+        try:
+            self._selector.unregister(sock)
+        except (ValueError, KeyError, socket.error):
+            pass
+
+    def _read(self, remote, sock):
+        from websocket import WebSocketTimeoutException
+
+        # a frame that arrived only in part must not block the reactor
+        # thread, websocket-client keeps the part that was read and the
+        # rest gets read the next time the socket is readable
+        gettimeout = getattr(sock, 'gettimeout', None)
+        timeout = None if gettimeout is None else gettimeout()
+        if gettimeout is not None:
+            sock.settimeout(self.read_timeout)
+
+        try:
+            while True:
+                try:
+                    data = remote._recv(sock)
+                except (socket.timeout, WebSocketTimeoutException):
+                    return
+                except:
+                    self._connection_lost(remote, sock)
+                    return
+
+                if data:
+                    self.submit(remote, remote.on_message, data)
+
+                # an SSL socket can hold data the selector does not know of
+                pending = getattr(
+                    getattr(sock, 'sock', None),
+                    'pending',
+                    None
+                )
+                if pending is None or not pending():
+                    return
+        finally:
+            if gettimeout is not None:
+                try:
+                    sock.settimeout(timeout)
+                except:
+                    pass
+
+    def _keepalive(self, remote, sock):
+        if remote._reactor_sock is not sock:
+            # the connection got replaced or closed
+            return
+
+        def keepalive():
+            if remote._keepalive():
+                self.call_later(
+                    remote.keepalive_interval,
+                    self._keepalive,
+                    remote,
+                    sock
+                )
+            else:
+                self.call(self._keepalive_failed, remote, sock)
+
+        self.submit(remote, keepalive)
+
+    def _keepalive_failed(self, remote, sock):
+        if remote._reactor_sock is not sock:
+            return
+
+        self._connection_lost(remote, sock)
+
+        try:
+            sock.close()
+        except:
+            pass
+
+    def _connection_lost(self, remote, sock):
+        self._unregister(remote)
+
+        if remote.sock is sock:
+            remote._connection_lost()
+
+        if remote._running:
+            self._schedule_reconnect(
+                remote,
+                max(self.reconnect_interval, remote.breaker.delay)
+            )
+
+    def wake_reconnect(self, remote):
+        """Makes the reconnect attempt of a remote right away."""
+        self.call(self._schedule_reconnect, remote, 0)
+
+    def _schedule_reconnect(self, remote, delay):
+        # a newer schedule replaces the timer that is pending
+        remote._reconnect_id = token = next(self._counter)
+        self.call_later(delay, self._reconnect, remote, token)
+
+    def _reconnect(self, remote, token):
+        if token != getattr(remote, '_reconnect_id', None):
+            return
+
+        if not remote._running or remote.sock is not None:
+            return
+
+        def reconnect():
+            if not remote._running:
+                return
+
+            if remote._starting:
+                connected = remote.sock is not None
+                delay = self.reconnect_interval
+            else:
+                connected = remote._attempt_open()
+                delay = remote.breaker.delay
+
+            if connected:
+                self.call(self._register, remote)
+            elif remote._running:
+                self.call(self._schedule_reconnect, remote, delay)
+
+        self.submit(remote, reconnect)
+
+    def run(self):
+        try:
+            while not self._stop_event.isSet():
+                with self._lock:
+                    calls = self._calls
+                    self._calls = []
+
+                for func, args in calls:
+                    func(*args)
+
+                now = time.time()
+                wait = None
+
+                while True:
+                    with self._lock:
+                        if not self._timers:
+                            break
+
+                        when, _, func, args = self._timers[0]
+                        if when > now:
+                            wait = when - now
+                            break
+
+                        heapq.heappop(self._timers)
+
+                    func(*args)
+
+                with self._lock:
+                    if self._calls:
+                        wait = 0
+
+                for key, _ in self._selector.select(wait):
+                    if key.data is None:
+                        try:
+                            while self._wake_recv.recv(4096):
+                                pass
+                        except socket.error:
+                            pass
+                        continue
+
+                    self._read(key.data, key.fileobj)
+        except:
+            import traceback
+            logger.error(traceback.format_exc())
+        finally:
+            self._thread = None
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+"""
+Backoff for the reconnects of a TV that went away.
+
+Every host gets one `CircuitBreaker` that is shared by all of the remotes
+of that host. A failed reconnect pushes the next attempt out
+exponentially (with jitter so a fleet of TVs that went off at the same
+time does not retry at the same time) and after `failure_threshold`
+failures in a row the circuit opens: ``open()`` fails right away instead
+of running the HTTP requests that time out while the TV is off.
+
+A presence signal (an SSDP alive, a successful probe, the TV answering
+a power on) wakes the circuit so the next attempt is made right away.
+"""
+
+import logging
+import random
+import threading
+import time
+import weakref
+
+logger = logging.getLogger('samsungctl')
+
+_breakers = weakref.WeakValueDictionary()
+_breakers_lock = threading.Lock()
+
+
+class CircuitBreaker(object):
+
+    # seconds before the second attempt, doubled with every failure
+    base_interval = 1.0
+    # longest time between two attempts
+    max_interval = 300.0
+    factor = 2.0
+    # the delays are spread by this fraction in both directions
+    jitter = 0.25
+    # failures in a row that open the circuit
+    failure_threshold = 3
+
+    def __init__(self, host):
+        self.host = host
+        self.failures = 0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    @property
+    def is_open(self):
+        """
+        `True` while calls fail fast, the host is known to be down.
+
+        :rtype: `bool`
+        """
+        return (
+            self.failures >= self.failure_threshold and
+            time.time() < self._retry_at
+        )
+
+    @property
+    def delay(self):
+        """
+        Seconds until the next attempt is allowed.
+
+        :rtype: `float`
+        """
+        return max(self._retry_at - time.time(), 0.0)
+
+    def failure(self):
+        """
+        Records a failed attempt.
+
+        :return: seconds until the next attempt
+        :rtype: `float`
+        """
+        with self._lock:
+            self.failures += 1
+            delay = min(
+                self.base_interval * self.factor ** (self.failures - 1),
+                self.max_interval
+            )
+            delay *= random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+            self._retry_at = time.time() + delay
+
+            if self.failures == self.failure_threshold:
+                logger.debug('{0}: circuit open'.format(self.host))
+
+        return delay
+
+    def success(self):
+        """Records a successful attempt, closes the circuit."""
+        with self._lock:
+            if self.failures >= self.failure_threshold:
+                logger.debug('{0}: circuit closed'.format(self.host))
+
+            self.failures = 0
+            self._retry_at = 0.0
+
+    def wake(self):
+        """
+        Allows the next attempt right away.
+
+        Called when there is a sign of the host being back, the failure
+        count is kept so the backoff continues if the host is still down.
+        """
+        with self._lock:
+            if not self.failures:
+                return
+
+            self._retry_at = 0.0
+            listeners = self._listeners[:]
+
+        logger.debug('{0}: reconnect woken'.format(self.host))
+
+        for listener in listeners:
+            try:
+                listener()
+            except:
+                import traceback
+                logger.error(traceback.format_exc())
+
+    def add_listener(self, listener):
+        """Calls `listener()` when the circuit gets woken."""
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners += [listener]
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+
+def get_breaker(host):
+    """
+    Returns the `CircuitBreaker` of a host, it gets created if needed.
+
+    :rtype: `CircuitBreaker`
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(host, None)
+        if breaker is None:
+            breaker = CircuitBreaker(host)
+            _breakers[host] = breaker
+
+    return breaker
+
+
+def wake(host):
+    """Wakes the circuit of a host if it has one."""
+    breaker = _breakers.get(host, None)
+    if breaker is not None:
+        breaker.wake()
@@ -1,14 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import sys
 import six
 from . import exceptions
-from .remote_legacy import RemoteLegacy
-from .remote_websocket import RemoteWebsocket
-from .remote_encrypted import RemoteEncrypted
 from .config import Config
+from .executor import Submit
 from .key_mappings import KEYS
-from .upnp import UPNPTV
-from .upnp.discover import discover
 
 
 class KeyWrapper(object):
@@ -20,6 +17,21 @@ class KeyWrapper(object):
         self.key(self.remote)
 
 
+def _release(remote):
+    # the applications, channels and sources of a remote are kept in
+    # registries, a module that did not get imported has nothing stored
+    application = sys.modules.get(__package__ + '.application', None)
+    if application is not None:
+        application.release(remote)
+
+    instance_singleton = sys.modules.get(
+        __package__ + '.upnp.UPNP_Device.instance_singleton',
+        None
+    )
+    if instance_singleton is not None:
+        instance_singleton.InstanceSingleton.release(remote)
+
+
 class RemoteMeta(type):
 
     def __call__(cls, conf):
@@ -27,48 +39,72 @@ class RemoteMeta(type):
         if isinstance(conf, dict):
             conf = Config(**conf)
 
+        # the backends and the UPnP support pull in requests, websocket,
+        # lxml and pycryptodome, they only get imported when they are used
         if conf.method == "legacy":
-            remote = RemoteLegacy
+            from .remote_legacy import RemoteLegacy as remote
         elif conf.method == "websocket":
-            remote = RemoteWebsocket
+            from .remote_websocket import RemoteWebsocket as remote
         elif conf.method == "encrypted":
-            remote = RemoteEncrypted
+            from .remote_encrypted import RemoteEncrypted as remote
         else:
             raise exceptions.ConfigUnknownMethod()
 
-
-        class RemoteWrapper(remote, UPNPTV):
-
-            def __init__(self, config):
-                self.__name__ = config.name
-
-                for name, key in KEYS.items():
-                    self.__dict__[name] = KeyWrapper(self, key)
-
-                remote.__init__(self, config)
-
-                if (
-                    config.upnp_locations is not None
-                    and not config.upnp_locations
-                ):
-                    discover(config)
-
-                if config.upnp_locations:
-                    UPNPTV.__init__(
-                        self,
-                        config.host,
-                        config.upnp_locations
-                    )
-
-                if config.path:
-                    config.save()
-
-            def __enter__(self):
-                self.open()
-                return self
-
-            def __exit__(self, exc_type, exc_val, exc_tb):
-                self.close()
+        if conf.upnp_locations is None:
+            # UPnP is not used
+            bases = (remote, Submit)
+        else:
+            from .upnp import UPNPTV
+            bases = (remote, UPNPTV, Submit)
+
+        def __init__(self, config):
+            self.__name__ = config.name
+
+            for name, key in KEYS.items():
+                self.__dict__[name] = KeyWrapper(self, key)
+
+            remote.__init__(self, config)
+
+            if (
+                config.upnp_locations is not None
+                and not config.upnp_locations
+            ):
+                from .upnp.discover import discover
+                discover(config)
+
+            if config.upnp_locations:
+                UPNPTV.__init__(
+                    self,
+                    config.host,
+                    config.upnp_locations
+                )
+
+            if config.path:
+                config.save()
+
+        def __enter__(self):
+            self.open()
+            return self
+
+        def __exit__(self, exc_type, exc_val, exc_tb):
+            self.close()
+
+        def close(self):
+            try:
+                remote.close(self)
+            finally:
+                _release(self)
+
+        RemoteWrapper = type(
+            'RemoteWrapper',
+            bases,
+            dict(
+                __init__=__init__,
+                __enter__=__enter__,
+                __exit__=__exit__,
+                close=close
+            )
+        )
 
         return RemoteWrapper(conf)
 
@@ -19,7 +19,6 @@ from lxml import etree
 import binascii
 import logging
 import traceback
-from .. import wake_on_lan
 
 
 try:
@@ -30,6 +29,7 @@ except NameError:
 from . import crypto # NOQA
 from .command_encryption import AESCipher # NOQA
 from .. import websocket_base # NOQA
+from .. import writer # NOQA
 from ..upnp.UPNP_Device.xmlns import strip_xmlns # NOQA
 from ..utils import LogIt, LogItWithReturn # NOQA
 
@@ -108,6 +108,7 @@ class URL(object):
 
 
 class RemoteEncrypted(websocket_base.WebSocketBase):
+    _ready_ports = (8000, 8080)
 
     @LogIt
     def __init__(self, config):
@@ -138,6 +139,15 @@ class RemoteEncrypted(websocket_base.WebSocketBase):
         if self.sock is not None:
             return True
 
+        if self.breaker.is_open:
+            # the TV is known to be down, see `samsungctl.reconnect`
+            logger.debug(
+                'circuit open, next attempt in {0:.1f} seconds'.format(
+                    self.breaker.delay
+                )
+            )
+            return False
+
         self._starting = True
 
         power = self.power
@@ -186,17 +196,19 @@ class RemoteEncrypted(websocket_base.WebSocketBase):
 
         websocket_url = self.url.websocket
         if websocket_url is None:
+            self.liveness.connection_closed()
+            self._starting = False
             return False
 
         logger.debug(websocket_url)
 
         self.aes_lib = AESCipher(self.ctx.upper(), self.current_session_id)
         self.sock = websocket.create_connection(websocket_url)
+        self.liveness.connection_opened()
         time.sleep(0.35)
 
         if not self._running:
-            self._thread = threading.Thread(target=self.loop)
-            self._thread.start()
+            self._start_loop()
 
         if not paired and not power:
             self.power = False
@@ -315,46 +327,15 @@ class RemoteEncrypted(websocket_base.WebSocketBase):
         event = threading.Event()
 
         if value and not self.power:
-            if self.mac_address:
-                count = 0
-                wake_on_lan.send_wol(self.mac_address)
-                event.wait(1.0)
-
-                while not self.power and count < 20:
-                    if not self._running:
-                        try:
-                            self.open()
-                        except:
-                            pass
-                    wake_on_lan.send_wol(self.mac_address)
-                    event.wait(1.0)
-
-                    count += 1
-
-                if count == 20:
-                    logger.error(
-                        'Unable to power on the TV, '
-                        'check network connectivity'
-                    )
-            else:
-                logging.error('Unable to get TV\'s mac address')
+            self.power_on()
 
         elif not value and self.power:
             count = 0
             event = threading.Event()
 
-            self.sock.send('1::/com.samsung.companion')
-            time.sleep(0.35)
-
-            self.sock.send(self.aes_lib.generate_command('KEY_POWER'))
-            time.sleep(0.35)
+            self._send_key('KEY_POWER', writer.PRIORITY_POWER)
             event.wait(2.0)
-
-            self.sock.send('1::/com.samsung.companion')
-            time.sleep(0.35)
-
-            self.sock.send(self.aes_lib.generate_command('KEY_POWEROFF'))
-            time.sleep(0.35)
+            self._send_key('KEY_POWEROFF', writer.PRIORITY_POWER)
 
             while self.power and count < 10:
                 event.wait(1.0)
@@ -365,20 +346,40 @@ class RemoteEncrypted(websocket_base.WebSocketBase):
 
     power = property(fget=websocket_base.WebSocketBase.power, fset=power)
 
+    def _send_key(self, key, priority):
+        command = self.aes_lib.generate_command(key)
+
+        def write(sock):
+            # the two frames of a key can not have another write between
+            # them
+            sock.send('1::/com.samsung.companion')
+            time.sleep(0.35)
+            sock.send(command)
+            time.sleep(0.35)
+
+        self._write(write, priority)
+
     @LogItWithReturn
     def control(self, key):
         if key == 'KEY_POWERON':
             if not self.power:
-                self.power = True
+                # the keys that follow get queued until the TV is on
+                self.power_on(block=False)
             return
         elif key == 'KEY_POWEROFF':
             if self.power:
                 self.power = False
             return
         elif key == 'KEY_POWER':
-            self.power = not self.power
+            if self.power:
+                self.power = False
+            else:
+                self.power_on(block=False)
             return
 
+        elif self._queue_command(key):
+            return True
+
         elif self.sock is None:
             if not self.config.paired:
                 self.open()
@@ -386,11 +387,7 @@ class RemoteEncrypted(websocket_base.WebSocketBase):
                 logger.info('Is the TV on?!?')
                 return False
         try:
-            self.sock.send('1::/com.samsung.companion')
-            time.sleep(0.35)
-
-            self.sock.send(self.aes_lib.generate_command(key))
-            time.sleep(0.35)
+            self._send_key(key, writer.PRIORITY_KEY)
             return True
         except:
             traceback.print_exc()
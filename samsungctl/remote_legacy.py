@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import base64
+import errno
 import logging
 import socket
 import time
@@ -8,6 +9,7 @@ import codecs
 import threading
 import sys
 from . import exceptions
+from . import liveness
 from .utils import LogIt, LogItWithReturn
 
 logger = logging.getLogger('samsungctl')
@@ -16,12 +18,19 @@ logger = logging.getLogger('samsungctl')
 class RemoteLegacy(object):
     """Object for remote control connection."""
 
+    # seconds of silence before the TCP keepalive probes start and the
+    # number of unanswered probes that drop the connection, `None` turns
+    # the keepalive off
+    keepalive_interval = 10
+    keepalive_misses = 2
+
     @LogIt
     def __init__(self, config):
         """Make a new connection."""
         self.sock = None
         self.config = config
         self._starting = True
+        self.liveness = liveness.Liveness(config)
 
     @property
     @LogItWithReturn
@@ -34,20 +43,21 @@ class RemoteLegacy(object):
                 return False
 
         elif self.sock is not None:
-            self.sock.self.sock.setblocking(0)
+            timeout = self.sock.gettimeout()
+            self.sock.setblocking(0)
             try:
-                self.sock.recv(2048)
-                self.sock.self.sock.setblocking(1)
+                # an open connection has nothing to read, a closed one
+                # returns an empty string
+                closed = not self.sock.recv(2048)
+            except socket.error as err:
+                closed = err.errno not in (errno.EAGAIN, errno.EWOULDBLOCK)
+
+            if not closed:
+                self.sock.settimeout(timeout)
                 return True
 
-            except socket.error:
-                try:
-                    self.sock.close()
-                except socket.error:
-                    pass
-
-                self.sock = None
-                return False
+            self._connection_lost()
+            return False
 
         return False
 
@@ -62,6 +72,16 @@ class RemoteLegacy(object):
                 self.control('KEY_POWEROFF')
                 event.wait(2.0)
 
+    def _connection_lost(self):
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+
+        self.sock = None
+        self.liveness.connection_closed()
+        logger.info('Connection lost.')
+
     @LogIt
     def open(self):
         self._starting = True
@@ -75,6 +95,7 @@ class RemoteLegacy(object):
         try:
             self.sock.connect((self.config.host, self.config.port))
         except socket.error:
+            self.liveness.connection_closed()
             if not self.config.paired:
                 raise RuntimeError('Unable to pair with TV.. Is the TV on?!?')
             else:
@@ -82,6 +103,15 @@ class RemoteLegacy(object):
                 self.sock = None
                 return
 
+        if self.keepalive_interval:
+            # a TV that got unplugged makes the socket fail, the power
+            # check notices that
+            liveness.set_keepalive(
+                self.sock,
+                self.keepalive_interval,
+                self.keepalive_misses
+            )
+
         payload = (
             b"\x64\x00" +
             self._serialize_string(self.config.description) +
@@ -93,6 +123,7 @@ class RemoteLegacy(object):
         logger.info("Sending handshake.")
         self.sock.send(packet)
         self._read_response(True)
+        self.liveness.connection_opened()
         self._starting = False
 
     @LogIt
@@ -101,6 +132,7 @@ class RemoteLegacy(object):
         if self.sock:
             self.sock.close()
             self.sock = None
+            self.liveness.expire()
             logging.debug("Connection closed.")
 
     @LogIt
@@ -114,12 +146,38 @@ class RemoteLegacy(object):
         packet = b"\x00\x00\x00" + self._serialize_string(payload, True)
 
         logger.info("Sending control command: %s", key)
-        self.sock.send(packet)
-        self._read_response()
+        try:
+            self.sock.send(packet)
+            self._read_response()
+        except socket.error:
+            self._connection_lost()
+            raise
+
         time.sleep(self._key_interval)
 
     _key_interval = 0.2
 
+    def _stage_key(self, key):
+        """
+        Builds the packet of a key so it can be written later without any
+        other work, see `samsungctl.broadcast`.
+
+        :return: `None` if the TV is not connected, otherwise a function
+            that writes the packet and a function to call after that
+        :rtype: `None` or `tuple`
+        """
+        sock = self.sock
+        if not sock:
+            return None
+
+        payload = b"\x00\x00\x00" + self._serialize_string(key)
+        packet = b"\x00\x00\x00" + self._serialize_string(payload, True)
+
+        def write():
+            sock.sendall(packet)
+
+        return write, self._read_response
+
     @LogIt
     def _read_response(self, first_time=False):
         header = self.sock.recv(3)
@@ -133,7 +191,7 @@ class RemoteLegacy(object):
         response = self.sock.recv(response_len)
 
         if len(response) == 0:
-            self.close()
+            self._connection_lost()
             raise exceptions.ConnectionClosed()
 
         if response == b"\x64\x00\x01\x00":
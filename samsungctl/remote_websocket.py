@@ -13,7 +13,7 @@ import socket
 from . import exceptions
 from . import application
 from . import websocket_base
-from . import wake_on_lan
+from . import writer
 from .utils import LogIt, LogItWithReturn
 
 logger = logging.getLogger('samsungctl')
@@ -28,7 +28,12 @@ class RemoteWebsocket(websocket_base.WebSocketBase):
 
     @LogIt
     def __init__(self, config):
-        self.receive_lock = threading.Lock()
+        # held while the connection gets opened and paired, the writes
+        # go through `self.writer` and the voice requests that wait for
+        # an answer hold `_request_lock`, a slow request does not hold
+        # up a key
+        self._connection_lock = threading.RLock()
+        self._request_lock = threading.Lock()
         self.send_event = threading.Event()
         websocket_base.WebSocketBase.__init__(self, config)
 
@@ -53,8 +58,17 @@ class RemoteWebsocket(websocket_base.WebSocketBase):
         if self.sock is not None:
             return True
 
+        if self.breaker.is_open:
+            # the TV is known to be down, see `samsungctl.reconnect`
+            logger.debug(
+                'circuit open, next attempt in {0:.1f} seconds'.format(
+                    self.breaker.delay
+                )
+            )
+            return False
+
         self._starting = True
-        with self.receive_lock:
+        with self._connection_lock:
             power = self.power
 
             if not self.config.paired and not power:
@@ -95,7 +109,9 @@ class RemoteWebsocket(websocket_base.WebSocketBase):
 
             try:
                 self.sock = websocket.create_connection(url, sslopt=sslopt)
+                self.liveness.connection_opened()
             except:
+                self.liveness.connection_closed()
                 if not self.config.paired:
                     raise RuntimeError('Unable to connect to the TV')
 
@@ -168,8 +184,7 @@ class RemoteWebsocket(websocket_base.WebSocketBase):
             )
 
             if not self._running:
-                self._thread = threading.Thread(target=self.loop)
-                self._thread.start()
+                self._start_loop()
 
                 if self.config.paired:
                     auth_event.wait(5.0)
@@ -196,6 +211,9 @@ class RemoteWebsocket(websocket_base.WebSocketBase):
 
     @LogIt
     def send(self, method, **params):
+        self._send_message(method, params, writer.PRIORITY_MESSAGE)
+
+    def _send_message(self, method, params, priority):
         if self.sock is None:
             if method != 'ms.remote.control':
                 if self.power:
@@ -203,41 +221,65 @@ class RemoteWebsocket(websocket_base.WebSocketBase):
                 else:
                     logger.info('Is the TV on?!?')
 
-        payload = dict(
-            method=method,
-            params=params
+        payload = json.dumps(
+            dict(
+                method=method,
+                params=params
+            )
+        )
+
+        def write(sock):
+            sock.send(payload)
+            # gives the TV a moment before the next write
+            self.send_event.wait(0.3)
+
+        self._write(write, priority)
+
+    def _stage_message(self, method, **params):
+        """
+        Builds the frame of a message so it can be written later without
+        any other work, see `samsungctl.broadcast`.
+
+        :return: `None` if the TV is not connected, otherwise a function
+            that writes the frame and a function to call after that
+        :rtype: `None` or `tuple`
+        """
+        sock = self.sock
+        if sock is None:
+            return None
+
+        frame = websocket.ABNF.create_frame(
+            json.dumps(dict(method=method, params=params)),
+            websocket.ABNF.OPCODE_TEXT
+        ).format()
+
+        raw_sock = sock.sock
+        lock = getattr(sock, 'lock', None)
+
+        def write():
+            if lock is None:
+                raw_sock.sendall(frame)
+            else:
+                with lock:
+                    raw_sock.sendall(frame)
+
+        return write, None
+
+    def _stage_key(self, key):
+        return self._stage_message(
+            'ms.remote.control',
+            Cmd='Click',
+            DataOfCmd=key,
+            Option="false",
+            TypeOfRemote="SendRemoteKey"
         )
-        self.sock.send(json.dumps(payload))
-        self.send_event.wait(0.3)
 
     @LogIt
     def power(self, value):
         event = threading.Event()
 
         if value and not self.power:
-            if self.mac_address:
-                count = 0
-                wake_on_lan.send_wol(self.mac_address)
-                event.wait(1.0)
-
-                while not self.power and count < 20:
-                    if not self._running:
-                        try:
-                            self.open()
-                        except:
-                            pass
-                    wake_on_lan.send_wol(self.mac_address)
-                    event.wait(1.0)
-
-                    count += 1
-
-                if count == 20:
-                    logger.error(
-                        'Unable to power on the TV, '
-                        'check network connectivity'
-                    )
-            else:
-                logging.error('Unable to get TV\'s mac address')
+            self.power_on()
 
         elif not value and self.power:
             if self.sock is None:
@@ -258,9 +300,17 @@ class RemoteWebsocket(websocket_base.WebSocketBase):
             )
 
             logger.info("Sending control command: " + str(power))
-            self.send("ms.remote.control", **power)
+            self._send_message(
+                "ms.remote.control",
+                power,
+                writer.PRIORITY_POWER
+            )
             logger.info("Sending control command: " + str(power_off))
-            self.send("ms.remote.control", **power_off)
+            self._send_message(
+                "ms.remote.control",
+                power_off,
+                writer.PRIORITY_POWER
+            )
 
             while self.power and count < 10:
                 event.wait(1.0)
@@ -283,14 +333,21 @@ class RemoteWebsocket(websocket_base.WebSocketBase):
 
         if key == 'KEY_POWERON':
             if not self.power:
-                self.power = True
+                # the keys that follow get queued until the TV is on
+                self.power_on(block=False)
             return
         elif key == 'KEY_POWEROFF':
             if self.power:
                 self.power = False
             return
         elif key == 'KEY_POWER':
-            self.power = not self.power
+            if self.power:
+                self.power = False
+            else:
+                self.power_on(block=False)
+            return
+
+        elif self._queue_command(key, cmd):
             return
 
         elif self.sock is None:
@@ -300,16 +357,24 @@ class RemoteWebsocket(websocket_base.WebSocketBase):
 
             self.open()
 
-        with self.receive_lock:
-            params = dict(
-                Cmd=cmd,
-                DataOfCmd=key,
-                Option="false",
-                TypeOfRemote="SendRemoteKey"
-            )
+        elif self._starting:
+            # the TV drops a key sent before it accepted the connection
+            with self._connection_lock:
+                pass
 
-            logger.info("Sending control command: " + str(params))
-            self.send("ms.remote.control", **params)
+        params = dict(
+            Cmd=cmd,
+            DataOfCmd=key,
+            Option="false",
+            TypeOfRemote="SendRemoteKey"
+        )
+
+        logger.info("Sending control command: " + str(params))
+        self._send_message(
+            "ms.remote.control",
+            params,
+            writer.PRIORITY_KEY
+        )
 
     _key_interval = 0.5
 
@@ -579,7 +644,7 @@ class RemoteWebsocket(websocket_base.WebSocketBase):
     @LogIt
     def start_voice_recognition(self):
         """Activates voice recognition."""
-        with self.receive_lock:
+        with self._request_lock:
             event = threading.Event()
 
             def voice_callback(_):
@@ -615,7 +680,7 @@ class RemoteWebsocket(websocket_base.WebSocketBase):
     def stop_voice_recognition(self):
         """Activates voice recognition."""
 
-        with self.receive_lock:
+        with self._request_lock:
             event = threading.Event()
 
             def voice_callback(_):
@@ -747,70 +812,74 @@ class Mouse(object):
 
             self._is_running = True
 
-            with self._remote.receive_lock:
+            @LogIt
+            def ime_start(_):
+                self._ime_start_event.set()
 
-                @LogIt
-                def ime_start(_):
-                    self._ime_start_event.set()
+            @LogIt
+            def ime_update(_):
+                self._ime_update_event.set()
 
-                @LogIt
-                def ime_update(_):
-                    self._ime_update_event.set()
+            @LogIt
+            def touch_enable(_):
+                self._touch_enable_event.set()
 
-                @LogIt
-                def touch_enable(_):
-                    self._touch_enable_event.set()
-
-                self._remote.register_receive_callback(
-                    ime_start,
-                    'event',
-                    'ms.remote.imeStart'
-                )
+            self._remote.register_receive_callback(
+                ime_start,
+                'event',
+                'ms.remote.imeStart'
+            )
 
-                self._remote.register_receive_callback(
-                    ime_update,
-                    'event',
-                    'ms.remote.imeUpdate'
-                )
+            self._remote.register_receive_callback(
+                ime_update,
+                'event',
+                'ms.remote.imeUpdate'
+            )
 
-                self._remote.register_receive_callback(
-                    touch_enable,
-                    'event',
-                    'ms.remote.touchEnable'
-                )
+            self._remote.register_receive_callback(
+                touch_enable,
+                'event',
+                'ms.remote.touchEnable'
+            )
 
-                for payload in self._commands:
-                    if isinstance(payload, (float, int)):
-                        self._send_event.wait(payload)
-                        if self._send_event.isSet():
-                            self._is_running = False
-                            return
-                    else:
-                        logger.info(
-                            "Sending mouse control command: " + str(payload)
-                        )
-                        self._remote.sock.send(payload)
+            for payload in self._commands:
+                if isinstance(payload, (float, int)):
+                    self._send_event.wait(payload)
+                    if self._send_event.isSet():
+                        self._is_running = False
+                        return
+                else:
+                    logger.info(
+                        "Sending mouse control command: " + str(payload)
+                    )
+                    # the moves queue up behind the keys other threads
+                    # send in the mean time
+                    self._remote._write(
+                        lambda sock, payload=payload: sock.send(payload),
+                        writer.PRIORITY_BULK,
+                        wait=False
+                    )
 
-                self._ime_start_event.wait(len(self._commands))
-                self._ime_update_event.wait(len(self._commands))
-                self._touch_enable_event.wait(len(self._commands))
+            self._ime_start_event.wait(len(self._commands))
+            self._ime_update_event.wait(len(self._commands))
+            self._touch_enable_event.wait(len(self._commands))
 
-                self._remote.unregister_receive_callback(
-                    ime_start,
-                    'event',
-                    'ms.remote.imeStart'
-                )
+            self._remote.unregister_receive_callback(
+                ime_start,
+                'event',
+                'ms.remote.imeStart'
+            )
 
-                self._remote.unregister_receive_callback(
-                    ime_update,
-                    'event',
-                    'ms.remote.imeUpdate'
-                )
+            self._remote.unregister_receive_callback(
+                ime_update,
+                'event',
+                'ms.remote.imeUpdate'
+            )
 
-                self._remote.unregister_receive_callback(
-                    touch_enable,
-                    'event',
-                    'ms.remote.touchEnable'
-                )
+            self._remote.unregister_receive_callback(
+                touch_enable,
+                'event',
+                'ms.remote.touchEnable'
+            )
 
-                self._is_running = False
+            self._is_running = False
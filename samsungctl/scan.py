@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+"""
+TCP port scan of a network for when SSDP multicast does not reach the TVs.
+"""
+
+import errno
+import logging
+import socket
+import struct
+import time
+from concurrent import futures
+
+try:
+    import selectors
+except ImportError:
+    import selectors2 as selectors
+
+import requests
+from lxml import etree
+
+from . import exceptions
+from . import autodetect
+from .config import Config
+from .upnp.discover import _get_connection, MAX_WORKERS
+from .upnp.UPNP_Device.discover import discover as _discover
+
+logger = logging.getLogger('samsungctl')
+
+# ports a Samsung TV listens on
+#   55000: legacy remote
+#   8001/8002: websocket remote
+#   8080: encrypted remote
+#   7676/9197: UPnP
+PORTS = (55000, 8001, 8002, 8080, 7676, 9197)
+
+# time a single connect attempt gets
+CONNECT_TIMEOUT = 0.5
+
+# number of connect attempts in flight at the same time
+MAX_SOCKETS = 256
+
+# time the unicast SSDP search of the candidates gets
+SSDP_TIMEOUT = 1.0
+
+_IN_PROGRESS = (
+    errno.EINPROGRESS,
+    errno.EWOULDBLOCK,
+    errno.EAGAIN,
+    10035  # WSAEWOULDBLOCK
+)
+
+
+def get_hosts(network):
+    """
+    Host addresses of a network.
+
+    :param network: network in CIDR notation (``"192.168.1.0/24"``) or a
+        single address
+    :type network: `str`
+    :rtype: `list` of `str`
+    """
+    if '/' in network:
+        address, prefix = network.split('/', 1)
+    else:
+        address, prefix = network, '32'
+
+    try:
+        prefix = int(prefix)
+        address = struct.unpack('!I', socket.inet_aton(address))[0]
+    except (ValueError, socket.error, struct.error):
+        raise exceptions.ScanNetworkError(network)
+
+    if not 0 <= prefix <= 32:
+        raise exceptions.ScanNetworkError(network)
+
+    mask = (0xFFFFFFFF << (32 - prefix)) & 0xFFFFFFFF
+    first = address & mask
+    last = first | (~mask & 0xFFFFFFFF)
+
+    if prefix < 31:
+        # skip the network and broadcast addresses
+        first += 1
+        last -= 1
+
+    return list(
+        socket.inet_ntoa(struct.pack('!I', host))
+        for host in range(first, last + 1)
+    )
+
+
+def probe_ports(
+    hosts,
+    ports=PORTS,
+    timeout=5.0,
+    connect_timeout=CONNECT_TIMEOUT,
+    max_sockets=MAX_SOCKETS
+):
+    """
+    Checks which of the ports accept a connection.
+
+    All of the connects are non blocking and serviced by one selector, at
+    most `max_sockets` of them are in flight at the same time.
+
+    :param hosts: addresses to probe
+    :type hosts: iterable of `str`
+    :param ports: ports to probe on every host
+    :type ports: iterable of `int`
+    :param timeout: the probing stops after this many seconds
+    :type timeout: `float`
+    :param connect_timeout: time a single connect attempt gets
+    :type connect_timeout: `float`
+    :param max_sockets: number of connects in flight at the same time
+    :type max_sockets: `int`
+    :return: ``{ip: set of open ports}``, hosts without an open port are
+        left out
+    :rtype: `dict`
+    """
+    targets = iter(list((host, port) for host in hosts for port in ports))
+    selector = selectors.DefaultSelector()
+    in_flight = {}
+    found = {}
+    deadline = time.time() + timeout
+
+    def finish(sock, is_open):
+        host, port, _ = in_flight.pop(sock)
+        try:
+            selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        sock.close()
+
+        if is_open:
+            logger.debug('scan: {0}:{1} is open'.format(host, port))
+            found.setdefault(host, set()).add(port)
+
+    try:
+        exhausted = False
+
+        while True:
+            now = time.time()
+
+            while not exhausted and len(in_flight) < max_sockets:
+                try:
+                    host, port = next(targets)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.setblocking(False)
+                in_flight[sock] = (host, port, now + connect_timeout)
+
+                try:
+                    err = sock.connect_ex((host, port))
+                except socket.error:
+                    err = -1
+
+                if err == 0:
+                    finish(sock, True)
+                elif err in _IN_PROGRESS:
+                    selector.register(sock, selectors.EVENT_WRITE)
+                else:
+                    finish(sock, False)
+
+            if not in_flight or now >= deadline:
+                break
+
+            wake = min(
+                [deadline] +
+                list(expires for _, _, expires in in_flight.values())
+            )
+
+            for key, _ in selector.select(max(wake - time.time(), 0)):
+                sock = key.fileobj
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                finish(sock, err == 0)
+
+            now = time.time()
+            for sock, (_, _, expires) in list(in_flight.items()):
+                if now >= expires:
+                    finish(sock, False)
+    finally:
+        for sock in list(in_flight.keys()):
+            finish(sock, False)
+
+        selector.close()
+
+    return found
+
+
+def _confirm(ip, ports, locations):
+    """
+    Confirms that a host is a Samsung TV.
+
+    :return: `None` if the host is not a Samsung TV
+    :rtype: `None` or `Config`
+    """
+    connection = None
+
+    if ports & {8001, 8002}:
+        verdict = autodetect.detect(ip)
+        if verdict is not None and verdict.device_info is not None:
+            connection = verdict.method, verdict.port
+
+    if connection is None and locations:
+        try:
+            connection = _get_connection(ip, locations[0])
+        except (requests.RequestException, ValueError, etree.XMLSyntaxError):
+            connection = None
+
+    if connection is None:
+        return None
+
+    method, port = connection
+    return Config(
+        host=ip,
+        method=method,
+        port=port,
+        upnp_locations=locations
+    )
+
+
+def scan(network, timeout=5.0, max_workers=MAX_WORKERS):
+    """
+    Finds the Samsung TVs on a network without using SSDP multicast.
+
+    Every host of the network gets probed on the ports in `PORTS`. The
+    hosts that have one of them open get a unicast SSDP search and are
+    then confirmed through the websocket API or their UPnP description.
+
+    :param network: network in CIDR notation (``"192.168.1.0/24"``)
+    :type network: `str`
+    :param timeout: time the port probe gets in seconds
+    :type timeout: `float`
+    :param max_workers: number of hosts confirmed at the same time
+    :type max_workers: `int`
+    :rtype: `list` of `Config` instances
+    """
+    candidates = probe_ports(get_hosts(network), timeout=timeout)
+    if not candidates:
+        return []
+
+    locations = dict(
+        _discover(SSDP_TIMEOUT, search_ips=tuple(candidates.keys()))
+    )
+
+    executor = futures.ThreadPoolExecutor(max_workers)
+    try:
+        jobs = list(
+            executor.submit(_confirm, ip, ports, locations.get(ip, None))
+            for ip, ports in candidates.items()
+        )
+        found = list(job.result() for job in jobs)
+    finally:
+        executor.shutdown(wait=False)
+
+    return list(config for config in found if config is not None)
@@ -11,7 +11,7 @@ logging.basicConfig(format="%(message)s", level=None)
 
 
 from .discover import discover as _discover # NOQA
-from .listen import listen # NOQA
+from .listen import listen, Presence # NOQA
 from .upnp_class import UPNPObject # NOQA
 
 
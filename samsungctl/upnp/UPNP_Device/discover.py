@@ -2,15 +2,25 @@
 
 from __future__ import print_function
 import socket
-import threading
+import errno
+import time
 import ifaddr
-import ipaddress
 import sys
 import os
 
 import logging
 import json
 
+try:
+    import selectors
+except ImportError:
+    import selectors2 as selectors
+
+try:
+    from .ssdp_cache import SSDPCache
+except (ImportError, ValueError):
+    from ssdp_cache import SSDPCache
+
 logger = logging.getLogger('UPNP_Devices')
 
 if sys.platform.startswith('win'):
@@ -20,10 +30,14 @@ else:
 
 IPV4_MCAST_GRP = "239.255.255.250"
 IPV6_MCAST_GRP = "[ff02::c]"
+SSDP_PORT = 1900
+
+# MX value of the search requests, a device answers within this many seconds
+SSDP_MX = 1
 
 IPV4_SSDP = '''\
 M-SEARCH * HTTP/1.1\r
-ST: upnp:rootdevice\r
+ST: {st}\r
 MAN: "ssdp:discover"\r
 HOST: 239.255.255.250:1900\r
 MX: 1\r
@@ -33,7 +47,7 @@ Content-Length: 0\r
 
 IPV6_SSDP = '''\
 M-SEARCH * HTTP/1.1\r
-ST: upnp:rootdevice\r
+ST: {st}\r
 MAN: "ssdp:discover"\r
 HOST: [ff02::c]:1900\r
 MX: 1\r
@@ -41,19 +55,28 @@ Content-Length: 0\r
 \r
 '''
 
+# how many times the multicast search gets sent and the time between them
+SEARCH_REPEAT = 2
+SEARCH_INTERVAL = 0.25
 
-def discover(timeout=5, log_level=None, search_ips=(), dump=''):
-    if dump and not os.path.exists(dump):
-        os.makedirs(dump)
+# process wide cache of the search results
+cache = SSDPCache()
+
+# a device gets reported once it has not announced a new location for
+# this long and the MX window of the unicast search sent to it has passed.
+SETTLE_TIME = 0.3
+
+# a host that was searched for is reported once it has not announced a new
+# location for this long, the device answers a unicast search right away.
+TARGET_SETTLE_TIME = 0.15
 
-    if log_level is not None:
-        logging.basicConfig(format="%(message)s", level=log_level)
-        if log_level is not None:
-            logger.setLevel(log_level)
 
-    found = {}
-    found_event = threading.Event()
-    threads = []
+def get_adapter_ips():
+    """
+    IPv4 addresses of the local network adapters.
+
+    :rtype: `list` of `str`
+    """
     adapter_ips = []
 
     for adapter in ifaddr.get_adapters():
@@ -62,191 +85,412 @@ def discover(timeout=5, log_level=None, search_ips=(), dump=''):
                 isinstance(adapter_ip.ip, tuple) or
                 adapter_ip.nice_name == 'lo0'
             ):
-                # adapter_ips += [adapter_ip.ip[0]]
                 continue
             else:
                 adapter_ips += [adapter_ip.ip]
 
-    def convert_ssdp_response(packet, addr):
-        packet_type, packet = packet.decode('utf-8').split('\n', 1)
-        if '200 OK' in packet_type:
-            packet_type = 'response'
-        elif 'MSEARCH' in packet_type:
-            packet_type = 'search'
-        elif 'NOTIFY' in packet_type:
-            packet_type = 'notify'
-        else:
-            packet_type = 'unknown'
-
-        packet = dict(
-            (
-                line.split(':', 1)[0].strip().upper(),
-                line.split(':', 1)[1].strip()
-            ) for line in packet.split('\n') if line.strip()
-        )
-
-        packet['TYPE'] = packet_type
+    return adapter_ips
 
-        if dump:
-            with open(os.path.join(dump, 'SSDP.log'), 'a') as f:
-                f.write(json.dumps(packet, indent=4) + '\n')
 
-        logger.debug('SSDP: inbound packet for IP ' + addr)
-        logger.debug(json.dumps(packet, indent=4))
-
-        return packet
-
-    def send_to(destination, t_out=5):
-        try:
-            network = ipaddress.ip_network(destination.decode('utf-8'))
-        except:
-            network = ipaddress.ip_network(destination)
-
-        if isinstance(network, ipaddress.IPv6Network):
-            mcast = IPV6_MCAST_GRP
-            ssdp_packet = IPV6_SSDP
-            sock = socket.socket(
-                family=socket.AF_INET6,
-                type=socket.SOCK_DGRAM,
-                proto=socket.IPPROTO_IP
-            )
-            sock.setsockopt(IPPROTO_IPV6, socket.IPV6_MULTICAST_HOPS, 1)
-
-        else:
-            mcast = IPV4_MCAST_GRP
-            ssdp_packet = IPV4_SSDP
+def convert_ssdp_response(packet, addr, dump=''):
+    packet_type, packet = packet.decode('utf-8').split('\n', 1)
+    if '200 OK' in packet_type:
+        packet_type = 'response'
+    elif 'M-SEARCH' in packet_type:
+        packet_type = 'search'
+    elif 'NOTIFY' in packet_type:
+        packet_type = 'notify'
+    else:
+        packet_type = 'unknown'
+
+    packet = dict(
+        (
+            line.split(':', 1)[0].strip().upper(),
+            line.split(':', 1)[1].strip()
+        ) for line in packet.split('\n') if ':' in line
+    )
+
+    packet['TYPE'] = packet_type
+
+    if dump:
+        with open(os.path.join(dump, 'SSDP.log'), 'a') as f:
+            f.write(json.dumps(packet, indent=4) + '\n')
+
+    logger.debug('SSDP: inbound packet for IP ' + addr)
+    logger.debug(json.dumps(packet, indent=4))
+
+    return packet
+
+
+def get_udn(usn):
+    """
+    UDN part of an USN (``"uuid:..."``).
+
+    :rtype: `str`
+    """
+    return usn.split('::')[0]
+
+
+class _Host(object):
+
+    def __init__(self, ip, probe_time, targeted=False, expected=0):
+        """
+        :param targeted: the host was searched for
+        :param expected: number of root device locations the host had the
+            last time it was seen, the host is reported as soon as it has
+            announced this many.
+        """
+        self.ip = ip
+        self.probe_time = probe_time
+        self.last_seen = probe_time
+        self.targeted = targeted
+        self.expected = expected
+        self.packets = {}
+        self.locations = []
+        self.reported = False
+
+    def add(self, packet, now):
+        location = packet['LOCATION']
+        if location in self.packets:
+            return False
+
+        self.packets[location] = packet
+        self.locations += [location]
+        self.last_seen = now
+        return True
+
+    @property
+    def is_complete(self):
+        return bool(self.expected) and len(self.locations) >= self.expected
+
+    def is_settled(self, now):
+        return now >= self.settle_time
+
+    @property
+    def settle_time(self):
+        if self.targeted:
+            if self.is_complete:
+                return self.last_seen
+
+            return self.last_seen + TARGET_SETTLE_TIME
+
+        return max(self.probe_time + SSDP_MX, self.last_seen + SETTLE_TIME)
+
+
+class SSDPSearch(object):
+    """
+    Single threaded SSDP search.
+
+    One socket per local adapter sends the multicast search and a single
+    socket sends the unicast searches, all of them are serviced by one
+    selector. The root device locations are de-duplicated by USN and a
+    host is handed out as soon as it has finished answering.
+
+    A search for `search_ips` and/or `search_udns` only reports those
+    devices and ends as soon as all of them have answered. A device that
+    is searched for by UDN is found at whatever address it has now.
+    """
+
+    def __init__(self, timeout=5, search_ips=(), dump='', search_udns=()):
+        self.timeout = timeout
+        self.search_ips = tuple(search_ips)
+        self.search_udns = tuple(search_udns)
+        self.dump = dump
+        self.hosts = {}
+        # UDN -> ip of the devices found by UDN
+        self.udn_ips = {}
+        self._usns = set()
+        self._selector = None
+        self._multicast_socks = []
+        self._unicast_sock = None
+
+    def _open(self):
+        self._selector = selectors.DefaultSelector()
+
+        for adapter_ip in get_adapter_ips():
             sock = socket.socket(
                 family=socket.AF_INET,
                 type=socket.SOCK_DGRAM,
                 proto=socket.IPPROTO_UDP
             )
-            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+                sock.setsockopt(
+                    socket.IPPROTO_IP,
+                    socket.IP_MULTICAST_IF,
+                    socket.inet_aton(adapter_ip)
+                )
+                sock.bind((adapter_ip, 0))
+            except socket.error:
+                logger.debug('SSDP: unable to bind to ' + adapter_ip)
+                sock.close()
+                continue
 
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setblocking(False)
+            self._selector.register(sock, selectors.EVENT_READ)
+            self._multicast_socks += [sock]
 
-        if destination in adapter_ips:
-            sock.bind((destination, 0))
-            destination = mcast
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        self._selector.register(sock, selectors.EVENT_READ)
+        self._unicast_sock = sock
+
+    def _close(self):
+        if self._selector is None:
+            return
+
+        for sock in self._multicast_socks + [self._unicast_sock]:
+            try:
+                self._selector.unregister(sock)
+            except (KeyError, ValueError):
+                pass
+
+            try:
+                sock.close()
+            except socket.error:
+                pass
+
+        self._selector.close()
+        self._selector = None
+        del self._multicast_socks[:]
+        self._unicast_sock = None
+
+    @staticmethod
+    def _send(sock, destination, st='upnp:rootdevice'):
+        packet = IPV4_SSDP.format(st=st)
+        logger.debug('SSDP: %s\n%s', destination, packet)
+        try:
+            sock.sendto(packet.encode('utf-8'), (destination, SSDP_PORT))
+        except socket.error:
+            logger.debug('SSDP: unable to send to ' + destination)
+
+    @property
+    def is_targeted(self):
+        return bool(self.search_ips or self.search_udns)
+
+    def _is_target(self, ip, usn):
+        if not self.is_targeted:
+            return True
+
+        if ip in self.search_ips or ip in self.udn_ips.values():
+            return True
+
+        udn = get_udn(usn)
+        if udn in self.search_udns:
+            logger.debug('SSDP: found {0} at {1}'.format(udn, ip))
+            self.udn_ips[udn] = ip
+            return True
+
+        return False
+
+    def _read(self, sock, now):
+        while True:
+            try:
+                data, addr = sock.recvfrom(4096)
+            except socket.error as err:
+                if err.args and err.args[0] in (
+                    errno.EAGAIN,
+                    errno.EWOULDBLOCK
+                ):
+                    return
+                # windows reports ICMP port unreachable as a recv error
+                logger.debug('SSDP: recv error ' + str(err))
+                return
 
-        sock.settimeout(t_out)
+            self._handle(data, addr[0], now)
 
-        logger.debug('SSDP: %s\n%s', destination, ssdp_packet)
-        for _ in range(5):
-            sock.sendto(ssdp_packet.encode('utf-8'), (destination, 1900))
-        return sock
+    def _handle(self, data, ip, now):
+        if self.search_ips and not self.search_udns:
+            if ip not in self.search_ips:
+                return
 
-    def do(local_address, target_ips):
         try:
-            sock = send_to(local_address)
-        except:
-            threads.remove(threading.current_thread())
+            packet = convert_ssdp_response(data, ip, self.dump)
+        except (UnicodeDecodeError, ValueError):
+            return
 
-            if not threads:
-                found_event.set()
+        if packet['TYPE'] != 'response' or 'LOCATION' not in packet:
+            return
 
+        location = packet['LOCATION']
+        if location.count('/') == 2 and location.startswith('http'):
             return
 
-        for target_ip in target_ips:
-            found[target_ip] = set()
-            trd = threading.Thread(target=found_thread, args=(target_ip,))
-            trd.daemon = True
-            threads.append(trd)
-            trd.start()
-        try:
-            while True:
-                data, addr = sock.recvfrom(1024)
+        usn = packet.get('USN', location)
+        if usn in self._usns or not self._is_target(ip, usn):
+            return
 
-                if target_ips and addr[0] not in target_ips:
-                    continue
+        self._usns.add(usn)
 
-                packet = convert_ssdp_response(data, addr[0])
+        host = self.hosts.get(ip, None)
+        if host is None:
+            # locations the host had the last time it answered
+            known = cache.lookup((ip,))
 
-                if packet['TYPE'] != 'response' or 'LOCATION' not in packet:
-                    continue
+        cache.update(ip, packet, now)
 
-                if addr[0] not in found:
-                    found[addr[0]] = set()
-                    trd = threading.Thread(
-                        target=found_thread,
-                        args=(addr[0],)
-                    )
-                    trd.daemon = True
-                    threads.append(trd)
-                    trd.start()
+        if host is None:
+            # a unicast search makes the device answer with the locations
+            # of all of its root devices
+            host = self.hosts[ip] = _Host(
+                ip,
+                now,
+                targeted=self.is_targeted,
+                expected=len(known[0][1]) if known else 0
+            )
 
-                found[addr[0]].add(packet['LOCATION'])
+            if ip not in self.search_ips:
+                self._send(self._unicast_sock, ip)
 
-        except socket.timeout:
-            pass
+        if host.reported:
+            logger.debug('SSDP: late location {0} for {1}'.format(location, ip))
+            return
 
-        except socket.error:
-            import traceback
+        host.add(packet, now)
 
-            logger.debug(traceback.format_exc())
+    def _settled(self, now, force=False):
+        for host in list(self.hosts.values()):
+            if host.reported or not host.locations:
+                continue
 
-        try:
-            sock.close()
-        except socket.error:
-            pass
+            if force or host.is_settled(now):
+                host.reported = True
+                yield host
 
-        threads.remove(threading.current_thread())
+    def _targets_done(self):
+        if not self.is_targeted:
+            return False
 
-        if not threads:
-            found_event.set()
+        for udn in self.search_udns:
+            if udn not in self.udn_ips:
+                return False
 
-    def found_thread(ip_addr):
-        try:
-            sock = send_to(ip_addr, timeout)
-        except OSError:
-            threads.remove(threading.current_thread())
+        for ip in self.search_ips + tuple(self.udn_ips.values()):
+            host = self.hosts.get(ip, None)
+            if host is None or not host.reported:
+                return False
 
-            if not threads:
-                found_event.set()
-            return
+        return True
 
-        try:
-            while True:
-                data, addr = sock.recvfrom(1024)
+    def __iter__(self):
+        """
+        Runs the search.
 
-                packet = convert_ssdp_response(data, addr[0])
+        :return: generator that yields a host as soon as it has answered
+        :rtype: generator of `_Host` instances
+        """
+        self._open()
 
-                if packet['TYPE'] != 'response' or 'LOCATION' not in packet:
-                    continue
+        try:
+            start = time.time()
+            deadline = start + self.timeout
+            searches = SEARCH_REPEAT
+            next_search = start
 
-                if (
-                    packet['LOCATION'].count('/') == 2 and
-                    packet['LOCATION'].startswith('http')
-                ):
+            for ip in self.search_ips:
+                self._send(self._unicast_sock, ip)
+
+            while True:
+                now = time.time()
+
+                if searches and now >= next_search:
+                    for sock in self._multicast_socks:
+                        self._send(sock, IPV4_MCAST_GRP)
+
+                        for udn in self.search_udns:
+                            if udn not in self.udn_ips:
+                                self._send(sock, IPV4_MCAST_GRP, udn)
+
+                    searches -= 1
+                    next_search = now + SEARCH_INTERVAL
+
+                for host in self._settled(now):
+                    yield host
+
+                if now >= deadline or self._targets_done():
+                    break
+
+                wake = [deadline]
+                if searches:
+                    wake += [next_search]
+
+                wake += list(
+                    host.settle_time for host in self.hosts.values()
+                    if not host.reported
+                )
+
+                wait = max(min(wake) - time.time(), 0)
+
+                for key, _ in self._selector.select(wait):
+                    self._read(key.fileobj, time.time())
+
+            for host in self._settled(time.time(), force=True):
+                yield host
+
+        finally:
+            self._close()
+
+
+def discover(
+    timeout=5,
+    log_level=None,
+    search_ips=(),
+    dump='',
+    use_cache=True,
+    search_udns=()
+):
+    """
+    Searches for UPNP devices.
+
+    A search for `search_ips` or `search_udns` ends as soon as all of the
+    devices have answered.
+
+    :param timeout: search timeout in seconds
+    :param log_level: logging level
+    :param search_ips: only search for these addresses
+    :param dump: path to dump the SSDP packets to
+    :param use_cache: answer the search from the SSDP cache if the cached
+        results are still valid. The results of a search always get stored
+        in the cache.
+    :param search_udns: only search for the devices with these UDNs
+        (``"uuid:..."``), wherever they are.
+    :return: generator of ``(ip, locations)``
+    """
+    if dump and not os.path.exists(dump):
+        os.makedirs(dump)
 
-                    continue
+    if log_level is not None:
+        logging.basicConfig(format="%(message)s", level=log_level)
+        if log_level is not None:
+            logger.setLevel(log_level)
 
-                found[addr[0]].add(packet['LOCATION'])
+    search_ips = tuple(search_ips)
+    search_udns = tuple(search_udns)
 
-        except socket.error:
-            pass
+    if use_cache and not dump:
+        found = cache.lookup(search_ips, search_udns)
+        if found is not None:
+            logger.debug('SSDP: answered from cache')
+            for ip, locations in found:
+                yield ip, locations
+            return
 
-        threads.remove(threading.current_thread())
+    start = time.time()
 
-        if not threads:
-            found_event.set()
+    for host in SSDPSearch(timeout, search_ips, dump, search_udns):
+        yield host.ip, host.locations[:]
 
-    for adapter_ip in adapter_ips:
-        t = threading.Thread(
-            target=do,
-            args=(adapter_ip, search_ips)
-        )
-        t.daemon = True
-        threads += [t]
-        t.start()
+    if not search_ips and not search_udns:
+        cache.search_done(start, lambda: _refresh(timeout))
 
-    found_event.wait()
 
-    for ip, locations in found.items():
-        locations = list(loc for loc in locations)
-        if not locations:
-            continue
+def _refresh(timeout):
+    start = time.time()
+    for _ in SSDPSearch(timeout):
+        pass
 
-        yield ip, locations
+    cache.search_done(start)
 
 
 if __name__ == '__main__':
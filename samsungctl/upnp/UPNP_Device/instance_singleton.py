@@ -1,14 +1,43 @@
 # -*- coding: utf-8 -*-
 
+import weakref
+
 
 class InstanceSingleton(type):
-    _objects = {}
+    """
+    Returns the same instance for the same id and parent.
+
+    A class that has a parent object sets `_parent_index` to the position
+    of the parent in the arguments that follow the id. The instances are
+    stored per parent and only weakly referenced, the registry never keeps
+    an instance or its parent alive.
+    """
+    _objects = weakref.WeakKeyDictionary()
+    _orphans = weakref.WeakValueDictionary()
 
     def __call__(cls, id, *args):
+        parent_index = getattr(cls, '_parent_index', None)
+
+        if parent_index is None:
+            objects = InstanceSingleton._orphans
+        else:
+            parent = args[parent_index]
+            if parent not in InstanceSingleton._objects:
+                InstanceSingleton._objects[parent] = (
+                    weakref.WeakValueDictionary()
+                )
+            objects = InstanceSingleton._objects[parent]
+
+        key = (cls, id)
+        instance = objects.get(key, None)
+
+        if instance is None:
+            instance = super(InstanceSingleton, cls).__call__(id, *args)
+            objects[key] = instance
 
-        if id not in InstanceSingleton._objects:
-            InstanceSingleton._objects[id] = (
-                super(InstanceSingleton, cls).__call__(id, *args)
-            )
+        return instance
 
-        return InstanceSingleton._objects[id]
+    @staticmethod
+    def release(parent):
+        """Removes all of the instances that belong to parent."""
+        InstanceSingleton._objects.pop(parent, None)
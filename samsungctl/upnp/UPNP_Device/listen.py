@@ -5,24 +5,135 @@ import logging
 from errno import ENOPROTOOPT
 import time
 import threading
-from .upnp_class import UPNPObject
 
-SSDP_PORT = 1900
-SSDP_ADDR = '239.255.255.250'
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
+from .upnp_class import UPNPObject
+from .discover import (
+    get_adapter_ips,
+    convert_ssdp_response,
+    cache,
+    selectors
+)
+from .ssdp_cache import get_max_age
 
-def listen(timeout, log_level=None):
-    logger = logging.getLogger('UPNP_Devices')
-    logger.setLevel(logging.NOTSET)
-    if log_level is not None:
-        logger.setLevel(log_level)
+logger = logging.getLogger('UPNP_Devices')
 
-    threads = []
-    event = threading.Event()
-    found = []
-    found_event = threading.Event()
+SSDP_PORT = 1900
+SSDP_ADDR = '239.255.255.250'
 
-    def do(lcl_address):
+EVENT_UP = 'up'
+EVENT_DOWN = 'down'
+EVENT_CHANGED = 'changed'
+
+
+class PresenceDevice(object):
+    """
+    State of a device as announced by SSDP NOTIFY messages.
+
+    The description of the device (`upnp_object`) is only fetched when it
+    is asked for, and it is kept until the device announces a new BOOTID
+    or CONFIGID.
+    """
+
+    def __init__(self, udn, ip):
+        self.udn = udn
+        self.ip = ip
+        self.location = None
+        self.server = None
+        self.boot_id = None
+        self.config_id = None
+        self.expires = 0.0
+        self.alive = False
+        self._upnp_object = None
+
+    @property
+    def upnp_object(self):
+        """
+        :rtype: `None` or `UPNPObject`
+        """
+        if self._upnp_object is None and self.location is not None:
+            self._upnp_object = UPNPObject(self.ip, [self.location])
+
+        return self._upnp_object
+
+    def __repr__(self):
+        return '<PresenceDevice {0} {1} alive={2}>'.format(
+            self.udn,
+            self.ip,
+            self.alive
+        )
+
+
+class Presence(object):
+    """
+    Passive SSDP presence tracking.
+
+    Listens for ssdp:alive, ssdp:byebye and ssdp:update notifications on
+    a single socket, keeps the state of every device (by UDN) in
+    `devices` and reports a device going up or down or changing its
+    BOOTID/CONFIGID. A device also goes down when its CACHE-CONTROL
+    max-age runs out without a new announcement.
+
+    Events are passed to the registered callbacks as ``(event, device)``
+    and they can also be consumed by iterating over the instance. The
+    events are only queued while the instance is being iterated over,
+    the oldest ones get dropped if the consumer falls `queue_size` events
+    behind.
+    """
+
+    queue_size = 256
+
+    def __init__(self, addresses=None):
+        """
+        :param addresses: local addresses to join the multicast group on,
+            defaults to the addresses of all adapters.
+        :type addresses: `None` or `list` of `str`
+        """
+        self.addresses = addresses
+        self.devices = {}
+        self._callbacks = []
+        self._queue = queue.Queue(self.queue_size)
+        self._iterators = 0
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def register_callback(self, callback):
+        self._callbacks += [callback]
+
+    def unregister_callback(self, callback):
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    @property
+    def is_running(self):
+        return self._thread is not None
+
+    def start(self):
+        """Runs the listener in a daemon thread."""
+        if self._thread is not None:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, wait=True):
+        """
+        :param wait: wait for the listener thread to end
+        :type wait: `bool`
+        """
+        self._stop_event.set()
+        thread = self._thread
+        if wait and thread is not None:
+            thread.join(3.0)
+
+    def _open(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         if hasattr(socket, "SO_REUSEPORT"):
@@ -30,115 +141,220 @@ def listen(timeout, log_level=None):
                 sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             except socket.error as err:
                 # RHEL6 defines SO_REUSEPORT but it doesn't work
-                if err.errno == ENOPROTOOPT:
-                    pass
-                else:
+                if err.errno != ENOPROTOOPT:
                     raise err
 
-        addr = socket.inet_aton(SSDP_ADDR)
-        interface = socket.inet_aton(lcl_address)
-        cmd = socket.IP_ADD_MEMBERSHIP
-        sock.setsockopt(socket.IPPROTO_IP, cmd, addr + interface)
-        sock.bind((lcl_address, SSDP_PORT))
-        sock.settimeout(1)
+        sock.bind(('', SSDP_PORT))
 
-        logger.debug('SSDP bound on address ' + lcl_address)
+        addresses = self.addresses
+        if addresses is None:
+            addresses = get_adapter_ips()
 
-        start = time.time()
+        group = socket.inet_aton(SSDP_ADDR)
+        for address in addresses:
+            try:
+                sock.setsockopt(
+                    socket.IPPROTO_IP,
+                    socket.IP_ADD_MEMBERSHIP,
+                    group + socket.inet_aton(address)
+                )
+                logger.debug('SSDP bound on address ' + address)
+            except socket.error:
+                logger.debug('SSDP unable to join group on ' + address)
+
+        sock.setblocking(False)
+        return sock
+
+    def run(self):
+        """Runs the listener until `stop` is called."""
+        sock = None
+        selector = selectors.DefaultSelector()
 
-        while time.time() - start < timeout:
+        try:
             try:
-                data, addr = sock.recvfrom(1024)
-                if data:
-                    host, port = addr
-                    logger.debug('SSDP data: %s --> %s', host, data)
+                sock = self._open()
+            except socket.error:
+                import traceback
+                logger.error(traceback.format_exc())
+                return
+
+            selector.register(sock, selectors.EVENT_READ)
+
+            while not self._stop_event.isSet():
+                now = time.time()
+                self._expire(now)
+
+                wait = 1.0
+                for device in self.devices.values():
+                    if device.alive:
+                        wait = min(wait, device.expires - now)
+
+                for _ in selector.select(max(wait, 0)):
+                    while True:
+                        try:
+                            data, addr = sock.recvfrom(4096)
+                        except socket.error:
+                            break
+
+                        self.handle(data, addr[0], time.time())
+        finally:
+            selector.close()
+            if sock is not None:
+                sock.close()
+            self._thread = None
+            if self._iterators:
+                self._put(None)
+
+    def handle(self, data, ip, now=None):
+        """Processes one SSDP packet."""
+        if now is None:
+            now = time.time()
+
+        try:
+            packet = convert_ssdp_response(data, ip)
+        except (UnicodeDecodeError, ValueError):
+            return
+
+        if packet['TYPE'] != 'notify' or 'USN' not in packet:
+            return
+
+        nts = packet.get('NTS', '')
+        udn = packet['USN'].split('::')[0]
+        is_root = packet.get('NT', '') == 'upnp:rootdevice'
+
+        with self._lock:
+            device = self.devices.get(udn, None)
 
-                    try:
-                        header, payload = data.decode().split('\r\n\r\n')[:2]
-                    except ValueError as err:
-                        logger.error(err)
-                        continue
+            if device is None:
+                # devices are tracked by the UDN of their root device
+                if nts == 'ssdp:byebye' or not is_root:
+                    return
 
-                    lines = header.split('\r\n')
-                    cmd = lines[0].split(' ')
-                    lines = map(lambda x: x.replace(': ', ':', 1), lines[1:])
-                    lines = filter(lambda x: len(x) > 0, lines)
+                device = self.devices[udn] = PresenceDevice(udn, ip)
 
-                    headers = [x.split(':', 1) for x in lines]
-                    headers = dict(map(lambda x: (x[0].lower(), x[1]), headers))
+            if nts == 'ssdp:byebye':
+                if is_root:
+                    cache.remove(packet['USN'])
 
-                    logger.debug('SSDP command %s %s - from %s:%d', cmd[0], cmd[1], host, port)
-                    logger.debug('with headers: %s.', headers)
+                if device.alive:
+                    device.alive = False
+                    self._emit(EVENT_DOWN, device)
+                return
 
-                    if cmd[0] == 'M-SEARCH' and cmd[1] == '*':
-                        logger.debug('M-SEARCH *')
-                    elif cmd[0] == 'NOTIFY' and cmd[1] == '*':
+            boot_id = packet.get('BOOTID.UPNP.ORG', device.boot_id)
+            if nts == 'ssdp:update':
+                boot_id = packet.get('NEXTBOOTID.UPNP.ORG', boot_id)
 
-                        addr = addr[0]
+            config_id = packet.get('CONFIGID.UPNP.ORG', device.config_id)
 
-                        start = data.lower().find(b'nt:')
+            differs = (
+                boot_id != device.boot_id or
+                config_id != device.config_id or
+                device.ip != ip
+            )
 
-                        if start > -1:
-                            start += 3
-                            nt = data[start:]
-                            nt = nt[:nt.find(b'\n')].strip()
-                        else:
-                            continue
+            if differs:
+                # the description has to be fetched again
+                device._upnp_object = None
 
-                        logger.debug('SSDP: %s found nt: %s', addr, nt)
+            changed = device.alive and differs
 
-                        if nt != b'upnp:rootdevice':
-                            continue
+            device.ip = ip
+            device.boot_id = boot_id
+            device.config_id = config_id
+            device.server = packet.get('SERVER', device.server)
+            device.expires = now + get_max_age(packet)
 
-                        start = data.lower().find(b'st:')
+            if is_root and 'LOCATION' in packet:
+                if device.location != packet['LOCATION']:
+                    device._upnp_object = None
 
-                        if start > -1:
-                            start += 3
-                            st = data[start:]
-                            st = st[:st.find(b'\n')].strip()
-                        else:
-                            continue
+                device.location = packet['LOCATION']
+                if nts == 'ssdp:alive':
+                    cache.update(ip, packet, now)
 
-                        start = data.lower().find(b'location:')
+            if not device.alive:
+                device.alive = True
+                self._emit(EVENT_UP, device)
+            elif changed:
+                self._emit(EVENT_CHANGED, device)
 
-                        if start > -1:
-                            start += 9
-                            location = data[start:]
-                            location = location[:location.find(b'\n')].strip()
-                        else:
-                            continue
+    def _expire(self, now):
+        with self._lock:
+            for device in self.devices.values():
+                if device.alive and now >= device.expires:
+                    device.alive = False
+                    self._emit(EVENT_DOWN, device)
 
+    def _emit(self, event, device):
+        logger.debug('SSDP presence: {0} {1}'.format(event, device))
 
-                        logger.debug('SSDP: %s found st: %s', addr, st)
-                        logger.debug('SSDP: %s found location: %s', addr, location)
-                        found.append(UPNPObject(addr, {st: location}))
-                        found_event.set()
+        for callback in self._callbacks[:]:
+            try:
+                callback(event, device)
+            except:
+                import traceback
+                logger.error(traceback.format_exc())
+
+        if self._iterators:
+            self._put((event, device))
 
-                    else:
-                        logger.debug('Unknown SSDP command %s %s', cmd[0], cmd[1])
+    def _put(self, item):
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                pass
 
-            except socket.timeout:
+            try:
+                dropped = self._queue.get_nowait()
+            except queue.Empty:
                 continue
+
+            logger.debug('SSDP presence: event dropped {0}'.format(dropped))
+
+    def __iter__(self):
+        """
+        Yields ``(event, device)`` until the listener is stopped.
+
+        Starts the listener if it is not running.
+        """
+        with self._lock:
+            self._iterators += 1
+
         try:
-            sock.close()
-        except socket.error:
-            pass
-
-        found_event.set()
-
-        threads.remove(threading.current_thread())
-        if not threads:
-            event.set()
-            found_event.set()
-
-    for local_address in get_local_addresses():
-        t = threading.Thread(target=do, args=(local_address,))
-        t.daemon = True
-        threads += [t]
-        t.start()
-
-    while not event.isSet():
-        found_event.wait()
-        found_event.clear()
-        while found:
-            yield found.pop(0)
+            self.start()
+
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                yield item
+        finally:
+            with self._lock:
+                self._iterators -= 1
+
+
+def listen(timeout, log_level=None):
+    """
+    Yields a `UPNPObject` for every device that announces itself.
+
+    A device is only reported again if it went down or has a new BOOTID or
+    CONFIGID in the mean time.
+    """
+    if log_level is not None:
+        logger.setLevel(log_level)
+
+    presence = Presence()
+    timer = threading.Timer(timeout, presence.stop)
+    timer.daemon = True
+    timer.start()
+
+    try:
+        for event, device in presence:
+            if event in (EVENT_UP, EVENT_CHANGED) and device.location:
+                yield device.upnp_object
+    finally:
+        timer.cancel()
+        presence.stop()
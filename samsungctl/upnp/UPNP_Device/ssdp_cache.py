@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import logging
+
+logger = logging.getLogger('UPNP_Devices')
+
+# max-age used when a device does not send a CACHE-CONTROL header
+DEFAULT_MAX_AGE = 1800
+
+# part of the max-age after which the background refresh runs
+REFRESH_FACTOR = 0.8
+
+
+def get_max_age(packet):
+    """
+    Reads the max-age from the CACHE-CONTROL header of an SSDP packet.
+
+    :param packet: packet headers
+    :type packet: `dict`
+    :rtype: `int`
+    """
+    cache_control = packet.get('CACHE-CONTROL', '')
+
+    for directive in cache_control.split(','):
+        if '=' not in directive:
+            continue
+
+        key, value = directive.split('=', 1)
+        if key.strip().lower() == 'max-age':
+            try:
+                return int(value.strip())
+            except ValueError:
+                break
+
+    return DEFAULT_MAX_AGE
+
+
+class CacheEntry(object):
+    """
+    One root device announcement.
+
+    `data` can be used by consumers to attach information that was
+    derived from the device (for instance from the description), it gets
+    dropped together with the entry when the device reboots (BOOTID
+    changes), changes its location or expires.
+    """
+
+    def __init__(self, ip, packet, now):
+        self.ip = ip
+        self.usn = packet.get('USN', packet['LOCATION'])
+        self.location = packet['LOCATION']
+        self.server = packet.get('SERVER', '')
+        self.st = packet.get('ST', packet.get('NT', ''))
+        self.boot_id = packet.get('BOOTID.UPNP.ORG', None)
+        self.config_id = packet.get('CONFIGID.UPNP.ORG', None)
+        self.max_age = get_max_age(packet)
+        self.expires = now + self.max_age
+        self.data = {}
+
+    def is_same(self, other):
+        return (
+            self.ip == other.ip and
+            self.location == other.location and
+            self.boot_id == other.boot_id and
+            self.config_id == other.config_id
+        )
+
+    def is_expired(self, now):
+        return now >= self.expires
+
+
+class SSDPCache(object):
+    """
+    Process wide cache of SSDP search results.
+
+    Every response seen by a search gets stored here for as long as the
+    device asked for in its CACHE-CONTROL max-age. A full search can be
+    answered from the cache until the first entry it found expires, a
+    background thread runs a new search before that happens.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.RLock()
+        self._valid_until = 0.0
+        self._refresh_thread = None
+        self._refresh_event = threading.Event()
+        self._search = None
+
+    def update(self, ip, packet, now=None):
+        """
+        Stores a search response or alive notification.
+
+        :return: the entry for the packet
+        :rtype: `CacheEntry`
+        """
+        if now is None:
+            now = time.time()
+
+        entry = CacheEntry(ip, packet, now)
+
+        with self._lock:
+            old_entry = self._entries.get(entry.usn, None)
+
+            if old_entry is not None and old_entry.is_same(entry):
+                old_entry.expires = entry.expires
+                old_entry.max_age = entry.max_age
+                old_entry.server = entry.server
+                return old_entry
+
+            self._entries[entry.usn] = entry
+            return entry
+
+    def remove(self, usn):
+        """Removes an entry, used for byebye notifications."""
+        with self._lock:
+            self._entries.pop(usn, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._valid_until = 0.0
+
+    def get_location(self, location):
+        """
+        :rtype: `None` or `CacheEntry`
+        """
+        now = time.time()
+
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.location == location and not entry.is_expired(now):
+                    return entry
+
+    def _purge(self, now):
+        for usn, entry in list(self._entries.items()):
+            if entry.is_expired(now):
+                del self._entries[usn]
+
+    def lookup(self, search_ips=(), search_udns=()):
+        """
+        Answers a search from the cache.
+
+        :param search_ips: limits the search to these addresses
+        :type search_ips: `tuple` of `str`
+        :param search_udns: limits the search to the devices with these UDNs
+        :type search_udns: `tuple` of `str`
+        :return: `None` if the search can not be answered from the cache,
+            otherwise a list of ``(ip, locations)``
+        :rtype: `None` or `list`
+        """
+        now = time.time()
+
+        with self._lock:
+            self._purge(now)
+
+            targeted = search_ips or search_udns
+
+            if not targeted and now >= self._valid_until:
+                return None
+
+            if search_udns:
+                udn_ips = {}
+                for udn in search_udns:
+                    ip = self._find_udn(udn)
+                    if ip is None:
+                        return None
+                    udn_ips[udn] = ip
+
+                search_ips = tuple(search_ips) + tuple(udn_ips.values())
+
+            found = {}
+
+            for entry in self._entries.values():
+                if search_ips and entry.ip not in search_ips:
+                    continue
+
+                locations = found.setdefault(entry.ip, [])
+
+                # the same location is announced under the USN of the
+                # root device and under its UDN
+                if entry.location not in locations:
+                    locations += [entry.location]
+
+        if search_ips:
+            for ip in search_ips:
+                if ip not in found:
+                    return None
+
+        return list(found.items())
+
+    def _find_udn(self, udn):
+        for entry in self._entries.values():
+            if entry.usn.split('::')[0] == udn:
+                return entry.ip
+
+    def find_udn(self, udn):
+        """
+        Current address of a device.
+
+        :param udn: UDN of the device (``"uuid:..."``)
+        :type udn: `str`
+        :rtype: `None` or `str`
+        """
+        with self._lock:
+            self._purge(time.time())
+            return self._find_udn(udn)
+
+    def search_done(self, start, search=None):
+        """
+        Marks a full search as complete.
+
+        :param start: time the search was started
+        :type start: `float`
+        :param search: callable that runs a full search, used to refresh
+            the cache in the background.
+        """
+        with self._lock:
+            max_ages = list(
+                entry.max_age for entry in self._entries.values()
+                if entry.expires >= start
+            )
+
+            if not max_ages:
+                # nothing found, do not cache an empty search
+                self._valid_until = 0.0
+                return
+
+            self._valid_until = start + min(max_ages)
+
+            if search is not None:
+                self._search = search
+                self._start_refresh()
+
+    def _start_refresh(self):
+        if self._refresh_thread is not None:
+            return
+
+        self._refresh_event.clear()
+        self._refresh_thread = threading.Thread(target=self._refresh_loop)
+        self._refresh_thread.daemon = True
+        self._refresh_thread.start()
+
+    def _refresh_loop(self):
+        while not self._refresh_event.isSet():
+            with self._lock:
+                valid_until = self._valid_until
+                search = self._search
+
+            if not valid_until or search is None:
+                break
+
+            max_age = min(
+                list(entry.max_age for entry in self._entries.values()) or
+                [DEFAULT_MAX_AGE]
+            )
+            refresh_at = valid_until - max_age * (1.0 - REFRESH_FACTOR)
+            wait = refresh_at - time.time()
+
+            if wait > 0:
+                self._refresh_event.wait(wait)
+                continue
+
+            logger.debug('SSDP: refreshing cache')
+            try:
+                search()
+            except:
+                import traceback
+                logger.debug(traceback.format_exc())
+                break
+
+            if self._valid_until <= valid_until:
+                # the search did not renew the cache
+                break
+
+        self._refresh_thread = None
+
+    def stop(self):
+        """Stops the background refresh."""
+        self._refresh_event.set()
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(1.0)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import requests
 import six
+import time
 from xml.sax import saxutils
 from lxml import etree
 from .UPNP_Device.upnp_class import UPNPObject
@@ -16,6 +17,8 @@ class UPNPTV(UPNPObject):
     def __init__(self, ip, locations):
         self._dtv_information = None
         self._tv_options = None
+        self._source_list = None
+        self._source_list_time = 0.0
         self.name = self.__class__.__name__
         self.ip_address = ip
         self._connected = False
@@ -24,7 +27,7 @@ class UPNPTV(UPNPObject):
 
     @property
     def connected(self):
-        if self.power:
+        if self.liveness.alive:
             self._connect_upnp()
             return True
         else:
@@ -32,7 +35,7 @@ class UPNPTV(UPNPObject):
             return False
 
     def _connect_upnp(self):
-        if not self._connected and self.power:
+        if not self._connected and self.liveness.alive:
             UPNPObject.__init__(self, self.ip_address, self._locations)
             self._connected = True
 
@@ -954,9 +957,10 @@ class UPNPTV(UPNPObject):
             return
 
         if hasattr(self, 'MainTVAgent2'):
-            source_id = self.MainTVAgent2.GetCurrentExternalSource()[2]
+            source_list = self._get_source_list()
+            source_id = int(source_list.find('ID').text)
             for source in self.sources:
-                if source.id == int(source_id):
+                if source.id == source_id:
                     return source
 
     @source.setter
@@ -997,9 +1001,7 @@ class UPNPTV(UPNPObject):
             return
 
         if hasattr(self, 'MainTVAgent2'):
-            source_list = self.MainTVAgent2.GetSourceList()[1]
-            source_list = saxutils.unescape(source_list)
-            root = etree.fromstring(source_list)
+            root = self._get_source_list()
 
             sources = []
 
@@ -1020,6 +1022,39 @@ class UPNPTV(UPNPObject):
             return sources
         return []
 
+    # how long (in seconds) a fetched source list is considered current.
+    _source_list_ttl = 2.0
+
+    def _get_source_list(self, refresh=False):
+        """
+        Returns the parsed source list snapshot.
+
+        The list is only fetched from the TV if there is no snapshot, the
+        snapshot is older then `_source_list_ttl` or a refresh is forced.
+        """
+        if (
+            refresh or
+            self._source_list is None or
+            time.time() - self._source_list_time > self._source_list_ttl
+        ):
+            source_list = self.MainTVAgent2.GetSourceList()[1]
+            source_list = saxutils.unescape(source_list)
+            self._source_list = etree.fromstring(source_list)
+            self._source_list_time = time.time()
+
+        return self._source_list
+
+    def _invalidate_source_list(self):
+        self._source_list = None
+
+    def refresh_sources(self):
+        """Forces the source list to be fetched from the TV again."""
+        if not self.connected:
+            return
+
+        if hasattr(self, 'MainTVAgent2'):
+            self._get_source_list(refresh=True)
+
     def start_ext_source_view(self, source, id):
         if not self.connected:
             return
@@ -1758,6 +1793,7 @@ class UPNPTV(UPNPObject):
 
 @six.add_metaclass(InstanceSingleton)
 class Channel(object):
+    _parent_index = 1
 
     def __init__(self, channel_num, node, parent):
         self._channel_num = channel_num
@@ -1878,6 +1914,7 @@ class Channel(object):
 
 @six.add_metaclass(InstanceSingleton)
 class Source(object):
+    _parent_index = 1
 
     def __init__(
         self,
@@ -1910,9 +1947,7 @@ class Source(object):
 
     @property
     def __source(self):
-        source_list = self._parent.MainTVAgent2.GetSourceList()[1]
-        source_list = saxutils.unescape(source_list)
-        root = etree.fromstring(source_list)
+        root = self._parent._get_source_list()
 
         for src in root:
             if src.tag == 'Source':
@@ -1947,6 +1982,7 @@ class Source(object):
     def label(self, value):
         if self.is_editable:
             self._parent.MainTVAgent2.EditSourceName(self.name, value)
+            self._parent._invalidate_source_list()
 
     @property
     def device_name(self):
@@ -1957,11 +1993,13 @@ class Source(object):
 
     @property
     def is_active(self):
-        source_list = self._parent.MainTVAgent2.GetSourceList()[1]
-        source_list = saxutils.unescape(source_list)
-        root = etree.fromstring(source_list)
+        root = self._parent._get_source_list()
         return int(root.find('ID').text) == self.id
 
+    def refresh(self):
+        """Forces the source information to be fetched from the TV again."""
+        self._parent._get_source_list(refresh=True)
+
     def activate(self):
         if self.is_connected:
             self._parent.MainTVAgent2.SetMainTVSource(
@@ -1969,6 +2007,7 @@ class Source(object):
                 str(self.id),
                 str(self.id)
             )
+            self._parent._invalidate_source_list()
 
     def __str__(self):
         return self.label
@@ -1,10 +1,215 @@
 # -*- coding: utf-8 -*-
 import requests
-import json
+import logging
+import threading
+from concurrent import futures
 from lxml import etree
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 from .UPNP_Device.discover import discover as _discover
+from .UPNP_Device.discover import cache as ssdp_cache
+from .UPNP_Device.discover import get_udn
 from .UPNP_Device.xmlns import strip_xmlns
 from ..config import Config
+from .. import autodetect
+
+logger = logging.getLogger('samsungctl')
+
+# number of devices that get classified at the same time
+MAX_WORKERS = 8
+
+# timeout for fetching a device description
+DESCRIPTION_TIMEOUT = 3
+
+# SSDP ST/NT values only announced by Samsung TVs, the SERVER header is
+# shared with the other Samsung devices (soundbars, Blu-ray players...)
+SAMSUNG_TV_TYPES = (
+    'urn:samsung.com:device:remotecontrolreceiver:',
+    'urn:samsung.com:service:maintvagent2:',
+)
+
+
+def _is_samsung_tv(entries):
+    """
+    Checks if the SSDP headers of a device identify it as a Samsung TV.
+
+    :param entries: SSDP cache entries of the device
+    :type entries: `list` of `UPNP_Device.ssdp_cache.CacheEntry`
+    :rtype: `bool`
+    """
+    for entry in entries:
+        st = entry.st.lower()
+
+        for device_type in SAMSUNG_TV_TYPES:
+            if st.startswith(device_type):
+                return True
+
+    return False
+
+
+def _get_connection(ip, location, is_samsung_tv=False):
+    """
+    Gets the connection method and port for a device.
+
+    :param is_samsung_tv: the device is already known to be a Samsung TV,
+        its description does not get downloaded.
+    :return: `None` if the device is not a Samsung TV otherwise
+        ``(method, port)``
+    """
+    if not is_samsung_tv:
+        response = requests.get(location, timeout=DESCRIPTION_TIMEOUT)
+        root = etree.fromstring(response.content)
+
+        root = strip_xmlns(root)
+
+        device = root.find('device')
+        if device is None:
+            return None
+
+        mfgr = device.find('manufacturer')
+
+        if mfgr is None or mfgr.text != 'Samsung Electronics':
+            return None
+
+    verdict = autodetect.detect(ip)
+    if verdict is None:
+        # none of the remote control ports answered
+        return None
+
+    return verdict.method, verdict.port
+
+
+def _get_udn(locations):
+    """
+    UDN of a device taken from its SSDP announcement.
+
+    :rtype: `None` or `str`
+    """
+    for location in locations:
+        entry = ssdp_cache.get_location(location)
+        if entry is not None:
+            return get_udn(entry.usn)
+
+
+def _classify(ip, locations):
+    """
+    Builds the `Config` for a discovered device.
+
+    :return: `None` if the device is not a Samsung TV
+    :rtype: `None` or `Config`
+    """
+    entries = list(
+        entry for entry in (
+            ssdp_cache.get_location(location) for location in locations
+        ) if entry is not None
+    )
+
+    # the result is kept with the SSDP cache entry so the
+    # description is only fetched again if the device rebooted
+    entry = ssdp_cache.get_location(locations[0])
+    if entry is not None and 'samsungctl' in entry.data:
+        connection = entry.data['samsungctl']
+    else:
+        try:
+            connection = _get_connection(
+                ip,
+                locations[0],
+                _is_samsung_tv(entries)
+            )
+        except (requests.RequestException, etree.XMLSyntaxError):
+            logger.debug(
+                '{0}: unable to get the device description'.format(ip)
+            )
+            return None
+
+        if entry is not None:
+            entry.data['samsungctl'] = connection
+
+    if connection is None:
+        return None
+
+    method, port = connection
+    return Config(
+        host=ip,
+        method=method,
+        port=port,
+        upnp_locations=locations,
+        udn=_get_udn(locations)
+    )
+
+
+def iter_discover(timeout=5, log_level=None, max_workers=MAX_WORKERS):
+    """
+    Searches for Samsung TVs.
+
+    The devices get classified by a pool of `max_workers` threads while
+    the search is still running and a `Config` is handed out as soon as
+    it is ready.
+
+    :param timeout: search timeout in seconds
+    :param log_level: logging level
+    :param max_workers: number of devices classified at the same time
+    :return: generator of `Config` instances
+    """
+    executor = futures.ThreadPoolExecutor(max_workers)
+    results = queue.Queue()
+    # set when the consumer stopped iterating
+    stop_event = threading.Event()
+
+    def search():
+        count = 0
+        found = _discover(timeout, log_level)
+        try:
+            for ip, locations in found:
+                if stop_event.isSet():
+                    break
+
+                try:
+                    future = executor.submit(_classify, ip, locations)
+                except RuntimeError:
+                    # the consumer stopped and the pool got shut down
+                    break
+
+                future.add_done_callback(results.put)
+                count += 1
+        except:
+            import traceback
+            logger.error(traceback.format_exc())
+        finally:
+            close = getattr(found, 'close', None)
+            if close is not None:
+                close()
+
+            # the number of submitted devices tells the consumer when
+            # every result has arrived
+            results.put(count)
+
+    search_thread = threading.Thread(target=search)
+    search_thread.daemon = True
+    search_thread.start()
+
+    try:
+        total = None
+        finished = 0
+
+        while total is None or finished < total:
+            item = results.get()
+
+            if isinstance(item, int):
+                total = item
+                continue
+
+            finished += 1
+            config = item.result()
+            if config is not None:
+                yield config
+    finally:
+        stop_event.set()
+        executor.shutdown(wait=False)
 
 
 def discover(config=None, log_level=None, timeout=5):
@@ -24,62 +229,78 @@ def discover(config=None, log_level=None, timeout=5):
         search_ips = (config.host,)
 
     if upnp_locations is None:
-        found = []
-        for ip, locations in _discover(timeout, log_level, search_ips=search_ips):
-            if search_ips:
-                config.upnp_locations = locations
-                found += [config]
+        if search_ips:
+            found = []
+
+            if config.udn:
+                # the TV is found even if it got a new address
+                found_ips = _discover(
+                    timeout,
+                    log_level,
+                    search_udns=(config.udn,)
+                )
             else:
-                location = locations[0]
+                found_ips = _discover(
+                    timeout,
+                    log_level,
+                    search_ips=search_ips
+                )
 
-                response = requests.get(location)
-                root = etree.fromstring(response.content)
+            for ip, locations in found_ips:
+                _update_config(config, ip, locations)
+                found += [config]
+        else:
+            found = list(iter_discover(timeout, log_level))
+    else:
+        found = [config]
+
+    if search_ips and config.upnp_locations is None:
+        config.upnp_locations = []
 
-                root = strip_xmlns(root)
+    return found
 
-                device = root.find('device')
-                mfgr = device.find('manufacturer').text
 
-                if mfgr == 'Samsung Electronics':
-                    try:
-                        response = requests.get(
-                            'http://{0}:8001/api/v2/'.format(ip),
-                            timeout=3
-                        )
-                        is_support = (
-                            json.loads(response.content)['device']['isSupport']
-                        )
-                        token_support = json.loads(is_support)['TokenAuthSupport']
+def _update_config(config, ip, locations):
+    if ip != config.host:
+        logger.info(
+            '{0}: TV moved from {1} to {2}'.format(config.name, config.host, ip)
+        )
+        config.host = ip
 
-                        if token_support:
-                            port = 8002
-                            method = 'websocket'
+    config.upnp_locations = locations
 
-                        else:
-                            raise ValueError
+    if config.udn is None:
+        config.udn = _get_udn(locations)
 
 
-                    except (requests.HTTPError, requests.exceptions.ConnectTimeout):
-                        port = 55000
-                        method = 'legacy'
+def relocate(config, timeout=5, log_level=None):
+    """
+    Finds a TV that is not at its configured address any more.
 
-                    except (ValueError, KeyError):
-                        port = 8001
-                        method = 'websocket'
+    The TV is searched for by its UDN, the search ends as soon as it has
+    answered. `config.host` and `config.upnp_locations` get updated.
 
-                    host = ip
-                    config = Config(
-                        host=host,
-                        method=method,
-                        port=port,
-                        upnp_locations=locations
-                    )
+    :param config: TV configuration, `config.udn` has to be set
+    :type config: `samsungctl.Config` instance
+    :param timeout: search timeout in seconds
+    :return: `True` if the TV was found
+    :rtype: `bool`
+    """
+    if not config.udn:
+        return False
 
-                found += [config]
-    else:
-        found = [config]
+    search = _discover(
+        timeout,
+        log_level,
+        search_udns=(config.udn,),
+        use_cache=False
+    )
 
-    if search_ips and config.upnp_locations is None:
-        config.upnp_locations = []
+    try:
+        for ip, locations in search:
+            _update_config(config, ip, locations)
+            return True
+    finally:
+        search.close()
 
-    return found
+    return False
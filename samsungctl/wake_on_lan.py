@@ -1,14 +1,20 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
-import ctypes
+import os
 import socket
 import struct
 import sys
 import platform
+import re
+import threading
+import time
+import logging
 
 
 PY2 = sys.version_info[0] == 2
 
+logger = logging.getLogger('samsungctl')
+
 if platform.system() == 'Darwin':
     OSX = True
     LINUX = False
@@ -23,6 +29,187 @@ else:
     WINDOWS = False
 
 
+# how long (in seconds) a found MAC address is kept
+NEIGHBOR_TTL = 300.0
+# how long an address without an ARP entry is remembered as not found
+NEGATIVE_TTL = 10.0
+# time the kernel gets to resolve the addresses after they were primed
+ARP_WAIT = 0.25
+
+_neighbors = {}
+_neighbors_lock = threading.Lock()
+# set when neither /proc/net/arp nor ``arp -an`` could be read
+_table_unreadable = False
+
+_ARP_LINE = re.compile(
+    r'^(\d+\.\d+\.\d+\.\d+)\s+\S+\s+(0x[0-9a-fA-F]+)\s+'
+    r'([0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5})'
+)
+_ARP_AN_LINE = re.compile(
+    r'\((\d+\.\d+\.\d+\.\d+)\)\s+at\s+'
+    r'([0-9a-fA-F]{1,2}(?::[0-9a-fA-F]{1,2}){5})'
+)
+
+
+def _normalize_mac(mac):
+    return ':'.join(part.zfill(2) for part in mac.lower().split(':'))
+
+
+def _parse_proc_arp(data):
+    table = {}
+
+    for line in data.split('\n')[1:]:
+        match = _ARP_LINE.match(line)
+        if match is None:
+            continue
+
+        ip, flags, mac = match.groups()
+        # 0x2 is ATF_COM, the entry is resolved
+        if int(flags, 16) & 0x2 and mac != '00:00:00:00:00:00':
+            table[ip] = _normalize_mac(mac)
+
+    return table
+
+
+def read_neighbor_table():
+    """
+    Reads the complete ARP table of the system.
+
+    On Linux ``/proc/net/arp`` is read, other systems run ``arp -an`` once.
+
+    :return: ``{ip: mac}`` of the resolved entries
+    :rtype: `dict`
+    """
+    global _table_unreadable
+
+    table = {}
+
+    if WINDOWS:
+        return table
+
+    try:
+        with open('/proc/net/arp') as f:
+            data = f.read()
+    except (IOError, OSError):
+        data = None
+
+    if data is not None:
+        _table_unreadable = False
+        return _parse_proc_arp(data)
+
+    import subprocess
+
+    try:
+        output = subprocess.check_output(['arp', '-an'])
+    except (OSError, subprocess.CalledProcessError):
+        _table_unreadable = True
+        return table
+
+    _table_unreadable = False
+
+    if not PY2:
+        output = output.decode('utf-8', 'replace')
+
+    for ip, mac in _ARP_AN_LINE.findall(output):
+        table[ip] = _normalize_mac(mac)
+
+    return table
+
+
+def prime_neighbors(ips):
+    """
+    Makes the system resolve the MAC addresses of the hosts.
+
+    One empty UDP datagram is sent to every host from a single socket, the
+    kernel has to resolve the MAC address to send it.
+
+    :param ips: IP addresses
+    :type ips: iterable of `str`
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for ip in ips:
+            try:
+                sock.sendto(b'', (ip, 55555))
+            except socket.error:
+                pass
+    finally:
+        sock.close()
+
+
+def _get_cached(ip, now):
+    entry = _neighbors.get(ip, None)
+    if entry is None:
+        return False, None
+
+    mac, expires = entry
+    if now >= expires:
+        del _neighbors[ip]
+        return False, None
+
+    return True, mac
+
+
+def _store(ip, mac, now):
+    if mac is None:
+        _neighbors[ip] = (None, now + NEGATIVE_TTL)
+    else:
+        _neighbors[ip] = (mac, now + NEIGHBOR_TTL)
+
+
+def get_mac_addresses(ips, prime=True):
+    """
+    Gets the MAC addresses of many hosts at once.
+
+    The ARP table gets read once for all of the hosts. The hosts that are
+    not in it are primed together and the table is read a second time.
+    The results are cached for `NEIGHBOR_TTL` seconds (`NEGATIVE_TTL` for
+    the hosts that were not found).
+
+    :param ips: IP addresses
+    :type ips: iterable of `str`
+    :param prime: send a datagram to the hosts that are not in the table
+    :type prime: `bool`
+    :return: ``{ip: mac}``, `None` for the hosts that were not found
+    :rtype: `dict`
+    """
+    found = {}
+    missing = []
+    now = time.time()
+
+    with _neighbors_lock:
+        for ip in ips:
+            cached, mac = _get_cached(ip, now)
+            if cached:
+                found[ip] = mac
+            else:
+                missing += [ip]
+
+    if not missing:
+        return found
+
+    if WINDOWS:
+        for ip in missing:
+            found[ip] = _get_mac_address(ip)
+    else:
+        table = read_neighbor_table()
+
+        if prime and [ip for ip in missing if ip not in table]:
+            prime_neighbors(ip for ip in missing if ip not in table)
+            time.sleep(ARP_WAIT)
+            table = read_neighbor_table()
+
+        for ip in missing:
+            found[ip] = table.get(ip, None)
+
+    now = time.time()
+    with _neighbors_lock:
+        for ip in missing:
+            _store(ip, found[ip], now)
+
+    return found
+
+
 def get_mac_address(ip):
     """
     Gets the MAC address of the TV.
@@ -31,16 +218,43 @@ def get_mac_address(ip):
     for the IP address that was supplied. If no entry is found an APR request
     is sent in an attempt to populate the TV to the ARP table.
 
+    The result is cached, see `get_mac_addresses`. The slower lookup
+    strategies are only used if the ARP table can not be read.
+
     :param ip: IP address of the TV
     :type ip: `str`
     :return: `None` or MAC address of TV formatted ``"00:00:00:00:00"``
     :rtype: `None`, `str`
     """
+    if not PY2 and isinstance(ip, bytes):
+        ip = ip.decode('utf-8')
+
+    with _neighbors_lock:
+        cached, mac = _get_cached(ip, time.time())
+
+    if cached:
+        return mac
+
+    mac = get_mac_addresses([ip])[ip]
+
+    if mac is None and not WINDOWS and _table_unreadable:
+        # the system has no ARP table that can be read, the per address
+        # lookups are all that is left
+        mac = _get_mac_address(ip)
+
+        with _neighbors_lock:
+            _store(ip, mac, time.time())
+
+    return mac
+
+
+def _get_mac_address(ip):
 
     if WINDOWS:
         if not PY2:
             ip = ip.encode()
         try:
+            import ctypes
             from ctypes.wintypes import DWORD, ULONG
             IPAddr = ULONG
             PULONG = ctypes.POINTER(ULONG)
@@ -88,8 +302,6 @@ def get_mac_address(ip):
         if not PY2 and isinstance(ip, bytes):
             ip = ip.decode('utf-8')
 
-        import os
-        import re
         import shlex
         from subprocess import check_output
 
@@ -257,26 +469,316 @@ def get_mac_address(ip):
     return mac
 
 
-def send_wol(mac_address):
+def get_interfaces():
+    """
+    Local IPv4 interfaces.
+
+    :return: ``(ip, directed broadcast address)`` of every interface,
+        loopback and point to point interfaces are left out.
+    :rtype: `list` of `tuple`
+    """
+    import ifaddr
+
+    interfaces = []
+
+    for adapter in ifaddr.get_adapters():
+        for adapter_ip in adapter.ips:
+            if isinstance(adapter_ip.ip, tuple):
+                continue
+
+            prefix = adapter_ip.network_prefix
+            if prefix >= 31:
+                continue
+
+            try:
+                ip = struct.unpack('!I', socket.inet_aton(adapter_ip.ip))[0]
+            except socket.error:
+                continue
+
+            if ip >> 24 == 127:
+                continue
+
+            host_mask = (1 << (32 - prefix)) - 1
+            broadcast = socket.inet_ntoa(struct.pack('!I', ip | host_mask))
+            interfaces += [(adapter_ip.ip, broadcast)]
+
+    return interfaces
+
+
+def get_broadcast_addresses():
+    """
+    Directed broadcast addresses of the local IPv4 networks.
+
+    :rtype: `list` of `str`
+    """
+    addresses = []
+
+    for _, broadcast in get_interfaces():
+        if broadcast not in addresses:
+            addresses += [broadcast]
+
+    return addresses
+
+
+def _parse_hex(value, length):
+    value = value.replace('-', ':')
+
+    if ':' in value:
+        data = list(int(h, 16) for h in value.split(':'))
+    else:
+        data = list(int(value[i:i + 2], 16) for i in range(0, len(value), 2))
+
+    if len(data) != length:
+        raise ValueError('invalid value ' + repr(value))
+
+    return struct.pack('B' * length, *data)
+
+
+def _magic_packet(mac_address, password=None):
+    packet = b'\xff' * 6 + _parse_hex(mac_address, 6) * 16
+
+    if password:
+        # SecureOn password, 6 bytes written like a MAC address or 4 bytes
+        # written like an IPv4 address
+        if password.count('.') == 3:
+            packet += socket.inet_aton(password)
+        else:
+            packet += _parse_hex(password, 6)
+
+    return packet
+
+
+class WOLSender(object):
+    """
+    Sends WOL packets over one reusable socket per interface.
+
+    Every packet goes to the directed broadcast address of the network of
+    each interface, out of that interface, and to the limited broadcast
+    address.
+    """
+
+    def __init__(self, interfaces=None, port=9):
+        """
+        :param interfaces: ``(ip, broadcast)`` of the interfaces to send
+            on, defaults to `get_interfaces`.
+        :type interfaces: `None` or `list` of `tuple`
+        :param port: destination UDP port
+        :type port: `int`
+        """
+        if interfaces is None:
+            interfaces = get_interfaces()
+
+        self.interfaces = interfaces
+        self.port = port
+        self._socks = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        with self._lock:
+            if self._socks is not None:
+                return self._socks
+
+            socks = []
+
+            for ip, broadcast in self.interfaces:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+                try:
+                    sock.bind((ip, 0))
+                except socket.error:
+                    sock.close()
+                    continue
+
+                socks += [(sock, broadcast)]
+
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            socks += [(sock, '255.255.255.255')]
+
+            self._socks = socks
+            return socks
+
+    def send(self, mac_address, password=None, count=1):
+        """
+        Sends the magic packet for one MAC address.
+
+        :param mac_address: MAC address of the TV
+        :type mac_address: `str`
+        :param password: SecureOn password
+        :type password: `None` or `str`
+        :param count: number of times the packet gets sent
+        :type count: `int`
+        """
+        packet = _magic_packet(mac_address, password)
+
+        for _ in range(count):
+            for sock, address in self._open():
+                try:
+                    sock.sendto(packet, (address, self.port))
+                except socket.error:
+                    pass
+
+    def close(self):
+        with self._lock:
+            if self._socks is None:
+                return
+
+            for sock, _ in self._socks:
+                sock.close()
+
+            self._socks = None
+
+
+# ports that accept a connection once a TV has woken up
+WAKE_PORTS = (8001, 8002, 8000, 8080, 9197)
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def _get_sender():
+    global _sender
+
+    with _sender_lock:
+        if _sender is None:
+            _sender = WOLSender()
+        return _sender
+
+
+def send_wol(mac_address, burst=1, password=None):
     """
     Send the WOL "magic" packet to power a TV on.
 
+    The packet goes to the limited broadcast address and to the directed
+    broadcast address of every local network so it reaches the TV
+    whichever interface it is connected to.
 
     :param mac_address: MAC address of the TV
     :type mac_address: `str`
+    :param burst: number of times the packet is sent to every address
+    :type burst: `int`
+    :param password: SecureOn password
+    :type password: `None` or `str`
     :return: `None`
     :rtype: `None`
     """
-    split_mac = mac_address.split(':')
-    hex_mac = list(int(h, 16) for h in split_mac)
-    hex_mac = struct.pack('BBBBBB', *hex_mac)
+    _get_sender().send(mac_address, password, burst)
+
+
+def wake_fleet(
+    targets,
+    wave_size=25,
+    wave_interval=2.0,
+    timeout=120.0,
+    resend_interval=2.0,
+    ports=WAKE_PORTS,
+    sender=None,
+    probe_interval=0.5
+):
+    """
+    Wakes many TVs in staggered waves and measures how long each took.
+
+    `wave_size` TVs are woken every `wave_interval` seconds to limit the
+    inrush current. The TVs that have been sent a packet get probed on
+    `ports` and the packet gets repeated every `resend_interval` seconds
+    until they answer.
+
+    :param targets: the TVs, `samsungctl.Config` instances or
+        ``(mac, host)``/``(mac, host, password)`` tuples
+    :type targets: iterable
+    :param wave_size: number of TVs woken at the same time
+    :type wave_size: `int`
+    :param wave_interval: seconds between two waves
+    :type wave_interval: `float`
+    :param timeout: seconds the TVs of the last wave get to wake up
+    :type timeout: `float`
+    :param resend_interval: seconds between repeated packets
+    :type resend_interval: `float`
+    :param ports: a TV is up once one of these ports accepts a connection
+    :type ports: `tuple` of `int`
+    :param sender: sender to use, defaults to the shared sender
+    :type sender: `None` or `WOLSender`
+    :param probe_interval: seconds between the probes of the TVs
+    :type probe_interval: `float`
+    :return: ``{mac: seconds it took the TV to wake up}``, `None` for the
+        TVs that did not wake up
+    :rtype: `dict`
+    """
+    from .scan import probe_ports
 
-    # create the magic packet from MAC address
-    packet = b'\xff' * 6 + hex_mac * 16
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-    sock.sendto(packet, ('255.255.255.255', 9))
-    sock.close()
+    if sender is None:
+        sender = _get_sender()
+
+    pending = []
+    for target in targets:
+        if isinstance(target, (tuple, list)):
+            mac, host = target[:2]
+            password = target[2] if len(target) > 2 else None
+        else:
+            mac, host, password = target.mac, target.host, None
+
+        if not mac:
+            logger.error('{0}: no MAC address, unable to wake'.format(host))
+            continue
+
+        pending += [[mac, host, password, None, 0.0]]
+
+    waves = list(
+        pending[i:i + wave_size] for i in range(0, len(pending), wave_size)
+    )
+    results = dict((target[0], None) for target in pending)
+
+    start = time.time()
+    deadline = start + (len(waves) - 1) * wave_interval + timeout
+    next_wave = start
+    waiting = []
+
+    while (waves or waiting) and time.time() < deadline:
+        now = time.time()
+
+        if waves and now >= next_wave:
+            wave = waves.pop(0)
+            for target in wave:
+                target[3] = now
+            waiting += wave
+            next_wave = now + wave_interval
+
+        for target in waiting:
+            if now >= target[4]:
+                sender.send(target[0], target[2])
+                target[4] = now + resend_interval
+
+        if not waiting:
+            time.sleep(max(next_wave - time.time(), 0))
+            continue
+
+        found = probe_ports(
+            list(target[1] for target in waiting),
+            ports,
+            timeout=probe_interval,
+            connect_timeout=probe_interval
+        )
+
+        now = time.time()
+        for target in waiting[:]:
+            if target[1] in found:
+                results[target[0]] = now - target[3]
+                waiting.remove(target)
+                logger.debug(
+                    '{0}: woke up after {1:.2f} seconds'.format(
+                        target[1],
+                        results[target[0]]
+                    )
+                )
+
+        wait = now + probe_interval - time.time()
+        if waves:
+            wait = min(wait, next_wave - time.time())
+
+        if wait > 0:
+            time.sleep(wait)
+
+    return results
 
 
 if __name__ == '__main__':
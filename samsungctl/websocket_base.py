@@ -2,9 +2,18 @@
 
 from __future__ import absolute_import, print_function
 import logging
+import socket
 import threading
+import time
+import collections
 import requests
+import websocket
+from . import exceptions
 from . import wake_on_lan
+from . import liveness
+from . import reactor
+from . import reconnect
+from . import writer
 from .utils import LogIt, LogItWithReturn
 
 logger = logging.getLogger('samsungctl')
@@ -13,6 +22,31 @@ logger = logging.getLogger('samsungctl')
 class WebSocketBase(object):
     """Base class for TV's with websocket connection."""
 
+    # ports that accept a connection once the TV can be opened
+    _ready_ports = (8001, 8002)
+    # number of commands that are kept while the TV is powering on
+    pending_command_limit = 16
+    # seconds the TV gets to power on
+    power_on_timeout = 20.0
+    # number of WOL packets sent at once and the time between the bursts
+    wol_burst = 3
+    wol_interval = 1.0
+    # seconds between the checks if the TV is ready
+    ready_interval = 0.25
+    # seconds a connection can be idle before the TV gets pinged and the
+    # number of pings the TV can leave unanswered before the connection
+    # is dropped, `None` turns the pings off
+    keepalive_interval = 10.0
+    keepalive_misses = 2
+    # writes that can wait for the connection, what a full queue does
+    # with a new one and the seconds a write waits, see `samsungctl.writer`
+    write_queue_size = 64
+    write_backpressure = writer.BLOCK
+    write_timeout = 10.0
+    # seconds the SSDP search for a TV that got a new address can take,
+    # only a TV with a known UDN is searched for
+    relocate_timeout = 3.0
+
     @LogIt
     def __init__(self, config):
         """
@@ -28,6 +62,25 @@ class WebSocketBase(object):
         self._starting = False
         self._running = False
         self._thread = None
+        self._waking = False
+        self._waker = None
+        self._power_on_thread = None
+        self._pending = collections.deque(maxlen=self.pending_command_limit)
+        self._pending_lock = threading.Lock()
+        self.writer = writer.Writer(
+            self.write_queue_size,
+            self.write_backpressure,
+            self.write_timeout
+        )
+        self.liveness = liveness.Liveness(config)
+        # backoff of the reconnects, shared by the remotes of the host
+        self.breaker = reconnect.get_breaker(config.host)
+        self._reconnect_event = threading.Event()
+        self._last_received = 0.0
+        self._pings_unanswered = 0
+        # a shared receive loop, see `samsungctl.reactor`
+        self.reactor = reactor.current()
+        self._reactor_sock = None
 
         try:
             requests.get(
@@ -64,42 +117,449 @@ class WebSocketBase(object):
     def on_message(self, _):
         pass
 
+    def _is_ready(self):
+        if self.liveness.wait_alive(self.ready_interval):
+            return True
+
+        for port in self._ready_ports:
+            if liveness.probe(self.config.host, port, self.ready_interval):
+                return True
+
+        return False
+
+    @LogIt
+    def power_on(self, block=True):
+        """
+        Powers the TV on.
+
+        WOL bursts are sent to every local network until the TV accepts a
+        connection on one of its remote ports or announces itself over SSDP
+        and the connection is opened. Commands passed to `control` in the
+        mean time are queued (at most `pending_command_limit`, the oldest
+        get dropped) and sent as soon as the connection is open.
+
+        :param block: wait for the TV to be on
+        :type block: `bool`
+        :return: `True` if the TV is on, `None` if `block` is `False`
+        :rtype: `bool` or `None`
+        """
+        if self.sock is not None:
+            return True
+
+        mac_address = self.mac_address
+        if not mac_address:
+            logger.error('Unable to get TV\'s mac address')
+            return False
+
+        with self._pending_lock:
+            if self._waking:
+                # open() asks for the power while the TV is being powered
+                # on or another thread already started the power on
+                return False
+
+            self._waking = True
+
+        if block:
+            self._waker = threading.current_thread()
+            return self._power_on(mac_address)
+
+        self._waker = self._power_on_thread = threading.Thread(
+            target=self._power_on,
+            args=(mac_address,)
+        )
+        self._waker.daemon = True
+        self._waker.start()
+
+    def _power_on(self, mac_address):
+        start = time.time()
+        deadline = start + self.power_on_timeout
+        next_wol = start
+
+        self.liveness.set_alive(False, self.power_on_timeout)
+
+        try:
+            while self.sock is None:
+                now = time.time()
+                if now >= deadline:
+                    break
+
+                if now >= next_wol:
+                    wake_on_lan.send_wol(mac_address, self.wol_burst)
+                    next_wol = now + self.wol_interval
+
+                if not self._is_ready():
+                    continue
+
+                logger.debug(
+                    'TV ready after {0:.2f} seconds'.format(time.time() - start)
+                )
+                # a reconnect that is backing off gets made right away
+                self.breaker.wake()
+
+                if not self._running:
+                    try:
+                        self.open()
+                    except:
+                        import traceback
+                        logger.debug(traceback.format_exc())
+                        time.sleep(self.ready_interval)
+
+            if self.sock is not None:
+                logger.debug(
+                    'TV on after {0:.2f} seconds'.format(time.time() - start)
+                )
+                self._flush_pending()
+                return True
+
+            logger.error(
+                'Unable to power on the TV, check network connectivity'
+            )
+            return False
+        finally:
+            with self._pending_lock:
+                if self._pending:
+                    logger.error(
+                        'dropping {0} queued command(s)'.format(
+                            len(self._pending)
+                        )
+                    )
+                    self._pending.clear()
+
+                self._waking = False
+                self._waker = None
+
+    def _queue_command(self, *args):
+        """
+        Queues a command while the TV is powering on.
+
+        :return: `True` if the command was queued
+        :rtype: `bool`
+        """
+        with self._pending_lock:
+            if not self._waking or threading.current_thread() is self._waker:
+                # the thread powering the TV on sends the queue
+                return False
+
+            if len(self._pending) == self._pending.maxlen:
+                logger.warning(
+                    'command queue full, dropping ' + str(self._pending[0])
+                )
+
+            logger.debug('TV is powering on, queued ' + str(args))
+            self._pending.append(args)
+            return True
+
+    def _flush_pending(self):
+        # the commands other threads pass to control() keep getting queued
+        # until the queue is empty, so they are sent in order
+        while True:
+            with self._pending_lock:
+                if not self._pending:
+                    self._waking = False
+                    break
+                args = self._pending.popleft()
+
+            self.control(*args)
+
+    def wait_power_on(self, timeout=None):
+        """
+        Waits for a power on started with ``power_on(block=False)``.
+
+        :param timeout: seconds to wait, `None` waits for the power on to
+            finish or to time out.
+        :type timeout: `None` or `float`
+        :return: `True` if the TV is on
+        :rtype: `bool`
+        """
+        thread = self._power_on_thread
+        if thread is not None and thread is not threading.current_thread():
+            if timeout is None:
+                timeout = self.power_on_timeout + 5.0
+            thread.join(timeout)
+
+        return self.sock is not None
+
     @LogIt
     def close(self):
-        """Close the connection."""
+        """
+        Close the connection.
+
+        A power on that is in progress is waited for so the queued
+        commands get sent.
+        """
+        self.wait_power_on()
+        self.breaker.remove_listener(self._wake_reconnect)
+
+        if self.reactor is not None:
+            # no thread to wait for
+            self._running = False
+            sock, self.sock = self.sock, None
+            self.reactor.remove(self, sock)
+
+            if sock is not None:
+                self.liveness.expire()
+            return
+
         if self.sock is not None:
             self._loop_event.set()
             self.sock.close()
+            self.liveness.expire()
             if self._thread is not None:
                 self._thread.join(3.0)
             if self._thread is not None:
                 raise RuntimeError('Loop thread did not properly terminate')
 
+        elif self._thread is not None:
+            # the loop is waiting to reconnect
+            self._loop_event.set()
+            self._reconnect_event.set()
+            self._thread.join(3.0)
+
+    def _start_loop(self):
+        """Starts receiving, in the reactor if there is one."""
+        self.breaker.add_listener(self._wake_reconnect)
+
+        if self.reactor is not None:
+            self._running = True
+            self.reactor.add(self)
+        else:
+            self._thread = threading.Thread(target=self.loop)
+            self._thread.start()
+
+    def _connection_lost(self):
+        self.sock = None
+        self.liveness.connection_closed()
+        del self._registered_callbacks[:]
+        logger.info('Websocket closed')
+
+    def _write(self, func, priority=writer.PRIORITY_MESSAGE, wait=True):
+        """
+        Writes to the connection through the write queue.
+
+        :param func: gets called with the connection and does the write
+        :type func: callable
+        :param priority: see `samsungctl.writer`
+        :param wait: wait for the write to be done
+        :raises: `exceptions.ConnectionClosed` if there is no connection,
+            `exceptions.WriteQueueFull`
+        """
+        def write():
+            sock = self.sock
+            if sock is None:
+                raise exceptions.ConnectionClosed()
+
+            func(sock)
+
+        self.writer.put(write, priority, wait)
+
+    def _recv(self, sock):
+        """
+        Receives a message, the control frames count as a sign of life.
+
+        :return: the message, ``""`` for a control frame
+        """
+        recv_data = getattr(sock, 'recv_data', None)
+        if recv_data is None:
+            data = sock.recv()
+            opcode = websocket.ABNF.OPCODE_TEXT
+        else:
+            opcode, data = recv_data(control_frame=True)
+
+        self._last_received = time.time()
+        self._pings_unanswered = 0
+
+        if opcode == websocket.ABNF.OPCODE_TEXT:
+            if isinstance(data, bytes):
+                data = data.decode('utf-8')
+            return data
+
+        if opcode == websocket.ABNF.OPCODE_BINARY:
+            return data
+
+        if opcode == websocket.ABNF.OPCODE_PONG:
+            self.liveness.connection_opened()
+
+        return ''
+
+    def _keepalive(self):
+        """
+        Pings the TV if the connection has been idle.
+
+        :return: `False` if the TV left `keepalive_misses` pings in a row
+            unanswered, the connection is dead.
+        :rtype: `bool`
+        """
+        sock = self.sock
+        if sock is None or not self.keepalive_interval:
+            return True
+
+        if time.time() - self._last_received < self.keepalive_interval:
+            return True
+
+        if self._pings_unanswered >= self.keepalive_misses:
+            logger.info(
+                '{0}: {1} pings unanswered, dropping the connection'.format(
+                    self.config.host,
+                    self._pings_unanswered
+                )
+            )
+            return False
+
+        ping = getattr(sock, 'ping', None)
+        if ping is None:
+            return True
+
+        try:
+            ping()
+        except:
+            return False
+
+        self._pings_unanswered += 1
+        return True
+
     def loop(self):
         self._running = True
+        sock = None
+
         while not self._loop_event.isSet():
             try:
-                data = self.sock.recv()
+                if self.sock is not sock:
+                    sock = self.sock
+                    self._last_received = time.time()
+                    self._pings_unanswered = 0
+
+                    # the loop wakes up to ping an idle connection
+                    settimeout = getattr(sock, 'settimeout', None)
+                    if settimeout is not None:
+                        settimeout(self.keepalive_interval)
+
+                try:
+                    data = self._recv(sock)
+                except (socket.timeout, websocket.WebSocketTimeoutException):
+                    if self._keepalive():
+                        continue
+
+                    sock.close()
+                    raise
+
                 if data:
                     self.on_message(data)
             except:
-                self.sock = None
-                del self._registered_callbacks[:]
-                logger.info('Websocket closed')
-
-                while self.sock is None and not self._loop_event.isSet():
-                    if not self._starting:
-                        try:
-                            self.open()
-                        except:
-                            self._loop_event.wait(1.0)
-                    else:
-                        self._loop_event.wait(1.0)
+                self._connection_lost()
+                self._reconnect()
 
         self._running = False
         self._loop_event.clear()
         self._thread = None
 
+    def _attempt_open(self):
+        """
+        Makes one reconnect attempt and records the result in the breaker.
+
+        :return: `True` if the connection is open
+        :rtype: `bool`
+        """
+        if self.sock is not None:
+            return True
+
+        breaker = self.breaker
+        if (
+            breaker.failures >= breaker.failure_threshold and
+            not self.liveness.probe()
+        ):
+            # the circuit is half open, a TCP connect is a lot cheaper
+            # than the requests open() makes
+            if not self._relocate():
+                breaker.failure()
+                return False
+
+            breaker = self.breaker
+
+        try:
+            self.open()
+        except:
+            import traceback
+            logger.debug(traceback.format_exc())
+
+        if self.sock is None:
+            breaker.failure()
+            return False
+
+        breaker.success()
+        return True
+
+    def _relocate(self):
+        """
+        Searches for the TV by its UDN, DHCP can give it a new address.
+
+        :return: `True` if the TV was found at a new address
+        :rtype: `bool`
+        """
+        if not self.config.udn:
+            return False
+
+        from .upnp.discover import relocate
+
+        host = self.config.host
+        try:
+            if not relocate(self.config, self.relocate_timeout):
+                return False
+        except:
+            import traceback
+            logger.debug(traceback.format_exc())
+            return False
+
+        if self.config.host == host:
+            return False
+
+        # the trackers and the backoff are kept per address
+        self.liveness.host_changed(host)
+        self.breaker.remove_listener(self._wake_reconnect)
+        self.breaker = reconnect.get_breaker(self.config.host)
+        if self._running:
+            self.breaker.add_listener(self._wake_reconnect)
+
+        if self.config.path:
+            try:
+                self.config.save()
+            except:
+                import traceback
+                logger.debug(traceback.format_exc())
+
+        return True
+
+    def _reconnect(self):
+        self._reconnect_event.clear()
+        delay = self.breaker.delay
+
+        while self.sock is None and not self._loop_event.isSet():
+            if delay > 0:
+                logger.debug(
+                    '{0}: reconnecting in {1:.1f} seconds'.format(
+                        self.config.host,
+                        delay
+                    )
+                )
+                # gets set by close() and when the breaker gets woken
+                self._reconnect_event.wait(delay)
+                self._reconnect_event.clear()
+                delay = self.breaker.delay
+            elif self._starting:
+                # another thread is opening the connection
+                self._reconnect_event.wait(self.breaker.base_interval)
+                self._reconnect_event.clear()
+            elif not self._attempt_open():
+                delay = self.breaker.delay
+
+    def _wake_reconnect(self):
+        if self.sock is not None or not self._running:
+            return
+
+        if self.reactor is not None:
+            self.reactor.wake_reconnect(self)
+        else:
+            self._reconnect_event.set()
+
     @property
     def artmode(self):
         return None
@@ -110,6 +570,8 @@ class WebSocketBase(object):
 
     @LogItWithReturn
     def power(self):
+        # a connection to a TV that went away without closing it gets
+        # dropped by the keepalive pings
         return self.sock is not None
 
     def control(self, *_):
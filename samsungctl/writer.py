@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+"""
+Single write path for a connection.
+
+Every write to a websocket connection goes through the `Writer` of the
+remote. The writes are kept in a bounded queue ordered by priority (power
+and keys ahead of the bulk mouse moves) and written one at a time. There
+is no writer thread: the thread that finds the queue idle writes until
+the queue is empty, the others wait for their write to be done.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from . import exceptions
+
+logger = logging.getLogger('samsungctl')
+
+PRIORITY_POWER = 0
+PRIORITY_KEY = 1
+PRIORITY_MESSAGE = 2
+PRIORITY_BULK = 3
+
+# what a full queue does with a new write
+BLOCK = 'block'
+DROP_OLDEST = 'drop-oldest'
+RAISE = 'raise'
+
+
+class _Job(object):
+
+    def __init__(self, write, priority):
+        self.write = write
+        self.priority = priority
+        self.error = None
+        self.cancelled = False
+        self.event = threading.Event()
+
+    def run(self):
+        try:
+            self.write()
+        except Exception as err:
+            self.error = err
+            logger.debug('write failed: {0!r}'.format(err))
+        finally:
+            self.event.set()
+
+    def fail(self, err):
+        self.error = err
+        self.event.set()
+
+
+class Writer(object):
+
+    def __init__(self, maxsize=64, backpressure=BLOCK, timeout=10.0):
+        """
+        :param maxsize: number of writes that can wait in the queue
+        :type maxsize: `int`
+        :param backpressure: what a full queue does with a new write,
+            `BLOCK` waits up to `timeout` seconds for room, `DROP_OLDEST`
+            drops the oldest of the least important writes and `RAISE`
+            raises `exceptions.WriteQueueFull` right away.
+        :type backpressure: `str`
+        :param timeout: seconds a write waits for room in the queue and
+            for being written
+        :type timeout: `float`
+        """
+        if backpressure not in (BLOCK, DROP_OLDEST, RAISE):
+            raise ValueError('unknown backpressure ' + repr(backpressure))
+
+        self.maxsize = maxsize
+        self.backpressure = backpressure
+        self.timeout = timeout
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self._queue = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._writing = False
+
+    @property
+    def depth(self):
+        """
+        Number of writes in the queue.
+
+        :rtype: `int`
+        """
+        return len(self._queue)
+
+    def stats(self):
+        """
+        Queue metrics.
+
+        :return: ``depth`` and the highest ``max_depth`` of the queue, the
+            number of writes that got ``written``, ``dropped`` by
+            `DROP_OLDEST` or ``rejected`` by `RAISE` and `BLOCK` and the
+            current depth of every priority (``depths``).
+        :rtype: `dict`
+        """
+        with self._lock:
+            depths = {}
+            for priority, _, _ in self._queue:
+                depths[priority] = depths.get(priority, 0) + 1
+
+            return dict(
+                depth=len(self._queue),
+                max_depth=self.max_depth,
+                written=self.written,
+                dropped=self.dropped,
+                rejected=self.rejected,
+                depths=depths
+            )
+
+    def _make_room(self, job):
+        # called with the lock held, returns False if the new job got
+        # dropped instead
+        if self.backpressure == RAISE:
+            self.rejected += 1
+            raise exceptions.WriteQueueFull(
+                '{0} writes queued'.format(len(self._queue))
+            )
+
+        if self.backpressure == DROP_OLDEST:
+            victim = max(
+                self._queue,
+                key=lambda item: (item[0], -item[1])
+            )
+            self.dropped += 1
+
+            if victim[0] < job.priority:
+                # everything queued is more important
+                job.fail(exceptions.WriteQueueFull('write dropped'))
+                return False
+
+            self._queue.remove(victim)
+            heapq.heapify(self._queue)
+            victim[2].fail(exceptions.WriteQueueFull('write dropped'))
+            return True
+
+        deadline = time.time() + self.timeout
+        while len(self._queue) >= self.maxsize:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                self.rejected += 1
+                raise exceptions.WriteQueueFull('timed out')
+
+            self._not_full.wait(remaining)
+
+        return True
+
+    def put(self, write, priority=PRIORITY_MESSAGE, wait=True):
+        """
+        Queues a write.
+
+        :param write: function that does the write
+        :type write: callable
+        :param priority: `PRIORITY_POWER`, `PRIORITY_KEY`,
+            `PRIORITY_MESSAGE` or `PRIORITY_BULK`, the lower ones get
+            written first.
+        :type priority: `int`
+        :param wait: wait for the write to be done and raise the exception
+            it raised
+        :type wait: `bool`
+        :raises: `exceptions.WriteQueueFull` if the queue is full, if the
+            write got dropped or timed out
+        """
+        job = _Job(write, priority)
+
+        with self._lock:
+            if len(self._queue) >= self.maxsize:
+                if not self._make_room(job):
+                    if wait:
+                        raise job.error
+                    return
+
+            heapq.heappush(self._queue, (priority, next(self._counter), job))
+            self.max_depth = max(self.max_depth, len(self._queue))
+
+            drain = not self._writing
+            self._writing = True
+
+        if drain:
+            self._drain()
+
+        if not wait:
+            return
+
+        if not job.event.wait(self.timeout):
+            job.cancelled = True
+            raise exceptions.WriteQueueFull('timed out')
+
+        if job.error is not None:
+            raise job.error
+
+    def _drain(self):
+        try:
+            while True:
+                with self._lock:
+                    if not self._queue:
+                        self._writing = False
+                        return
+
+                    _, _, job = heapq.heappop(self._queue)
+                    self._not_full.notify()
+
+                if job.cancelled:
+                    continue
+
+                job.run()
+
+                with self._lock:
+                    self.written += 1
+        except:
+            # KeyboardInterrupt, the next put takes over
+            with self._lock:
+                self._writing = False
+            raise
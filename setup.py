@@ -33,7 +33,9 @@ setuptools.setup(
         'lxml',
         'six',
         'ifaddr',
-        'pycryptodome'
+        'pycryptodome',
+        'selectors2; python_version < "3.4"',
+        'futures; python_version < "3.2"'
     ],
     classifiers=[
         "Development Status :: 4 - Beta",
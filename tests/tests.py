@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
 import threading
+import collections
+import importlib
 import unittest
 import sys
 import os
@@ -14,6 +16,7 @@ import uuid
 import logging
 import socket
 import flask
+import requests
 
 try:
     import responses
@@ -252,7 +255,9 @@ class WebSocketTest(unittest.TestCase):
         self.connection_event = threading.Event()
         WebSocketTest.client = FakeWebsocketClient(self)
 
-        remote_websocket = sys.modules['samsungctl.remote_websocket']
+        remote_websocket = importlib.import_module(
+            'samsungctl.remote_websocket'
+        )
         remote_websocket.websocket.create_connection = self.client
 
         self.client.on_connect = self.on_connect
@@ -1399,7 +1404,9 @@ class WebSocketSSLTest(unittest.TestCase):
         self.connection_event = threading.Event()
         WebSocketSSLTest.client = FakeWebsocketClient(self)
 
-        remote_websocket = sys.modules['samsungctl.remote_websocket']
+        remote_websocket = importlib.import_module(
+            'samsungctl.remote_websocket'
+        )
         remote_websocket.websocket.create_connection = self.client
 
         self.client.on_connect = self.on_connect
@@ -3256,6 +3263,2781 @@ class LegacyTest(unittest.TestCase):
         self.connection_event.set()
 
 
+SOURCE_LIST = (
+    '&lt;SourceList&gt;'
+    '&lt;ID&gt;71&lt;/ID&gt;'
+    '&lt;Source&gt;'
+    '&lt;SourceType&gt;TV&lt;/SourceType&gt;'
+    '&lt;ID&gt;70&lt;/ID&gt;'
+    '&lt;Editable&gt;No&lt;/Editable&gt;'
+    '&lt;Connected&gt;Yes&lt;/Connected&gt;'
+    '&lt;SupportView&gt;Yes&lt;/SupportView&gt;'
+    '&lt;/Source&gt;'
+    '&lt;Source&gt;'
+    '&lt;SourceType&gt;HDMI1&lt;/SourceType&gt;'
+    '&lt;ID&gt;71&lt;/ID&gt;'
+    '&lt;Editable&gt;Yes&lt;/Editable&gt;'
+    '&lt;EditNameType&gt;Blu-ray&lt;/EditNameType&gt;'
+    '&lt;DeviceName&gt;Player&lt;/DeviceName&gt;'
+    '&lt;Connected&gt;Yes&lt;/Connected&gt;'
+    '&lt;SupportView&gt;Yes&lt;/SupportView&gt;'
+    '&lt;/Source&gt;'
+    '&lt;/SourceList&gt;'
+)
+
+
+class FakeMainTVAgent2(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def GetSourceList(self):
+        self.calls += ['GetSourceList']
+        return ['OK', SOURCE_LIST]
+
+    def SetMainTVSource(self, source, id, ui_id):
+        self.calls += ['SetMainTVSource']
+        return ['OK']
+
+
+class SourceListTest(unittest.TestCase):
+
+    def setUp(self):
+        upnp = importlib.import_module('samsungctl.upnp')
+
+        class FakeTV(upnp.UPNPTV):
+            power = True
+
+            def _connect_upnp(self):
+                pass
+
+        self.agent = FakeMainTVAgent2()
+        self.tv = FakeTV('127.0.0.1', [])
+        self.tv.liveness = samsungctl.liveness.Liveness(
+            samsungctl.Config(host='127.0.0.1', method='legacy', mac='')
+        )
+        self.tv.liveness.set_alive(True)
+        self.tv._devices = {}
+        self.tv._services = dict(MainTVAgent2=self.agent)
+
+    def test_001_SINGLE_FETCH(self):
+        for source in self.tv.sources:
+            source.label
+            source.device_name
+            source.is_connected
+            source.is_viewable
+            source.is_active
+
+        self.assertEqual('Blu-ray', self.tv.source.label)
+        self.assertEqual(['GetSourceList'], self.agent.calls)
+
+    def test_002_REFRESH(self):
+        source = self.tv.sources[0]
+        source.refresh()
+        self.assertEqual(['GetSourceList'] * 2, self.agent.calls)
+
+    def test_003_ACTIVATE_INVALIDATES(self):
+        self.tv.source = 'HDMI1'
+        self.tv.sources
+        self.assertEqual(
+            ['GetSourceList', 'SetMainTVSource', 'GetSourceList'],
+            self.agent.calls
+        )
+
+
+class LivenessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1)
+
+        self.config = samsungctl.Config(
+            host='127.0.0.1',
+            port=self.sock.getsockname()[1],
+            method='websocket',
+            mac=''
+        )
+        self.liveness = samsungctl.liveness.Liveness(self.config)
+
+    def tearDown(self):
+        self.sock.close()
+
+    def test_001_PROBE(self):
+        self.assertTrue(self.liveness.alive)
+        self.sock.close()
+        # the probe result is cached
+        self.assertTrue(self.liveness.alive)
+        self.liveness.expire()
+        self.assertFalse(self.liveness.alive)
+
+    def test_002_CONNECTION_EVENTS(self):
+        self.liveness.connection_closed()
+        self.assertFalse(self.liveness.alive)
+        self.liveness.connection_opened()
+        self.sock.close()
+        self.assertTrue(self.liveness.alive)
+
+    def test_003_SSDP(self):
+        samsungctl.liveness.ssdp_notify('127.0.0.1', 'ssdp:byebye')
+        self.assertFalse(self.liveness.alive)
+        samsungctl.liveness.ssdp_notify('127.0.0.1', 'ssdp:alive', 1800)
+        self.assertTrue(self.liveness.alive)
+
+    def test_004_CONNECTION_EXPIRES(self):
+        self.liveness.connected_interval = 0.05
+        self.liveness.connection_opened()
+        self.sock.close()
+        self.assertTrue(self.liveness.alive)
+        # the connected state gets checked again by the probe
+        time.sleep(0.1)
+        self.assertFalse(self.liveness.alive)
+
+    def test_005_LEGACY_CONNECTION_LOST(self):
+        remote_legacy = importlib.import_module('samsungctl.remote_legacy')
+        remote = remote_legacy.RemoteLegacy(self.config)
+        remote._starting = False
+        remote.sock, tv_sock = socket.socketpair()
+        remote.liveness.connection_opened()
+
+        self.assertTrue(remote.power)
+        self.assertTrue(remote.liveness.alive)
+
+        tv_sock.close()
+        self.sock.close()
+        self.assertFalse(remote.power)
+        self.assertIsNone(remote.sock)
+        self.assertFalse(remote.liveness.alive)
+
+    def test_006_SAME_HOST(self):
+        # a second remote for the host does not replace the first one
+        second = samsungctl.liveness.Liveness(self.config)
+        self.assertIn(self.liveness, samsungctl.liveness.get_trackers(
+            '127.0.0.1'
+        ))
+
+        samsungctl.liveness.ssdp_notify('127.0.0.1', 'ssdp:byebye')
+        self.assertFalse(self.liveness._alive)
+        self.assertFalse(second._alive)
+
+        samsungctl.liveness.ssdp_notify('127.0.0.1', 'ssdp:alive', 1800)
+        self.assertTrue(self.liveness._alive)
+        self.assertTrue(second._alive)
+
+    def test_007_PRESENCE(self):
+        liveness = samsungctl.liveness
+
+        presence = liveness.start_presence()
+        try:
+            self.assertIs(presence, liveness.start_presence())
+            liveness.stop_presence()
+            self.assertIs(presence, liveness._presence)
+
+            self.liveness.set_alive(False, 1800)
+            packet = SSDP_NOTIFY.format(
+                nts='ssdp:alive',
+                nt='upnp:rootdevice',
+                boot_id=1,
+                max_age=1800
+            )
+            presence.handle(packet.encode('utf-8'), '127.0.0.1')
+            self.assertTrue(self.liveness._alive)
+        finally:
+            liveness.stop_presence()
+
+        self.assertIsNone(liveness._presence)
+        self.assertTrue(presence._stop_event.isSet())
+
+
+class RegistryTest(unittest.TestCase):
+    CYCLES = 2000
+
+    class FakeRemote(object):
+        pass
+
+    def _cycle(self):
+        application = importlib.import_module('samsungctl.application')
+        upnp = importlib.import_module('samsungctl.upnp')
+
+        remote = self.FakeRemote()
+        app = application.Application(
+            remote,
+            name='YouTube',
+            appId='111299001912',
+            accelerators=[
+                dict(
+                    title='Recommended',
+                    appDatas=[dict(title='Video', id='1', isPlayable=1)]
+                )
+            ]
+        )
+        for accelerator in app:
+            for content in accelerator:
+                content.title
+
+        self.assertIs(
+            app,
+            application.Application(
+                remote,
+                name='YouTube',
+                appId='111299001912'
+            )
+        )
+
+        node = upnp.etree.Element('Channel')
+        upnp.Channel(('1', '0'), node, remote)
+        source = upnp.Source(71, 'HDMI1', remote, True)
+        self.assertIs(source, upnp.Source(71, 'HDMI1', remote, True))
+
+    def test_001_REGISTRY_RELEASE(self):
+        import gc
+        application = importlib.import_module('samsungctl.application')
+        upnp = importlib.import_module('samsungctl.upnp')
+
+        try:
+            import tracemalloc
+        except ImportError:
+            tracemalloc = None
+
+        self._cycle()
+        gc.collect()
+
+        if tracemalloc is not None:
+            tracemalloc.start()
+            start = tracemalloc.get_traced_memory()[0]
+
+        for _ in range(self.CYCLES):
+            self._cycle()
+
+        gc.collect()
+
+        self.assertEqual(0, len(application._instances))
+        self.assertEqual(0, len(upnp.InstanceSingleton._objects))
+
+        if tracemalloc is not None:
+            growth = tracemalloc.get_traced_memory()[0] - start
+            tracemalloc.stop()
+            logger.info(
+                '{0} cycles, memory growth: {1} bytes'.format(
+                    self.CYCLES,
+                    growth
+                )
+            )
+            self.assertLess(growth, 256 * 1024)
+
+    def test_002_RELEASED_ON_CLOSE(self):
+        application = importlib.import_module('samsungctl.application')
+        upnp = importlib.import_module('samsungctl.upnp')
+
+        remote = samsungctl.Remote(
+            samsungctl.Config(
+                host='127.0.0.1',
+                method='legacy',
+                mac='00:00:00:00:00:00'
+            )
+        )
+        app = application.Application(
+            remote,
+            name='YouTube',
+            appId='111299001912',
+            accelerators=[
+                dict(
+                    title='Recommended',
+                    appDatas=[dict(title='Video', id='1', isPlayable=1)]
+                )
+            ]
+        )
+        accelerators = list(app)
+        source = upnp.Source(71, 'HDMI1', remote, True)
+
+        self.assertIn(remote, application._instances)
+        self.assertIn(app, application._instances)
+        self.assertIn(remote, upnp.InstanceSingleton._objects)
+
+        remote.close()
+
+        self.assertNotIn(remote, application._instances)
+        self.assertNotIn(app, application._instances)
+        self.assertNotIn(remote, upnp.InstanceSingleton._objects)
+        self.assertTrue(accelerators)
+        self.assertIsNotNone(source)
+
+
+SSDP_RESPONSE = (
+    'HTTP/1.1 200 OK\r\n'
+    'CACHE-CONTROL: max-age=1800\r\n'
+    'LOCATION: http://127.0.0.1:7676/{0}\r\n'
+    'SERVER: SHP, UPnP/1.0, Samsung UPnP SDK/1.0\r\n'
+    'ST: upnp:rootdevice\r\n'
+    'USN: uuid:{0}::upnp:rootdevice\r\n'
+    'BOOTID.UPNP.ORG: 1\r\n'
+    '\r\n'
+)
+
+
+class FakeSSDPDevice(object):
+
+    def __init__(self, names):
+        self.names = names
+        self.searches = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+        self._event = threading.Event()
+        self._thread = threading.Thread(target=self.loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def loop(self):
+        while not self._event.isSet():
+            try:
+                data, addr = self.sock.recvfrom(1024)
+            except socket.error:
+                continue
+
+            if not data.startswith(b'M-SEARCH'):
+                continue
+
+            self.searches += 1
+            for name in self.names:
+                # every answer is sent twice to check the de-duplication
+                for _ in range(2):
+                    packet = SSDP_RESPONSE.format(name).encode('utf-8')
+                    self.sock.sendto(packet, addr)
+
+    def close(self):
+        self._event.set()
+        self._thread.join(1.0)
+        self.sock.close()
+
+
+class SSDPSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.discover = importlib.import_module(
+            'samsungctl.upnp.UPNP_Device.discover'
+        )
+        self.device = FakeSSDPDevice(['smp_2_', 'smp_7_', 'smp_15_'])
+        self._port = self.discover.SSDP_PORT
+        self._get_adapter_ips = self.discover.get_adapter_ips
+        self.discover.SSDP_PORT = self.device.port
+        self.discover.get_adapter_ips = lambda: []
+        self.discover.cache.clear()
+
+    def tearDown(self):
+        self.discover.SSDP_PORT = self._port
+        self.discover.get_adapter_ips = self._get_adapter_ips
+        self.device.close()
+
+    def test_001_TARGETED_SEARCH(self):
+        start = time.time()
+        found = list(
+            self.discover.discover(timeout=5, search_ips=('127.0.0.1',))
+        )
+        duration = time.time() - start
+
+        self.assertEqual(1, len(found))
+        ip, locations = found[0]
+        self.assertEqual('127.0.0.1', ip)
+        self.assertEqual(
+            sorted(
+                'http://127.0.0.1:7676/' + name
+                for name in ('smp_2_', 'smp_7_', 'smp_15_')
+            ),
+            sorted(locations)
+        )
+        # the search ends once the host has answered
+        self.assertLess(duration, 3)
+
+    def test_002_CACHE(self):
+        search_ips = ('127.0.0.1',)
+        found = list(self.discover.discover(timeout=5, search_ips=search_ips))
+        searches = self.device.searches
+
+        self.assertEqual(
+            found,
+            list(self.discover.discover(timeout=5, search_ips=search_ips))
+        )
+        self.assertEqual(searches, self.device.searches)
+
+        entry = self.discover.cache.get_location(found[0][1][0])
+        self.assertEqual(1800, entry.max_age)
+        self.assertEqual('1', entry.boot_id)
+
+        found = list(
+            self.discover.discover(
+                timeout=5,
+                search_ips=search_ips,
+                use_cache=False
+            )
+        )
+        self.assertLess(searches, self.device.searches)
+
+    def test_003_EARLY_EXIT(self):
+        # the host answers the unicast search right away, the search must
+        # not wait for the MX window
+        start = time.time()
+        found = list(
+            self.discover.discover(
+                timeout=5,
+                search_ips=('127.0.0.1',),
+                use_cache=False
+            )
+        )
+        duration = time.time() - start
+
+        self.assertEqual(3, len(found[0][1]))
+        self.assertLess(duration, 0.5)
+
+        # the locations the host had last time are known, it gets reported
+        # as soon as all of them have been announced again
+        start = time.time()
+        found = list(
+            self.discover.discover(
+                timeout=5,
+                search_ips=('127.0.0.1',),
+                use_cache=False
+            )
+        )
+        self.assertEqual(3, len(found[0][1]))
+        self.assertLess(time.time() - start, 0.1)
+
+    def test_004_RELOCATE(self):
+        upnp_discover = importlib.import_module('samsungctl.upnp.discover')
+        mcast_grp = self.discover.IPV4_MCAST_GRP
+        self.discover.IPV4_MCAST_GRP = '127.0.0.1'
+        self.discover.get_adapter_ips = lambda: ['127.0.0.1']
+
+        config = samsungctl.Config(
+            host='10.0.0.99',
+            method='websocket',
+            port=8001,
+            mac='00:00:00:00:00:00',
+            udn='uuid:smp_7_'
+        )
+
+        try:
+            start = time.time()
+            self.assertTrue(upnp_discover.relocate(config, timeout=5))
+            duration = time.time() - start
+        finally:
+            self.discover.IPV4_MCAST_GRP = mcast_grp
+
+        self.assertEqual('127.0.0.1', config.host)
+        self.assertEqual(3, len(config.upnp_locations))
+        self.assertLess(duration, 0.5)
+        self.assertEqual(
+            '127.0.0.1',
+            self.discover.cache.find_udn('uuid:smp_7_')
+        )
+
+
+SSDP_NOTIFY = (
+    'NOTIFY * HTTP/1.1\r\n'
+    'HOST: 239.255.255.250:1900\r\n'
+    'CACHE-CONTROL: max-age={max_age}\r\n'
+    'LOCATION: http://192.168.1.10:7676/smp_2_\r\n'
+    'NT: {nt}\r\n'
+    'NTS: {nts}\r\n'
+    'USN: uuid:0ee1a5c8-0001::{nt}\r\n'
+    'BOOTID.UPNP.ORG: {boot_id}\r\n'
+    '\r\n'
+)
+
+
+class PresenceTest(unittest.TestCase):
+
+    def setUp(self):
+        listen = importlib.import_module('samsungctl.upnp.UPNP_Device.listen')
+        self.listen = listen
+        self.presence = listen.Presence()
+        self.events = []
+        self.presence.register_callback(
+            lambda event, device: self.events.append((event, device.udn))
+        )
+
+    def notify(
+        self,
+        nts='ssdp:alive',
+        nt='upnp:rootdevice',
+        boot_id=1,
+        max_age=1800,
+        now=None
+    ):
+        packet = SSDP_NOTIFY.format(
+            nts=nts,
+            nt=nt,
+            boot_id=boot_id,
+            max_age=max_age
+        )
+        self.presence.handle(packet.encode('utf-8'), '192.168.1.10', now)
+
+    def test_001_EVENTS(self):
+        udn = 'uuid:0ee1a5c8-0001'
+        self.notify(nt='urn:schemas-upnp-org:service:RenderingControl:1')
+        self.assertEqual([], self.events)
+
+        self.notify()
+        self.notify()
+        self.notify(nt='urn:schemas-upnp-org:service:RenderingControl:1')
+        self.assertEqual([('up', udn)], self.events)
+
+        self.notify(boot_id=2)
+        self.assertEqual(('changed', udn), self.events[-1])
+
+        self.notify(nts='ssdp:byebye')
+        self.assertEqual(('down', udn), self.events[-1])
+        self.assertEqual(3, len(self.events))
+
+    def test_002_EXPIRE(self):
+        self.notify(max_age=10, now=time.time() - 20)
+        self.presence._expire(time.time())
+        self.assertEqual(['up', 'down'], [event for event, _ in self.events])
+
+    def test_003_OPEN_FAILS(self):
+        def _open():
+            raise socket.error('Address already in use')
+
+        self.presence._open = _open
+
+        start = time.time()
+        # the iteration ends instead of waiting forever
+        self.assertEqual([], list(self.presence))
+        self.assertLess(time.time() - start, 1.0)
+        self.assertFalse(self.presence.is_running)
+
+    def test_004_QUEUE(self):
+        # only callbacks, nothing gets queued
+        for boot_id in range(10):
+            self.notify(boot_id=boot_id)
+
+        self.assertEqual(10, len(self.events))
+        self.assertEqual(0, self.presence._queue.qsize())
+
+        # a consumer that falls behind loses the oldest events
+        self.presence._iterators = 1
+        self.presence._queue = self.listen.queue.Queue(3)
+
+        for boot_id in range(10, 15):
+            self.notify(boot_id=boot_id)
+
+        items = []
+        while not self.presence._queue.empty():
+            items += [self.presence._queue.get_nowait()]
+
+        self.assertEqual(3, len(items))
+        self.assertEqual(
+            ['changed'] * 3,
+            list(event for event, _ in items)
+        )
+
+
+class ClassifyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.discover = importlib.import_module('samsungctl.upnp.discover')
+        self.ssdp_cache = self.discover.ssdp_cache
+        self.ssdp_cache.clear()
+        self.calls = []
+
+        hosts = []
+        for i, (server, st) in enumerate((
+            (
+                'SHP, UPnP/1.0, Samsung UPnP SDK/1.0',
+                'urn:samsung.com:device:RemoteControlReceiver:1'
+            ),
+            ('Linux/3.10 UPnP/1.0 Sonos/46.3', 'upnp:rootdevice'),
+            (
+                'SHP, UPnP/1.0, Samsung UPnP SDK/1.0',
+                'urn:samsung.com:service:MainTVAgent2:1'
+            ),
+            # a soundbar runs the same UPnP stack as the TVs
+            ('SHP, UPnP/1.0, Samsung UPnP SDK/1.0', 'upnp:rootdevice')
+        )):
+            ip = '127.0.0.{0}'.format(i + 11)
+            location = 'http://{0}:7676/smp_2_'.format(ip)
+            self.ssdp_cache.update(
+                ip,
+                {
+                    'LOCATION': location,
+                    'SERVER': server,
+                    'ST': st,
+                    'USN': 'uuid:{0}::{1}'.format(i, st)
+                }
+            )
+            hosts += [(ip, [location])]
+
+        def _discover(*_, **__):
+            for host in hosts:
+                yield host
+
+        def _get_connection(ip, location, is_samsung_tv=False):
+            self.calls += [(ip, is_samsung_tv)]
+            time.sleep(0.5)
+            if is_samsung_tv:
+                return 'websocket', 8001
+
+        self._discover = self.discover._discover
+        self._get_connection = self.discover._get_connection
+        self.discover._discover = _discover
+        self.discover._get_connection = _get_connection
+
+    def tearDown(self):
+        self.discover._discover = self._discover
+        self.discover._get_connection = self._get_connection
+        self.ssdp_cache.clear()
+
+    def test_001_PARALLEL(self):
+        start = time.time()
+        found = list(self.discover.iter_discover(timeout=1))
+        duration = time.time() - start
+
+        self.assertEqual(
+            ['127.0.0.11', '127.0.0.13'],
+            sorted(config.host for config in found)
+        )
+        # the ST header identifies the TVs
+        self.assertEqual(
+            [
+                ('127.0.0.11', True),
+                ('127.0.0.12', False),
+                ('127.0.0.13', True),
+                ('127.0.0.14', False)
+            ],
+            sorted(self.calls)
+        )
+        # 4 classifications of 0.5 seconds each ran at the same time
+        self.assertLess(duration, 1.5)
+
+    def test_002_MEMO(self):
+        list(self.discover.iter_discover(timeout=1))
+        del self.calls[:]
+
+        found = self.discover.discover(timeout=1)
+        self.assertEqual(2, len(found))
+        self.assertEqual([], self.calls)
+
+    def test_003_NO_REMOTE_PORT(self):
+        autodetect = self.discover.autodetect
+        detect = autodetect.detect
+        autodetect.detect = lambda *_, **__: None
+
+        try:
+            # no guessing, a device without a remote port is not a TV
+            self.assertIsNone(
+                self._get_connection('127.0.0.11', 'http://127.0.0.11', True)
+            )
+        finally:
+            autodetect.detect = detect
+
+    def test_004_EARLY_STOP(self):
+        hosts = list(self.discover._discover())
+        closed = threading.Event()
+
+        def _discover(*_, **__):
+            try:
+                for host in hosts:
+                    yield host
+                    time.sleep(0.3)
+            finally:
+                closed.set()
+
+        class Handler(logging.Handler):
+
+            def __init__(self):
+                logging.Handler.__init__(self, logging.ERROR)
+                self.records = []
+
+            def emit(self, record):
+                self.records += [record]
+
+        handler = Handler()
+        logger.addHandler(handler)
+        self.discover._discover = _discover
+
+        try:
+            for config in self.discover.iter_discover(timeout=1):
+                self.assertEqual('127.0.0.11', config.host)
+                break
+
+            # the search stops instead of feeding the closed pool
+            self.assertTrue(closed.wait(2.0))
+        finally:
+            logger.removeHandler(handler)
+
+        self.assertEqual([], handler.records)
+
+
+class ScanTest(unittest.TestCase):
+
+    def setUp(self):
+        import samsungctl.scan
+        self.scan = samsungctl.scan
+
+    def test_001_HOSTS(self):
+        hosts = self.scan.get_hosts('192.168.1.77/24')
+        self.assertEqual(254, len(hosts))
+        self.assertEqual('192.168.1.1', hosts[0])
+        self.assertEqual('192.168.1.254', hosts[-1])
+        self.assertEqual(['10.0.0.5'], self.scan.get_hosts('10.0.0.5'))
+
+        self.assertRaises(
+            samsungctl.exceptions.ScanNetworkError,
+            self.scan.get_hosts,
+            '192.168.1.0/33'
+        )
+
+    def test_002_PROBE(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(5)
+        open_port = server.getsockname()[1]
+
+        closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        closed.bind(('127.0.0.1', 0))
+        closed_port = closed.getsockname()[1]
+        closed.close()
+
+        try:
+            start = time.time()
+            found = self.scan.probe_ports(
+                self.scan.get_hosts('127.0.0.0/29'),
+                ports=(open_port, closed_port),
+                timeout=2.0,
+                max_sockets=4
+            )
+            duration = time.time() - start
+        finally:
+            server.close()
+
+        self.assertEqual({'127.0.0.1': {open_port}}, found)
+        self.assertLess(duration, 2.0)
+
+    def test_003_NOT_XML(self):
+        class Response(object):
+            content = b'<html>not a device description'
+
+        get = requests.get
+        requests.get = lambda *_, **__: Response()
+
+        try:
+            config = self.scan._confirm(
+                '127.0.0.1',
+                {7676},
+                ['http://127.0.0.1:7676/description.xml']
+            )
+        finally:
+            requests.get = get
+
+        self.assertIsNone(config)
+
+
+class LazyConfigTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config_module = importlib.import_module('samsungctl.config')
+        self.autodetect = importlib.import_module('samsungctl.autodetect')
+        self.autodetect._verdicts.clear()
+        self.calls = []
+
+        class Response(object):
+
+            def json(self):
+                return dict(
+                    device=dict(
+                        modelName='UN55NU8000',
+                        networkType='wireless',
+                        wifiMac='aa:bb:cc:dd:ee:ff'
+                    )
+                )
+
+        def get(url, timeout=None):
+            self.calls += [url]
+            time.sleep(0.2)
+            return Response()
+
+        def get_mac_address(ip):
+            self.calls += [ip]
+            return '00:11:22:33:44:55'
+
+        def probe(host, port, timeout=0.5):
+            return port == 8001
+
+        def get_mac_addresses(ips):
+            self.bulk_calls += [ips]
+            return {}
+
+        self.bulk_calls = []
+        wake_on_lan = self.config_module.wake_on_lan
+        self._get = requests.get
+        self._get_mac_address = wake_on_lan.get_mac_address
+        self._get_mac_addresses = wake_on_lan.get_mac_addresses
+        self._probe = self.autodetect.probe
+        requests.get = get
+        wake_on_lan.get_mac_address = get_mac_address
+        wake_on_lan.get_mac_addresses = get_mac_addresses
+        self.autodetect.probe = probe
+
+    def tearDown(self):
+        wake_on_lan = self.config_module.wake_on_lan
+        requests.get = self._get
+        wake_on_lan.get_mac_address = self._get_mac_address
+        wake_on_lan.get_mac_addresses = self._get_mac_addresses
+        self.autodetect.probe = self._probe
+        self.autodetect._verdicts.clear()
+
+    def test_001_NO_IO(self):
+        configs = list(
+            samsungctl.Config(host='192.168.1.{0}'.format(i))
+            for i in range(1, 201)
+        )
+        self.assertEqual([], self.calls)
+
+        config = configs[0]
+        self.assertEqual('websocket', config.method)
+        self.assertEqual(1, len(self.calls))
+        # the MAC address comes from the /api/v2/ response of the detection
+        self.assertEqual('AA:BB:CC:DD:EE:FF', config.mac)
+        self.assertEqual(1, len(self.calls))
+
+        config = samsungctl.Config(host='192.168.2.1', port=55000)
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual('00:11:22:33:44:55', config.mac)
+        self.assertEqual(2, len(self.calls))
+
+        # explicit values are validated without any network I/O
+        self.assertRaises(
+            samsungctl.exceptions.ConfigUnknownMethod,
+            samsungctl.Config,
+            host='192.168.1.1',
+            method='unknown'
+        )
+        self.assertEqual(2, len(self.calls))
+
+    def test_002_RESOLVE_ALL(self):
+        configs = list(
+            samsungctl.Config(host='192.168.1.{0}'.format(i))
+            for i in range(1, 21)
+        )
+
+        start = time.time()
+        failed = samsungctl.Config.resolve_all(configs, max_workers=20)
+        duration = time.time() - start
+
+        self.assertEqual({}, failed)
+        self.assertEqual(20, len(self.calls))
+        # the ARP table is read once for the whole batch
+        self.assertEqual(1, len(self.bulk_calls))
+        self.assertEqual(20, len(self.bulk_calls[0]))
+        # 20 configs that need 0.2 seconds each
+        self.assertLess(duration, 2.0)
+
+        for config in configs:
+            self.assertEqual('websocket', config.method)
+            self.assertEqual('AA:BB:CC:DD:EE:FF', config.mac)
+
+        self.assertEqual(20, len(self.calls))
+
+    def test_003_FAILED_DETECTION(self):
+        detect = self.autodetect.detect
+        detections = []
+
+        def fake_detect(host, mac=None, *_, **__):
+            detections.append(host)
+
+        self.autodetect.detect = fake_detect
+        self.config_module.wake_on_lan.get_mac_address = lambda ip: None
+
+        try:
+            config = samsungctl.Config(host='192.168.3.1')
+
+            for _ in range(3):
+                self.assertRaises(
+                    samsungctl.exceptions.ConfigUnknownMethod,
+                    getattr,
+                    config,
+                    'method'
+                )
+            # the failure is remembered
+            self.assertEqual(1, len(detections))
+
+            # an explicit resolve tries again
+            self.assertRaises(
+                samsungctl.exceptions.ConfigUnknownMethod,
+                config.resolve
+            )
+            self.assertEqual(2, len(detections))
+        finally:
+            self.autodetect.detect = detect
+
+
+class AutodetectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.autodetect = importlib.import_module('samsungctl.autodetect')
+        self.autodetect._verdicts.clear()
+        self.open_ports = {}
+        self.device_info = None
+        self.api_delay = 0.0
+
+        class Response(object):
+
+            def json(response):
+                if self.device_info is None:
+                    raise ValueError
+                return dict(device=self.device_info)
+
+        def get(url, timeout=None):
+            time.sleep(self.api_delay)
+            if 8001 not in self.open_ports:
+                raise requests.ConnectionError
+            return Response()
+
+        def probe(host, port, timeout=0.5):
+            if port in self.open_ports:
+                time.sleep(self.open_ports[port])
+                return True
+            time.sleep(timeout)
+            return False
+
+        self._get = requests.get
+        self._probe = self.autodetect.probe
+        requests.get = get
+        self.autodetect.probe = probe
+
+    def tearDown(self):
+        requests.get = self._get
+        self.autodetect.probe = self._probe
+        self.autodetect._verdicts.clear()
+
+    def test_001_LEGACY(self):
+        self.open_ports = {55000: 0.01}
+
+        start = time.time()
+        verdict = self.autodetect.detect('192.168.1.10')
+        self.assertLess(time.time() - start, 0.3)
+        self.assertEqual(('legacy', 55000), (verdict.method, verdict.port))
+
+    def test_002_WEBSOCKET(self):
+        self.open_ports = {8001: 0.01, 8002: 0.01}
+        self.api_delay = 0.05
+        self.device_info = dict(
+            modelName='QN65Q80RAF',
+            isSupport='{"TokenAuthSupport": "true"}'
+        )
+
+        start = time.time()
+        verdict = self.autodetect.detect('192.168.1.10', '00:11:22:33:44:55')
+        self.assertLess(time.time() - start, 0.3)
+        self.assertEqual(('websocket', 8002), (verdict.method, verdict.port))
+
+        # the verdict is found by the MAC address after an IP change
+        self.open_ports = {}
+        start = time.time()
+        self.assertIs(
+            verdict,
+            self.autodetect.detect('192.168.1.20', '00:11:22:33:44:55')
+        )
+        self.assertLess(time.time() - start, 0.1)
+
+    def test_003_ENCRYPTED(self):
+        self.open_ports = {8001: 0.01, 8080: 0.01}
+        self.device_info = dict(modelName='UE40HJ5000')
+
+        verdict = self.autodetect.detect('192.168.1.10')
+        self.assertEqual(('encrypted', 8080), (verdict.method, verdict.port))
+
+    def test_004_OFF(self):
+        start = time.time()
+        self.assertIsNone(self.autodetect.detect('192.168.1.10'))
+        self.assertLess(time.time() - start, 1.0)
+        self.assertIsNone(self.autodetect.get_verdict('192.168.1.10'))
+
+
+PROC_NET_ARP = (
+    'IP address       HW type     Flags       HW address            '
+    'Mask     Device\n'
+    '192.168.1.10     0x1         0x2         a4:30:7a:01:02:03     '
+    '*        eth0\n'
+    '192.168.1.11     0x1         0x0         00:00:00:00:00:00     '
+    '*        eth0\n'
+    '192.168.1.12     0x1         0x2         A4:30:7A:01:02:04     '
+    '*        eth0\n'
+)
+
+
+class NeighborTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.wake_on_lan = importlib.import_module('samsungctl.wake_on_lan')
+        self.wake_on_lan._neighbors.clear()
+        self.reads = 0
+        self.primed = []
+
+        def read_neighbor_table():
+            self.reads += 1
+            table = self.wake_on_lan._parse_proc_arp(PROC_NET_ARP)
+            if self.primed:
+                table['192.168.1.11'] = 'a4:30:7a:01:02:05'
+            return table
+
+        def prime_neighbors(ips):
+            self.primed += list(ips)
+
+        self._read_neighbor_table = self.wake_on_lan.read_neighbor_table
+        self._prime_neighbors = self.wake_on_lan.prime_neighbors
+        self._arp_wait = self.wake_on_lan.ARP_WAIT
+        self.wake_on_lan.read_neighbor_table = read_neighbor_table
+        self.wake_on_lan.prime_neighbors = prime_neighbors
+        self.wake_on_lan.ARP_WAIT = 0.0
+
+    def tearDown(self):
+        self.wake_on_lan.read_neighbor_table = self._read_neighbor_table
+        self.wake_on_lan.prime_neighbors = self._prime_neighbors
+        self.wake_on_lan.ARP_WAIT = self._arp_wait
+        self.wake_on_lan._neighbors.clear()
+
+    def test_001_PARSE(self):
+        self.assertEqual(
+            {
+                '192.168.1.10': 'a4:30:7a:01:02:03',
+                '192.168.1.12': 'a4:30:7a:01:02:04'
+            },
+            self.wake_on_lan._parse_proc_arp(PROC_NET_ARP)
+        )
+
+    def test_002_BULK(self):
+        ips = ['192.168.1.10', '192.168.1.11', '192.168.1.12', '192.168.1.13']
+        found = self.wake_on_lan.get_mac_addresses(ips)
+
+        self.assertEqual(
+            {
+                '192.168.1.10': 'a4:30:7a:01:02:03',
+                '192.168.1.11': 'a4:30:7a:01:02:05',
+                '192.168.1.12': 'a4:30:7a:01:02:04',
+                '192.168.1.13': None
+            },
+            found
+        )
+        # one read, the missing hosts get primed together, a second read
+        self.assertEqual(2, self.reads)
+        self.assertEqual(['192.168.1.11', '192.168.1.13'], self.primed)
+
+        # answered from the cache, the not found host included
+        self.assertEqual(
+            'a4:30:7a:01:02:03',
+            self.wake_on_lan.get_mac_address('192.168.1.10')
+        )
+        self.assertIsNone(self.wake_on_lan.get_mac_address('192.168.1.13'))
+        self.assertEqual(found, self.wake_on_lan.get_mac_addresses(ips))
+        self.assertEqual(2, self.reads)
+
+    def test_003_NO_PROC(self):
+        # macOS and BSD, the table comes from "arp -an" and the single
+        # address lookup uses it as well
+        wake_on_lan = self.wake_on_lan
+        exists = wake_on_lan.os.path.exists
+        single_lookup = wake_on_lan._get_mac_address
+
+        def _get_mac_address(ip):
+            self.fail('per address lookup used for ' + ip)
+
+        wake_on_lan.os.path.exists = (
+            lambda path: path != '/proc/net/arp' and exists(path)
+        )
+        wake_on_lan._get_mac_address = _get_mac_address
+
+        try:
+            self.assertEqual(
+                'a4:30:7a:01:02:03',
+                wake_on_lan.get_mac_address('192.168.1.10')
+            )
+            self.assertIsNone(wake_on_lan.get_mac_address('192.168.1.13'))
+        finally:
+            wake_on_lan.os.path.exists = exists
+            wake_on_lan._get_mac_address = single_lookup
+
+        self.assertEqual(['192.168.1.13'], self.primed)
+
+
+class PowerOnTest(unittest.TestCase):
+
+    def setUp(self):
+        websocket_base = importlib.import_module('samsungctl.websocket_base')
+
+        class FakeWakingTV(websocket_base.WebSocketBase):
+            _ready_ports = ()
+            ready_interval = 0.05
+            wol_interval = 0.2
+            power_on_timeout = 3.0
+
+            def __init__(self, config):
+                self.sent = []
+                self.dropped = []
+                websocket_base.WebSocketBase.__init__(self, config)
+
+            def open(self):
+                if not self.liveness.alive:
+                    return False
+                self.sock = FakeSocket()
+                return True
+
+            def control(self, key):
+                if self._queue_command(key):
+                    return
+
+                if self.sock is None:
+                    self.dropped += [key]
+                    return
+
+                self.sent += [key]
+
+        class FakeSocket(object):
+
+            def close(self):
+                pass
+
+        self.FakeWakingTV = FakeWakingTV
+        self.wake_on_lan = importlib.import_module('samsungctl.wake_on_lan')
+        self.wol = []
+
+        def send_wol(mac_address, burst=1):
+            self.wol += [(mac_address, burst)]
+
+        self._send_wol = self.wake_on_lan.send_wol
+        self.wake_on_lan.send_wol = send_wol
+
+        self.config = samsungctl.Config(
+            host='127.0.0.1',
+            method='websocket',
+            port=8001,
+            mac='00:11:22:33:44:55'
+        )
+
+    def tearDown(self):
+        self.wake_on_lan.send_wol = self._send_wol
+
+    def announce(self, delay):
+        timer = threading.Timer(
+            delay,
+            samsungctl.liveness.ssdp_notify,
+            args=('127.0.0.1', 'ssdp:alive', 1800)
+        )
+        timer.daemon = True
+        timer.start()
+
+    def test_001_QUEUE(self):
+        tv = self.FakeWakingTV(self.config)
+        self.announce(0.5)
+
+        start = time.time()
+        tv.power_on(block=False)
+        tv.control('KEY_MENU')
+        tv.control('KEY_UP')
+
+        while tv.sent != ['KEY_MENU', 'KEY_UP'] and time.time() - start < 3:
+            time.sleep(0.01)
+
+        self.assertEqual(['KEY_MENU', 'KEY_UP'], tv.sent)
+        self.assertEqual([], tv.dropped)
+        # the keys are sent right after the SSDP announcement
+        self.assertLess(time.time() - start, 0.8)
+        self.assertIn(('00:11:22:33:44:55', tv.wol_burst), self.wol)
+        self.assertGreater(len(self.wol), 1)
+
+    def test_002_BOUNDED(self):
+        tv = self.FakeWakingTV(self.config)
+        tv._pending = collections.deque(maxlen=2)
+        self.announce(0.3)
+
+        tv.power_on(block=False)
+        for key in ('KEY_1', 'KEY_2', 'KEY_3'):
+            tv.control(key)
+
+        self.assertTrue(tv._waking)
+        # a second power on does not start another pipeline
+        self.assertFalse(tv.power_on(block=True))
+
+        start = time.time()
+        while len(tv.sent) < 2 and time.time() - start < 3:
+            time.sleep(0.01)
+
+        self.assertEqual(['KEY_2', 'KEY_3'], tv.sent)
+
+        # not powering on, the command is not queued
+        tv.sock = None
+        tv.control('KEY_4')
+        self.assertEqual(['KEY_4'], tv.dropped)
+
+    def test_003_CLOSE_WAITS(self):
+        tv = self.FakeWakingTV(self.config)
+        self.announce(0.3)
+
+        tv.power_on(block=False)
+        tv.control('KEY_MENU')
+        # what the CLI does right after sending the keys
+        tv.close()
+
+        self.assertEqual(['KEY_MENU'], tv.sent)
+        self.assertFalse(tv._waking)
+
+    def test_004_ORDER(self):
+        tv = self.FakeWakingTV(self.config)
+        tv.sock = object()
+
+        tv._waking = True
+        tv._pending.extend([('KEY_1',), ('KEY_2',)])
+        control = tv.control
+
+        def slow_control(key):
+            control(key)
+            if key == 'KEY_1':
+                # another thread sends a key while the queue is flushed
+                thread = threading.Thread(target=tv.control, args=('KEY_3',))
+                thread.start()
+                thread.join()
+
+        tv.control = slow_control
+        tv._waker = threading.current_thread()
+        tv._flush_pending()
+
+        self.assertEqual(['KEY_1', 'KEY_2', 'KEY_3'], tv.sent)
+        self.assertFalse(tv._waking)
+
+
+class WOLSenderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.wake_on_lan = importlib.import_module('samsungctl.wake_on_lan')
+
+    def test_001_PACKET(self):
+        packet = self.wake_on_lan._magic_packet('00:11:22:33:44:55')
+        self.assertEqual(102, len(packet))
+        self.assertEqual(b'\xff' * 6 + b'\x00\x11\x22\x33\x44\x55', packet[:12])
+
+        packet = self.wake_on_lan._magic_packet(
+            '00-11-22-33-44-55',
+            'aa:bb:cc:dd:ee:ff'
+        )
+        self.assertEqual(b'\xaa\xbb\xcc\xdd\xee\xff', packet[102:])
+
+        packet = self.wake_on_lan._magic_packet('001122334455', '192.168.1.2')
+        self.assertEqual(b'\xc0\xa8\x01\x02', packet[102:])
+
+    def test_002_SOCKET_REUSE(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(('127.0.0.1', 0))
+        receiver.settimeout(1.0)
+
+        sender = self.wake_on_lan.WOLSender(
+            [('127.0.0.1', '127.0.0.1')],
+            port=receiver.getsockname()[1]
+        )
+        try:
+            socks = sender._open()
+            sender.send('00:11:22:33:44:55', count=2)
+            sender.send('00:11:22:33:44:66')
+            self.assertIs(socks, sender._open())
+
+            packets = list(receiver.recvfrom(1024)[0] for _ in range(3))
+        finally:
+            sender.close()
+            receiver.close()
+
+        self.assertEqual(
+            [b'\x55', b'\x55', b'\x66'],
+            list(packet[11:12] for packet in packets)
+        )
+
+    def test_003_FLEET(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        port = server.getsockname()[1]
+
+        # the first TV wakes up after 0.4 seconds, the second never does
+        timer = threading.Timer(0.4, server.listen, args=(5,))
+        timer.start()
+
+        sent = []
+
+        class Sender(object):
+
+            def send(self, mac_address, password=None, count=1):
+                sent.append((mac_address, time.time()))
+
+        start = time.time()
+        try:
+            results = self.wake_on_lan.wake_fleet(
+                [
+                    ('00:00:00:00:00:01', '127.0.0.1'),
+                    ('00:00:00:00:00:02', '127.0.0.2', '1.2.3.4')
+                ],
+                wave_size=1,
+                wave_interval=0.2,
+                timeout=1.0,
+                resend_interval=0.5,
+                ports=(port,),
+                sender=Sender(),
+                probe_interval=0.1
+            )
+        finally:
+            timer.cancel()
+            server.close()
+
+        self.assertIsNone(results['00:00:00:00:00:02'])
+        self.assertGreater(results['00:00:00:00:00:01'], 0.3)
+        self.assertLess(results['00:00:00:00:00:01'], 0.7)
+
+        # the second wave is sent after the wave interval
+        first = dict(reversed(sent))
+        self.assertGreaterEqual(
+            first['00:00:00:00:00:02'] - first['00:00:00:00:00:01'],
+            0.19
+        )
+        # the first TV woke up before its packet had to be repeated
+        self.assertEqual(
+            1,
+            len(list(mac for mac, _ in sent if mac.endswith('01')))
+        )
+        self.assertLess(time.time() - start, 2.0)
+
+
+class ImportTimeTest(unittest.TestCase):
+    # modules the CLI must not load when it only sends keys to a legacy TV
+    HEAVY_MODULES = (
+        'requests',
+        'websocket',
+        'lxml',
+        'Crypto',
+        'samsungctl.upnp',
+        'samsungctl.remote_websocket',
+        'samsungctl.remote_encrypted',
+        'samsungctl.application'
+    )
+
+    # budget for the cumulative import time of samsungctl in microseconds,
+    # the eager imports used to take around 200 ms
+    IMPORT_BUDGET = 100000
+
+    SCRIPT = (
+        'import samsungctl, samsungctl.__main__\n'
+        'samsungctl.Remote(samsungctl.Config(\n'
+        '    host="127.0.0.1",\n'
+        '    method="legacy",\n'
+        '    mac="00:00:00:00:00:00"\n'
+        '))\n'
+    )
+
+    def _import_times(self):
+        import subprocess
+
+        base_path = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), '..')
+        )
+        process = subprocess.Popen(
+            [sys.executable, '-X', 'importtime', '-c', self.SCRIPT],
+            cwd=base_path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        _, output = process.communicate()
+        self.assertEqual(0, process.returncode, output)
+
+        times = {}
+        for line in output.decode('utf-8').splitlines():
+            if not line.startswith('import time:'):
+                continue
+
+            try:
+                _, cumulative, name = line[12:].split('|')
+                times[name.strip()] = int(cumulative)
+            except ValueError:
+                continue
+
+        return times
+
+    @unittest.skipIf(sys.version_info < (3, 7), '-X importtime needs 3.7')
+    def test_001_LAZY_IMPORTS(self):
+        times = self._import_times()
+        self.assertIn('samsungctl', times)
+
+        for name in times:
+            for heavy in self.HEAVY_MODULES:
+                if name == heavy or name.startswith(heavy + '.'):
+                    self.fail(name + ' got imported')
+
+    @unittest.skipIf(sys.version_info < (3, 7), '-X importtime needs 3.7')
+    def test_002_IMPORT_TIME(self):
+        # the best of a few runs, the first one also compiles the modules
+        best = min(
+            self._import_times()['samsungctl'] for _ in range(3)
+        )
+        self.assertLess(best, self.IMPORT_BUDGET)
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        batch = importlib.import_module('samsungctl.batch')
+
+        class FakeRemote(object):
+            volume = 10
+            mute = False
+
+            def __init__(self):
+                self.keys = []
+
+            def control(self, key):
+                self.keys += [key]
+
+        try:
+            from StringIO import StringIO
+        except ImportError:
+            from io import StringIO
+
+        self.remote = FakeRemote()
+        self.output = StringIO()
+        self.batch = batch.Batch(self.remote, self.output)
+
+    def test_001_COMMANDS(self):
+        failed = self.batch.run([
+            '# comment',
+            '',
+            'KEY_MENU',
+            'volup 3',
+            'volume 25',
+            'volume',
+            'mute on',
+            'mute state',
+            'wait 0.01'
+        ])
+
+        self.assertEqual(0, failed)
+        self.assertEqual(
+            ['KEY_MENU', 'KEY_VOLUP', 'KEY_VOLUP', 'KEY_VOLUP'],
+            self.remote.keys
+        )
+        self.assertEqual(25, self.remote.volume)
+        self.assertTrue(self.remote.mute)
+
+        lines = self.output.getvalue().splitlines()
+        self.assertEqual(7, len(lines))
+        self.assertTrue(lines[0].startswith('3\t'))
+        self.assertTrue(lines[0].endswith(' ms\tKEY_MENU'))
+        self.assertTrue(lines[3].endswith('\tvolume\t25'))
+        self.assertTrue(lines[5].endswith('\tmute state\tON'))
+
+    def test_002_ERRORS(self):
+        failed = self.batch.run(['KEY_UNKNOWN', 'volume loud', 'KEY_RETURN'])
+
+        self.assertEqual(2, failed)
+        self.assertEqual(['KEY_RETURN'], self.remote.keys)
+
+        lines = self.output.getvalue().splitlines()
+        self.assertIn('error: Invalid batch command: KEY_UNKNOWN', lines[0])
+
+
+class DaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+
+        self.daemon_module = importlib.import_module('samsungctl.daemon')
+
+        class FakeRemote(object):
+            volume = 10
+
+            def __init__(self):
+                self.keys = []
+
+            def control(self, key):
+                self.keys += [key]
+
+            def close(self):
+                pass
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        self.http_port = sock.getsockname()[1]
+        sock.close()
+
+        self.socket_path = os.path.join(tempfile.mkdtemp(), 'test.sock')
+        self.remote = FakeRemote()
+
+        config = samsungctl.Config(
+            host='127.0.0.1',
+            method='legacy',
+            mac='00:00:00:00:00:00'
+        )
+        self.daemon = self.daemon_module.Daemon(
+            [config],
+            self.socket_path,
+            self.http_port
+        )
+        self.daemon.tvs['127.0.0.1'].remote = self.remote
+        self.daemon.start()
+
+    def tearDown(self):
+        self.daemon.stop()
+
+    @unittest.skipIf(not hasattr(socket, 'AF_UNIX'), 'no Unix sockets')
+    def test_001_UNIX_SOCKET(self):
+        client = self.daemon_module.Client(self.socket_path)
+        results = client.run(['KEY_MENU', 'volume 30', 'volume', 'bogus'])
+
+        self.assertEqual(['KEY_MENU'], self.remote.keys)
+        self.assertEqual(30, results[2]['result'])
+        self.assertIn('error', results[3])
+        self.assertNotIn('error', results[0])
+
+    def test_002_HTTP(self):
+        client = self.daemon_module.Client(
+            'http://127.0.0.1:{0}'.format(self.http_port)
+        )
+        results = client.run(['KEY_VOLUP 2'], tv='127.0.0.1')
+
+        self.assertEqual(['KEY_VOLUP', 'KEY_VOLUP'], self.remote.keys)
+        self.assertIsNone(results[0]['result'])
+
+        self.assertRaises(
+            samsungctl.exceptions.DaemonRequestError,
+            client.run,
+            ['KEY_MENU'],
+            '192.168.1.1'
+        )
+
+        response = requests.get('http://127.0.0.1:{0}/'.format(self.http_port))
+        self.assertEqual(
+            [dict(name='127.0.0.1', host='127.0.0.1', connected=True)],
+            response.json()['tvs']
+        )
+
+    def test_003_HTTP_CONTENT_TYPE(self):
+        url = 'http://127.0.0.1:{0}/'.format(self.http_port)
+        body = json.dumps(dict(commands=['KEY_MENU']))
+
+        # what a web page can send to another origin without a preflight
+        for content_type in (
+            'text/plain',
+            'application/x-www-form-urlencoded',
+            None
+        ):
+            headers = {}
+            if content_type is not None:
+                headers['Content-Type'] = content_type
+
+            response = requests.post(url, data=body, headers=headers)
+            self.assertEqual(415, response.status_code)
+
+        self.assertEqual([], self.remote.keys)
+
+    def test_004_HTTP_TOKEN(self):
+        url = 'http://127.0.0.1:{0}'.format(self.http_port)
+        self.daemon.http_token = 'secret'
+
+        self.assertRaises(
+            samsungctl.exceptions.DaemonRequestError,
+            self.daemon_module.Client(url, token='wrong').run,
+            ['KEY_MENU']
+        )
+        self.assertEqual(401, requests.get(url + '/').status_code)
+        self.assertEqual([], self.remote.keys)
+
+        self.daemon_module.Client(url, token='secret').run(['KEY_MENU'])
+        self.assertEqual(['KEY_MENU'], self.remote.keys)
+
+    @unittest.skipIf(not hasattr(socket, 'AF_UNIX'), 'no Unix sockets')
+    def test_005_UNIX_SOCKET_MODE(self):
+        import stat
+
+        mode = stat.S_IMODE(os.stat(self.socket_path).st_mode)
+        self.assertEqual(0, mode & 0o077)
+
+
+class ReactorTest(unittest.TestCase):
+
+    def setUp(self):
+        websocket_base = importlib.import_module('samsungctl.websocket_base')
+        self.reactor_module = importlib.import_module('samsungctl.reactor')
+
+        class FakeWebSocket(object):
+
+            def __init__(self, sock):
+                self.sock = sock
+
+            def fileno(self):
+                return self.sock.fileno()
+
+            def recv(self):
+                # reads a single message like websocket-client does, the
+                # rest stays in the socket
+                line = b''
+                while not line.endswith(b'\n'):
+                    char = self.sock.recv(1)
+                    if not char:
+                        raise socket.error('connection closed')
+                    line += char
+                return line.strip().decode('utf-8')
+
+            def close(self):
+                self.sock.close()
+
+        class FakeReactorTV(websocket_base.WebSocketBase):
+
+            def __init__(self, config):
+                self.messages = []
+                self.opened = 0
+                self.peer = None
+                websocket_base.WebSocketBase.__init__(self, config)
+
+            def open(self):
+                if self.sock is not None:
+                    return True
+
+                sock, self.peer = socket.socketpair()
+                self.sock = FakeWebSocket(sock)
+                self.opened += 1
+                if not self._running:
+                    self._start_loop()
+                return True
+
+            def on_message(self, message):
+                self.messages += [message]
+
+        self.FakeReactorTV = FakeReactorTV
+        self.reactor = self.reactor_module.Reactor(max_workers=4)
+        self.reactor.reconnect_interval = 0.05
+        self.config = samsungctl.Config(
+            host='127.0.0.1',
+            method='websocket',
+            port=8001,
+            mac='00:11:22:33:44:55'
+        )
+
+    def tearDown(self):
+        self.reactor.stop()
+
+    def wait_for(self, check, timeout=3.0):
+        start = time.time()
+        while not check() and time.time() - start < timeout:
+            time.sleep(0.01)
+        return check()
+
+    def test_001_SHARED_THREAD(self):
+        threads = threading.active_count()
+
+        with self.reactor.installed():
+            tvs = list(self.FakeReactorTV(self.config) for _ in range(30))
+
+        for tv in tvs:
+            tv.open()
+
+        for tv in tvs:
+            tv.peer.sendall(b'first\nsecond\n')
+
+        self.assertTrue(
+            self.wait_for(
+                lambda: all(tv.messages == ['first', 'second'] for tv in tvs)
+            )
+        )
+        # the reactor thread and its pool instead of a thread per TV
+        self.assertLessEqual(threading.active_count() - threads, 5)
+
+        start = time.time()
+        for tv in tvs:
+            tv.close()
+        self.assertLess(time.time() - start, 1.0)
+
+    def test_002_RECONNECT(self):
+        with self.reactor.installed():
+            tv = self.FakeReactorTV(self.config)
+
+        tv.open()
+        self.assertTrue(self.wait_for(lambda: tv._reactor_sock is not None))
+        tv.peer.close()
+
+        # the connection is opened again by the reactor
+        self.assertTrue(self.wait_for(lambda: tv.opened == 2))
+        self.assertTrue(self.wait_for(lambda: tv._reactor_sock is not None))
+        tv.peer.sendall(b'back\n')
+        self.assertTrue(self.wait_for(lambda: tv.messages == ['back']))
+
+        tv.close()
+        self.assertIsNone(tv.sock)
+
+    def test_003_PARTIAL_FRAME(self):
+        import websocket
+
+        class FrameTV(self.FakeReactorTV):
+
+            def open(self):
+                if self.sock is not None:
+                    return True
+
+                sock, self.peer = socket.socketpair()
+                self.sock = websocket.WebSocket()
+                self.sock.sock = sock
+                self.sock.connected = True
+                self.opened += 1
+                if not self._running:
+                    self._start_loop()
+                return True
+
+        def frame(text):
+            return websocket.ABNF(
+                1, 0, 0, 0,
+                websocket.ABNF.OPCODE_TEXT,
+                0,
+                text.encode('utf-8')
+            ).format()
+
+        with self.reactor.installed():
+            stalled = FrameTV(self.config)
+            other = FrameTV(self.config)
+
+        try:
+            stalled.open()
+            other.open()
+            self.assertTrue(
+                self.wait_for(
+                    lambda: (
+                        stalled._reactor_sock is not None and
+                        other._reactor_sock is not None
+                    )
+                )
+            )
+
+            data = frame('stalled')
+            stalled.peer.sendall(data[:4])
+            time.sleep(0.1)
+
+            # the reactor thread is not stuck in the unfinished frame
+            other.peer.sendall(frame('other'))
+            self.assertTrue(self.wait_for(lambda: other.messages == ['other']))
+
+            stalled.peer.sendall(data[4:])
+            self.assertTrue(
+                self.wait_for(lambda: stalled.messages == ['stalled'])
+            )
+            self.assertIsNotNone(stalled.sock)
+        finally:
+            stalled.close()
+            other.close()
+
+    def test_004_REMOVE(self):
+        with self.reactor.installed():
+            tv = self.FakeReactorTV(self.config)
+
+        tv.open()
+        self.assertIn(tv, self.reactor._remotes)
+
+        tv.close()
+        self.assertTrue(self.wait_for(lambda: tv not in self.reactor._remotes))
+
+
+class FleetTest(unittest.TestCase):
+
+    def setUp(self):
+        fleet = importlib.import_module('samsungctl.fleet')
+
+        class FakeRemote(object):
+
+            def __init__(self):
+                self.keys = []
+                self.sock = object()
+                self.closed = False
+
+            def control(self, key):
+                self.keys += [key]
+
+            def close(self):
+                self.closed = True
+
+        self.fleet = fleet.Fleet(max_workers=4)
+        for i in range(6):
+            host = '127.0.0.{0}'.format(i + 1)
+            groups = ('even',) if i % 2 == 0 else ('odd',)
+            self.fleet.add(
+                samsungctl.Config(host=host, method='legacy', mac=''),
+                groups=groups
+            )
+            self.fleet.remotes[host] = FakeRemote()
+
+    def test_001_GROUPS(self):
+        remotes = dict(self.fleet.remotes)
+        results = self.fleet.send_key('KEY_MENU', group='even')
+
+        self.assertEqual(
+            dict(
+                (host, None) for host in ('127.0.0.1', '127.0.0.3', '127.0.0.5')
+            ),
+            results
+        )
+        self.assertEqual(['KEY_MENU'], remotes['127.0.0.3'].keys)
+        self.assertEqual([], remotes['127.0.0.2'].keys)
+
+        self.fleet.close()
+        self.assertTrue(all(remote.closed for remote in remotes.values()))
+        self.assertEqual({}, self.fleet.remotes)
+
+
+class BroadcastTest(unittest.TestCase):
+
+    def setUp(self):
+        self.broadcast = importlib.import_module('samsungctl.broadcast')
+
+        # accepts the connects used to estimate the latency
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(16)
+        port = self.server.getsockname()[1]
+
+        class FakeRemote(object):
+
+            def __init__(self, host, staged=True):
+                self.config = samsungctl.Config(
+                    host=host,
+                    port=port,
+                    method='legacy',
+                    mac=''
+                )
+                self.staged = staged
+                self.writes = []
+                self.keys = []
+                self.read = False
+
+            def _stage_key(self, key):
+                if not self.staged:
+                    return None
+
+                def write():
+                    self.writes += [(key, time.time())]
+
+                def after():
+                    self.read = True
+
+                return write, after
+
+            def control(self, key):
+                self.keys += [key]
+
+        self.remotes = list(
+            FakeRemote('127.0.0.{0}'.format(i + 1)) for i in range(4)
+        )
+        self.FakeRemote = FakeRemote
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_001_SKEW(self):
+        report = self.broadcast.broadcast_key(
+            self.remotes,
+            'KEY_MENU',
+            samples=1
+        )
+
+        self.assertEqual([], report.failed)
+        times = list(remote.writes[0][1] for remote in self.remotes)
+        self.assertTrue(all(remote.read for remote in self.remotes))
+        self.assertTrue(all(
+            result['staged'] for result in report.results.values()
+        ))
+        self.assertLess(max(times) - min(times), 0.02)
+        self.assertLess(report.send_skew, 0.02)
+
+    def test_002_FALLBACK(self):
+        remote = self.FakeRemote('127.0.0.10', staged=False)
+        report = self.broadcast.broadcast_key(
+            self.remotes + [remote],
+            'KEY_MUTE',
+            samples=1
+        )
+
+        self.assertEqual(['KEY_MUTE'], remote.keys)
+        self.assertFalse(report.results['127.0.0.10']['staged'])
+        self.assertEqual([], report.failed)
+
+    def test_003_APP_NEEDS_WEBSOCKET(self):
+        report = self.broadcast.broadcast_app(
+            self.remotes[:1],
+            '111299001912',
+            samples=1
+        )
+        self.assertEqual(['127.0.0.1'], report.failed)
+        self.assertIsNone(report.skew)
+
+
+class ReconnectTest(unittest.TestCase):
+
+    def setUp(self):
+        websocket_base = importlib.import_module('samsungctl.websocket_base')
+        self.reconnect = importlib.import_module('samsungctl.reconnect')
+        self.liveness = importlib.import_module('samsungctl.liveness')
+
+        # a port nothing listens on
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        self.port = sock.getsockname()[1]
+        sock.close()
+        self.server = None
+
+        class FakeWebSocket(object):
+
+            def __init__(self, sock):
+                self.sock = sock
+
+            def recv(self):
+                data = self.sock.recv(4096)
+                if not data:
+                    raise socket.error('connection closed')
+                return data.decode('utf-8')
+
+            def close(self):
+                # wakes the loop that is blocked in recv()
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+                self.sock.close()
+
+        class FakeTV(websocket_base.WebSocketBase):
+
+            def __init__(self, config):
+                self.down = False
+                self.attempts = 0
+                self.peer = None
+                websocket_base.WebSocketBase.__init__(self, config)
+
+            def open(self):
+                if self.sock is not None:
+                    return True
+
+                self.attempts += 1
+                if self.down:
+                    return False
+
+                sock, self.peer = socket.socketpair()
+                self.sock = FakeWebSocket(sock)
+                if not self._running:
+                    self._start_loop()
+                return True
+
+        self.config = samsungctl.Config(
+            host='127.0.0.1',
+            method='websocket',
+            port=self.port,
+            mac='00:11:22:33:44:55'
+        )
+        self.FakeTV = FakeTV
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.close()
+
+        self.reconnect.get_breaker('127.0.0.1').success()
+
+    def wait_for(self, check, timeout=3.0):
+        start = time.time()
+        while not check() and time.time() - start < timeout:
+            time.sleep(0.01)
+        return check()
+
+    def test_001_BACKOFF(self):
+        breaker = self.reconnect.CircuitBreaker('127.0.0.2')
+        breaker.max_interval = 8.0
+        woken = []
+        breaker.add_listener(lambda: woken.append(True))
+
+        delays = list(breaker.failure() for _ in range(6))
+        for i, delay in enumerate(delays):
+            expected = min(2 ** i, 8.0)
+            self.assertGreaterEqual(delay, expected * 0.75)
+            self.assertLessEqual(delay, expected * 1.25)
+
+        self.assertTrue(breaker.is_open)
+        self.assertGreater(breaker.delay, 0)
+
+        breaker.wake()
+        self.assertEqual([True], woken)
+        self.assertFalse(breaker.is_open)
+        self.assertEqual(0.0, breaker.delay)
+        # the backoff continues if the host is still down
+        self.assertGreaterEqual(breaker.failure(), 8.0 * 0.75)
+
+        breaker.success()
+        self.assertEqual(0, breaker.failures)
+        breaker.wake()
+        self.assertEqual([True], woken)
+
+    def test_002_WOKEN_BY_PRESENCE(self):
+        tv = self.FakeTV(self.config)
+        tv.breaker.base_interval = 0.05
+        tv.breaker.factor = 10.0
+        tv.open()
+        self.assertTrue(self.wait_for(lambda: tv._running))
+
+        tv.down = True
+        tv.peer.close()
+
+        # 0.05, 0.5 and then the circuit opens for about 5 seconds
+        self.assertTrue(self.wait_for(lambda: tv.breaker.failures == 3))
+        self.assertTrue(tv.breaker.is_open)
+        time.sleep(0.2)
+        self.assertEqual(4, tv.attempts)
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', self.port))
+        self.server.listen(4)
+        tv.down = False
+
+        start = time.time()
+        self.liveness.ssdp_notify('127.0.0.1', 'ssdp:alive', 60)
+        self.assertTrue(self.wait_for(lambda: tv.sock is not None))
+        self.assertLess(time.time() - start, 1.0)
+        self.assertEqual(0, tv.breaker.failures)
+
+        tv.close()
+        self.assertIsNone(tv._thread)
+
+    def test_003_HALF_OPEN_PROBE(self):
+        tv = self.FakeTV(self.config)
+        tv.breaker.failures = tv.breaker.failure_threshold
+        tv.down = True
+
+        # nothing listens on the port, open() is not tried
+        self.assertFalse(tv._attempt_open())
+        self.assertEqual(0, tv.attempts)
+        self.assertEqual(tv.breaker.failure_threshold + 1, tv.breaker.failures)
+
+    def test_004_FAIL_FAST(self):
+        remote_websocket = importlib.import_module(
+            'samsungctl.remote_websocket'
+        )
+        remote = remote_websocket.RemoteWebsocket.__new__(
+            remote_websocket.RemoteWebsocket
+        )
+        remote.sock = None
+        remote.config = self.config
+        remote.breaker = self.reconnect.get_breaker('127.0.0.1')
+        for _ in range(remote.breaker.failure_threshold):
+            remote.breaker.failure()
+
+        start = time.time()
+        self.assertFalse(remote.open())
+        self.assertLess(time.time() - start, 0.1)
+
+    def test_005_RELOCATE(self):
+        discover = importlib.import_module('samsungctl.upnp.discover')
+        searches = []
+
+        def relocate(config, timeout=5, log_level=None):
+            searches.append(config.udn)
+            config.host = '127.0.0.5'
+            return True
+
+        self.config.udn = 'uuid:smp_7_'
+        tv = self.FakeTV(self.config)
+        tv.breaker.failures = tv.breaker.failure_threshold
+
+        relocate_function = discover.relocate
+        discover.relocate = relocate
+        try:
+            # the TV does not answer at its address, it gets searched for
+            # by its UDN and opened at the new one
+            self.assertTrue(tv._attempt_open())
+        finally:
+            discover.relocate = relocate_function
+            tv.close()
+
+        self.assertEqual(['uuid:smp_7_'], searches)
+        self.assertEqual('127.0.0.5', tv.config.host)
+        self.assertIs(self.reconnect.get_breaker('127.0.0.5'), tv.breaker)
+        self.assertEqual(0, tv.breaker.failures)
+        self.assertIn(tv.liveness, self.liveness.get_trackers('127.0.0.5'))
+        self.assertNotIn(
+            tv.liveness,
+            self.liveness.get_trackers('127.0.0.1')
+        )
+
+        # without a UDN there is nothing to search for
+        self.config.udn = None
+        self.config.host = '127.0.0.1'
+        tv = self.FakeTV(self.config)
+        tv.breaker.failures = tv.breaker.failure_threshold
+        tv.down = True
+        self.assertFalse(tv._attempt_open())
+        self.assertEqual(0, tv.attempts)
+
+
+class KeepaliveTest(unittest.TestCase):
+
+    def setUp(self):
+        websocket_base = importlib.import_module('samsungctl.websocket_base')
+        self.reactor_module = importlib.import_module('samsungctl.reactor')
+        self.reconnect = importlib.import_module('samsungctl.reconnect')
+        self.liveness = importlib.import_module('samsungctl.liveness')
+        import websocket
+
+        class FakeWebSocket(object):
+
+            def __init__(self, sock, peer, answer):
+                self.sock = sock
+                self.peer = peer
+                self.answer = answer
+                self.pings = 0
+
+            def fileno(self):
+                return self.sock.fileno()
+
+            def settimeout(self, timeout):
+                self.sock.settimeout(timeout)
+
+            def recv_data(self, control_frame=False):
+                line = b''
+                while not line.endswith(b'\n'):
+                    char = self.sock.recv(1)
+                    if not char:
+                        raise socket.error('connection closed')
+                    line += char
+
+                line = line.strip()
+                if line == b'pong':
+                    return websocket.ABNF.OPCODE_PONG, b''
+                return websocket.ABNF.OPCODE_TEXT, line
+
+            def ping(self):
+                self.pings += 1
+                if self.answer:
+                    self.peer.sendall(b'pong\n')
+
+            def close(self):
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+                self.sock.close()
+
+        class FakeTV(websocket_base.WebSocketBase):
+            keepalive_interval = 0.05
+            power = property(websocket_base.WebSocketBase.power)
+
+            def __init__(self, config, answer):
+                self.answer = answer
+                self.down = False
+                self.messages = []
+                websocket_base.WebSocketBase.__init__(self, config)
+
+            def open(self):
+                if self.sock is not None:
+                    return True
+                if self.down:
+                    return False
+
+                sock, self.peer = socket.socketpair()
+                self.sock = FakeWebSocket(sock, self.peer, self.answer)
+                self.liveness.connection_opened()
+                if not self._running:
+                    self._start_loop()
+                return True
+
+            def on_message(self, message):
+                self.messages += [message]
+
+        self.FakeTV = FakeTV
+        self.config = samsungctl.Config(
+            host='127.0.0.1',
+            method='websocket',
+            port=None,
+            mac='00:11:22:33:44:55'
+        )
+
+    def tearDown(self):
+        self.reconnect.get_breaker('127.0.0.1').success()
+
+    def wait_for(self, check, timeout=3.0):
+        start = time.time()
+        while not check() and time.time() - start < timeout:
+            time.sleep(0.01)
+        return check()
+
+    def check_dead(self, tv):
+        tv.open()
+        sock = tv.sock
+        tv.down = True
+
+        try:
+            start = time.time()
+            self.assertTrue(self.wait_for(lambda: tv.sock is None))
+            self.assertLess(time.time() - start, 1.0)
+            self.assertEqual(tv.keepalive_misses, sock.pings)
+            self.assertFalse(tv.power)
+            self.assertFalse(tv.liveness._alive)
+        finally:
+            tv.close()
+
+    def check_alive(self, tv):
+        tv.open()
+        sock = tv.sock
+
+        try:
+            time.sleep(0.4)
+            tv.peer.sendall(b'message\n')
+            self.assertTrue(
+                self.wait_for(lambda: tv.messages == ['message'])
+            )
+            self.assertIs(sock, tv.sock)
+            self.assertGreater(sock.pings, 2)
+            self.assertTrue(tv.power)
+        finally:
+            tv.down = True
+            tv.close()
+
+    def test_001_DEAD_CONNECTION(self):
+        self.check_dead(self.FakeTV(self.config, answer=False))
+
+    def test_002_PONGS(self):
+        self.check_alive(self.FakeTV(self.config, answer=True))
+
+    def test_003_REACTOR(self):
+        reactor = self.reactor_module.Reactor(max_workers=2)
+        try:
+            with reactor.installed():
+                tv = self.FakeTV(self.config, answer=False)
+            self.check_dead(tv)
+
+            with reactor.installed():
+                tv = self.FakeTV(self.config, answer=True)
+            self.check_alive(tv)
+        finally:
+            reactor.stop()
+
+    def test_004_TCP_KEEPALIVE(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.liveness.set_keepalive(sock, 10, 2)
+            self.assertTrue(
+                sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+            )
+            if hasattr(socket, 'TCP_KEEPCNT'):
+                self.assertEqual(
+                    2,
+                    sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT)
+                )
+                self.assertEqual(
+                    10,
+                    sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL)
+                )
+        finally:
+            sock.close()
+
+
+class WriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.writer = importlib.import_module('samsungctl.writer')
+        self.written = []
+        self.gate = threading.Event()
+
+    def block(self, writer):
+        # a write that holds the queue until the gate opens
+        thread = threading.Thread(
+            target=writer.put,
+            args=(self.gate.wait, self.writer.PRIORITY_MESSAGE, False)
+        )
+        thread.start()
+        while not writer._writing:
+            time.sleep(0.01)
+        return thread
+
+    def put(self, writer, name, priority):
+        writer.put(
+            lambda: self.written.append(name),
+            priority,
+            wait=False
+        )
+
+    def test_001_PRIORITIES(self):
+        writer = self.writer.Writer()
+        thread = self.block(writer)
+
+        self.put(writer, 'move', self.writer.PRIORITY_BULK)
+        self.put(writer, 'message', self.writer.PRIORITY_MESSAGE)
+        self.put(writer, 'key', self.writer.PRIORITY_KEY)
+        self.put(writer, 'power', self.writer.PRIORITY_POWER)
+        self.put(writer, 'key2', self.writer.PRIORITY_KEY)
+
+        self.assertEqual(
+            {0: 1, 1: 2, 2: 1, 3: 1},
+            writer.stats()['depths']
+        )
+
+        self.gate.set()
+        thread.join(3.0)
+
+        self.assertEqual(
+            ['power', 'key', 'key2', 'message', 'move'],
+            self.written
+        )
+        stats = writer.stats()
+        self.assertEqual(0, stats['depth'])
+        self.assertEqual(5, stats['max_depth'])
+        self.assertEqual(6, stats['written'])
+
+    def test_002_RAISE(self):
+        writer = self.writer.Writer(2, self.writer.RAISE)
+        thread = self.block(writer)
+
+        self.put(writer, 'a', self.writer.PRIORITY_KEY)
+        self.put(writer, 'b', self.writer.PRIORITY_KEY)
+        self.assertRaises(
+            samsungctl.exceptions.WriteQueueFull,
+            self.put,
+            writer,
+            'c',
+            self.writer.PRIORITY_POWER
+        )
+
+        self.gate.set()
+        thread.join(3.0)
+        self.assertEqual(['a', 'b'], self.written)
+        self.assertEqual(1, writer.stats()['rejected'])
+
+    def test_003_DROP_OLDEST(self):
+        writer = self.writer.Writer(2, self.writer.DROP_OLDEST)
+        thread = self.block(writer)
+
+        self.put(writer, 'move1', self.writer.PRIORITY_BULK)
+        self.put(writer, 'move2', self.writer.PRIORITY_BULK)
+        self.put(writer, 'key', self.writer.PRIORITY_KEY)
+        self.put(writer, 'power', self.writer.PRIORITY_POWER)
+        # everything queued is more important
+        self.put(writer, 'move3', self.writer.PRIORITY_BULK)
+
+        self.gate.set()
+        thread.join(3.0)
+        self.assertEqual(['power', 'key'], self.written)
+        self.assertEqual(3, writer.stats()['dropped'])
+
+    def test_004_BLOCK(self):
+        writer = self.writer.Writer(1, self.writer.BLOCK, timeout=0.1)
+        thread = self.block(writer)
+
+        self.put(writer, 'a', self.writer.PRIORITY_KEY)
+
+        start = time.time()
+        self.assertRaises(
+            samsungctl.exceptions.WriteQueueFull,
+            self.put,
+            writer,
+            'b',
+            self.writer.PRIORITY_KEY
+        )
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+        # room gets made while the write is waiting
+        writer.timeout = 3.0
+        threading.Timer(0.1, self.gate.set).start()
+        self.put(writer, 'c', self.writer.PRIORITY_KEY)
+
+        thread.join(3.0)
+        self.assertEqual(['a', 'c'], self.written)
+
+    def test_005_ERRORS(self):
+        writer = self.writer.Writer()
+
+        def write():
+            raise socket.error('broken pipe')
+
+        self.assertRaises(socket.error, writer.put, write)
+        # the queue is still usable
+        writer.put(lambda: self.written.append('a'))
+        self.assertEqual(['a'], self.written)
+
+        err = samsungctl.exceptions.ConnectionClosed()
+        self.assertEqual('Connection was closed.', str(err))
+
+
+class ContentionTest(unittest.TestCase):
+    """Latency of a key while slow requests run on the same remote."""
+
+    def setUp(self):
+        remote_websocket = importlib.import_module(
+            'samsungctl.remote_websocket'
+        )
+
+        class FakeSocket(object):
+
+            def __init__(self, remote):
+                self.remote = remote
+                self.keys = []
+
+            def send(self, payload):
+                payload = json.loads(payload)
+                params = payload['params']
+
+                if 'DataOfCmd' in params:
+                    self.keys += [params['DataOfCmd']]
+
+                event = params.get('event', None)
+                if event in ('ed.edenApp.get', 'ed.installedApp.get'):
+                    # a slow catalog
+                    message = json.dumps(
+                        dict(event=event, data=dict(data=[]))
+                    )
+                    threading.Timer(
+                        1.0,
+                        self.remote.on_message,
+                        (message,)
+                    ).start()
+
+        # nothing listens on port 8001 of this address, the remote does
+        # not get opened
+        self.remote = remote_websocket.RemoteWebsocket(
+            samsungctl.Config(
+                host='127.0.0.3',
+                method='websocket',
+                port=8001,
+                mac='00:11:22:33:44:55'
+            )
+        )
+        self.remote.sock = FakeSocket(self.remote)
+        # no pause after every write
+        self.remote.send_event.set()
+
+    def tearDown(self):
+        self.remote.sock = None
+
+    def key_latency(self, count=5):
+        latencies = []
+        for _ in range(count):
+            start = time.time()
+            self.remote.control('KEY_VOLUP')
+            latencies += [time.time() - start]
+            time.sleep(0.05)
+        return max(latencies)
+
+    def test_001_KEY_LATENCY(self):
+        idle = self.key_latency()
+
+        threads = [
+            threading.Thread(target=lambda: self.remote.applications),
+            threading.Thread(target=self.remote.start_voice_recognition),
+        ]
+
+        def hold_connection():
+            with self.remote._connection_lock:
+                time.sleep(1.0)
+
+        threads += [threading.Thread(target=hold_connection)]
+
+        for thread in threads:
+            thread.start()
+
+        time.sleep(0.1)
+        busy = self.key_latency()
+
+        for thread in threads:
+            thread.join(5.0)
+
+        self.assertEqual(
+            10,
+            self.remote.sock.keys.count('KEY_VOLUP')
+        )
+        logger.info(
+            'key latency idle {0:.2f} ms, busy {1:.2f} ms'.format(
+                idle * 1000,
+                busy * 1000
+            )
+        )
+        self.assertLess(busy, idle + 0.1)
+
+
+class SubmitTest(unittest.TestCase):
+
+    def setUp(self):
+        executor = importlib.import_module('samsungctl.executor')
+        calls = self.calls = []
+
+        class FakeRemote(executor.Submit):
+
+            def __init__(self, name, delay=0.1):
+                self.name = name
+                self.delay = delay
+                self._volume = 0
+
+            def control(self, key):
+                time.sleep(self.delay)
+                calls.append((self.name, key))
+                return key
+
+            @property
+            def volume(self):
+                return self._volume
+
+            @volume.setter
+            def volume(self, value):
+                time.sleep(self.delay)
+                self._volume = value
+
+        self.FakeRemote = FakeRemote
+
+    def test_001_ORDER_AND_PARALLEL(self):
+        remotes = list(self.FakeRemote(name) for name in ('tv1', 'tv2'))
+        keys = list('KEY_{0}'.format(i) for i in range(5))
+
+        start = time.time()
+        results = []
+        for key in keys:
+            for remote in remotes:
+                results += [remote.submit_control(key)]
+
+        self.assertLess(time.time() - start, 0.05)
+
+        for future in results:
+            future.result(5.0)
+
+        # the TVs ran at the same time
+        self.assertLess(time.time() - start, 0.9)
+
+        for remote in remotes:
+            self.assertEqual(
+                keys,
+                list(key for name, key in self.calls if name == remote.name)
+            )
+
+    def test_002_TIMEOUT(self):
+        from concurrent import futures
+
+        remote = self.FakeRemote('tv1', delay=0.3)
+        first = remote.submit_control('KEY_1')
+        late = remote.submit_control('KEY_2', timeout=0.05)
+        last = remote.submit_control('KEY_3')
+
+        self.assertEqual('KEY_1', first.result(5.0))
+        self.assertRaises(futures.TimeoutError, late.result, 5.0)
+        self.assertEqual('KEY_3', last.result(5.0))
+        self.assertEqual(
+            [('tv1', 'KEY_1'), ('tv1', 'KEY_3')],
+            self.calls
+        )
+
+    def test_003_CANCEL(self):
+        remote = self.FakeRemote('tv1', delay=0.2)
+        first = remote.submit_control('KEY_1')
+        second = remote.submit_control('KEY_2')
+
+        self.assertTrue(second.cancel())
+        first.result(5.0)
+        self.assertEqual(0, remote.executor.pending)
+        self.assertEqual([('tv1', 'KEY_1')], self.calls)
+
+    def test_004_SET_AND_CALL(self):
+        remote = self.FakeRemote('tv1', delay=0.05)
+
+        remote.submit_set('volume', 20)
+        # runs after the set
+        future = remote.submit_call(getattr, (remote, 'volume'))
+        self.assertEqual(20, future.result(5.0))
+        self.assertRaises(AttributeError, remote.submit_set, 'bogus', 1)
+
+        future = remote.submit_call('control', ('KEY_MENU',))
+        self.assertEqual('KEY_MENU', future.result(5.0))
+
+        def fail():
+            raise RuntimeError('failed')
+
+        self.assertRaises(
+            RuntimeError,
+            remote.submit_call(fail).result,
+            5.0
+        )
+
+
+class KeySequenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.keyseq = importlib.import_module('samsungctl.keyseq')
+
+        class FakeChannel(object):
+
+            def __init__(self, major, minor, activated):
+                self._channel_num = (major, minor)
+                self._activated = activated
+
+            def activate(self):
+                self._activated.append(self._channel_num)
+
+        class FakeRemote(object):
+
+            def __init__(self, services=(), connected=True, volume=10):
+                for service in services:
+                    setattr(self, service, object())
+
+                self.connected = connected
+                self.keys = []
+                self.activated = []
+                self._volume = volume
+                self.volumes = []
+                self.channels = [
+                    FakeChannel('7', '0', self.activated),
+                    FakeChannel('105', '0', self.activated),
+                    FakeChannel('105', '2', self.activated)
+                ]
+
+            def control(self, key):
+                self.keys += [key]
+
+            @property
+            def volume(self):
+                return self._volume
+
+            @volume.setter
+            def volume(self, value):
+                self.volumes += [value]
+                self._volume = value
+
+        self.FakeRemote = FakeRemote
+
+    def test_001_OPTIMIZE(self):
+        steps = self.keyseq.optimize(
+            ['KEY_MENU'] + ['KEY_VOLUP'] * 5 + ['KEY_VOLDOWN'] +
+            ['KEY_1', 'KEY_0', 'KEY_5', 'KEY_ENTER'] +
+            ['KEY_VOLUP', 'KEY_2', 'KEY_EXIT']
+        )
+
+        self.assertEqual(
+            list((step.kind, step.value) for step in steps),
+            [
+                ('keys', None),
+                ('volume', 4),
+                ('channel', '105'),
+                ('keys', None)
+            ]
+        )
+        self.assertEqual(steps[0].keys, ['KEY_MENU'])
+        self.assertEqual(steps[-1].keys, ['KEY_VOLUP', 'KEY_2', 'KEY_EXIT'])
+
+    def test_002_VOLUME(self):
+        remote = self.FakeRemote(('RenderingControl',), volume=[98])
+        replaced = self.keyseq.send_keys(remote, ['KEY_VOLUP'] * 20)
+
+        self.assertEqual(replaced, 20)
+        self.assertEqual(remote.volumes, [100])
+        self.assertEqual(remote.keys, [])
+
+        remote = self.FakeRemote(('MainTVAgent2',), volume=3)
+        self.keyseq.send_keys(remote, ['KEY_VOLDOWN'] * 5)
+        self.assertEqual(remote.volumes, [0])
+
+    def test_003_CHANNEL(self):
+        remote = self.FakeRemote(('MainTVAgent2',))
+        replaced = self.keyseq.send_keys(
+            remote,
+            ['KEY_1', 'KEY_0', 'KEY_5', 'KEY_ENTER', 'KEY_0', 'KEY_7',
+             'KEY_ENTER']
+        )
+
+        self.assertEqual(replaced, 7)
+        self.assertEqual(remote.activated, [('105', '0'), ('7', '0')])
+        self.assertEqual(remote.keys, [])
+
+    def test_004_FALLBACK(self):
+        keys = ['KEY_VOLUP'] * 3 + ['KEY_4', 'KEY_2', 'KEY_ENTER']
+
+        # no service, UPnP not connected, a volume that can not be read
+        # and a channel that is not in the list
+        remotes = [
+            self.FakeRemote(),
+            self.FakeRemote(('MainTVAgent2',), connected=False),
+            self.FakeRemote(('MainTVAgent2',), volume='error')
+        ]
+
+        for remote in remotes:
+            self.assertEqual(self.keyseq.send_keys(remote, keys), 0)
+            self.assertEqual(remote.keys, keys)
+            self.assertEqual(remote.volumes, [])
+            self.assertEqual(remote.activated, [])
+
+    def test_005_BATCH(self):
+        batch = importlib.import_module('samsungctl.batch')
+        exceptions = importlib.import_module('samsungctl.exceptions')
+        remote = self.FakeRemote(('MainTVAgent2',))
+
+        result = batch.Batch(remote).execute('keys volup volup KEY_MENU')
+        self.assertEqual(result, '2 keys replaced')
+        self.assertEqual(remote.volumes, [12])
+        self.assertEqual(remote.keys, ['KEY_MENU'])
+
+        self.assertRaises(
+            exceptions.BatchCommandError,
+            batch.Batch(remote).execute,
+            'keys KEY_NOT_A_KEY'
+        )
+
+    def test_006_CLI(self):
+        main = importlib.import_module('samsungctl.__main__')
+        calls = []
+
+        class RenderingControl(object):
+
+            @staticmethod
+            def SetVolume(instance_id, channel, volume):
+                calls.append(('SetVolume', volume))
+
+        class FakeRemote(object):
+            connected = True
+
+            def __init__(self, config):
+                # the UPnP services only get mixed in with upnp_locations
+                if config.upnp_locations is not None:
+                    self.RenderingControl = RenderingControl()
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, exc_type, exc_val, exc_tb):
+                pass
+
+            def control(self, key):
+                calls.append(('control', key))
+
+            @property
+            def volume(self):
+                return 10
+
+            @volume.setter
+            def volume(self, value):
+                self.RenderingControl.SetVolume(0, 'Master', value)
+
+        argv = sys.argv[:]
+        remote = main.Remote
+        read_config = main._read_config
+
+        def _read_config():
+            config = read_config()
+            config['upnp_locations'] = None
+            return config
+
+        sys.argv[:] = [
+            'samsungctl',
+            '--host', '127.0.0.1',
+            '--optimize-keys',
+            'KEY_VOLUP', 'KEY_VOLUP', 'KEY_VOLUP'
+        ]
+        main.Remote = FakeRemote
+        main._read_config = _read_config
+
+        try:
+            main.main()
+        finally:
+            sys.argv[:] = argv
+            main.Remote = remote
+            main._read_config = read_config
+
+        self.assertEqual(calls, [('SetVolume', 13)])
+
+
 if __name__ == '__main__':
     base_path = os.path.dirname(__file__)
 